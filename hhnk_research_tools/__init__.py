@@ -1,79 +1,189 @@
 # hhnk_research_tools/__init__.py
+# Functions and classes are loaded on first access (PEP 562 __getattr__), so
+# `import hhnk_research_tools as hrt` does not import gdal, geopandas etc. until
+# they are needed. New public names should be added to _LAZY_MODULES and to the
+# TYPE_CHECKING imports (for type hints and autocomplete).
+
+import importlib
 from typing import TYPE_CHECKING
 
-from hhnk_research_tools.gis.raster import Raster, RasterMetadata  # noqa: F401
+import hhnk_research_tools.logger as logging
 
-if TYPE_CHECKING:
-    # TODO zou moeten werken met typehints van imports. Maar vraag is maar of het werkt.
-    import hhnk_research_tools as hrt
+# {module: [names]} of the public functions and classes.
+_LAZY_MODULES = {
+    "hhnk_research_tools.gis.raster": ["Raster", "RasterMetadata"],
+    "hhnk_research_tools.dataframe_functions": [
+        "df_add_geometry_to_gdf",
+        "df_convert_to_gdf",
+        "gdf_write_to_csv",
+        "gdf_write_to_geopackage",
+        "gdf_write_to_geopackage_concurrent",
+    ],
+    "hhnk_research_tools.folder_file_classes.database_cache": ["DatabaseCache"],
+    "hhnk_research_tools.folder_file_classes.folder_file_classes": ["File", "FileGDB", "FileGDBLayer", "Folder"],
+    "hhnk_research_tools.folder_file_classes.sqlite_class": ["Sqlite"],
+    "hhnk_research_tools.folder_file_classes.threedi_schematisation": [
+        "RevisionsDir",
+        "ThreediResult",
+        "ThreediSchematisation",
+    ],
+    "hhnk_research_tools.general_functions": [
+        "check_create_new_file",
+        "convert_gdb_to_gpkg",
+        "current_time",
+        "dict_to_class",
+        "ensure_file_path",
+        "get_functions",
+        "get_pkg_resource_path",
+        "get_uuid",
+        "get_variables",
+        "load_source",
+        "time_delta",
+    ],
+    "hhnk_research_tools.gis.instrumentation": ["RasterInstrumentation"],
+    "hhnk_research_tools.gis.raster_calculator": ["RasterBlocks", "RasterCalculatorV2"],
+    "hhnk_research_tools.gis.tile_index": ["TileIndex"],
+    "hhnk_research_tools.raster_functions": [
+        "RasterCalculator",
+        "build_vrt",
+        "create_meta_from_gdf",
+        "create_new_raster_file",
+        "dx_dy_between_rasters",
+        "gdf_to_raster",
+        "hist_stats",
+        "load_gdal_raster",
+        "reproject",
+        "save_raster_array_to_tiff",
+    ],
+    "hhnk_research_tools.sql_functions": [
+        "create_sqlite_connection",
+        "database_to_gdf",
+        "database_to_gdf_tiled",
+        "execute_sql_changes",
+        "execute_sql_selection",
+        "sql_builder_select_by_location",
+        "sql_builder_select_by_location_tiled",
+        "sql_construct_select_query",
+        "sql_create_update_case_statement",
+        "sql_table_exists",
+        "sqlite_bulk_update",
+        "sqlite_replace_or_add_table",
+        "sqlite_table_to_df",
+        "sqlite_table_to_gdf",
+    ],
+    "hhnk_research_tools.threedi.call_api": ["call_threedi_api"],
+    "hhnk_research_tools.threedi.read_api_file": ["read_api_file"],
+    "hhnk_research_tools.waterschadeschatter.wss_main": ["Waterschadeschatter"],
+}
+_LAZY_ATTRS = {name: module for module, names in _LAZY_MODULES.items() for name in names}
 
-import hhnk_research_tools.logger as logging
-import hhnk_research_tools.threedi as threedi
-import hhnk_research_tools.variables as variables
-import hhnk_research_tools.waterschadeschatter.resources
-from hhnk_research_tools.dataframe_functions import (
-    df_add_geometry_to_gdf,
-    df_convert_to_gdf,
-    gdf_write_to_csv,
-    gdf_write_to_geopackage,
-)
-from hhnk_research_tools.folder_file_classes.file_class import File
-from hhnk_research_tools.folder_file_classes.folder_file_classes import (
-    File,
-    FileGDB,
-    FileGDBLayer,
-    Folder,
-)
-from hhnk_research_tools.folder_file_classes.sqlite_class import (
-    Sqlite,
-)
-from hhnk_research_tools.folder_file_classes.threedi_schematisation import (
-    RevisionsDir,
-    ThreediResult,
-    ThreediSchematisation,
-)
-from hhnk_research_tools.general_functions import (
-    check_create_new_file,
-    convert_gdb_to_gpkg,
-    current_time,
-    dict_to_class,
-    ensure_file_path,
-    get_functions,
-    get_pkg_resource_path,
-    get_uuid,
-    get_variables,
-    load_source,
-    time_delta,
-)
-from hhnk_research_tools.gis.raster_calculator import RasterBlocks, RasterCalculatorV2
-from hhnk_research_tools.raster_functions import (
-    RasterCalculator,
-    build_vrt,
-    create_meta_from_gdf,
-    create_new_raster_file,
-    dx_dy_between_rasters,
-    gdf_to_raster,
-    hist_stats,
-    load_gdal_raster,
-    reproject,
-    save_raster_array_to_tiff,
-)
-from hhnk_research_tools.sql_functions import (
-    create_sqlite_connection,
-    database_to_gdf,
-    execute_sql_changes,
-    execute_sql_selection,
-    sql_builder_select_by_location,
-    sql_construct_select_query,
-    sql_create_update_case_statement,
-    sql_table_exists,
-    sqlite_replace_or_add_table,
-    sqlite_table_to_df,
-    sqlite_table_to_gdf,
-)
-from hhnk_research_tools.threedi.call_api import call_threedi_api
-from hhnk_research_tools.threedi.read_api_file import read_api_file
-from hhnk_research_tools.waterschadeschatter.wss_main import Waterschadeschatter
+# {submodule: module to import}. Packages import the module that loads all their
+# modules, waterschadeschatter also needs .resources for get_pkg_resource_path.
+_LAZY_SUBMODULES = {
+    "dataframe_functions": "hhnk_research_tools.dataframe_functions",
+    "folder_file_classes": "hhnk_research_tools.folder_file_classes.threedi_schematisation",
+    "general_functions": "hhnk_research_tools.general_functions",
+    "gis": "hhnk_research_tools.gis.raster_calculator",
+    "processes": "hhnk_research_tools.processes",
+    "raster_functions": "hhnk_research_tools.raster_functions",
+    "sql_functions": "hhnk_research_tools.sql_functions",
+    "threedi": "hhnk_research_tools.threedi",
+    "variables": "hhnk_research_tools.variables",
+    "waterschadeschatter": "hhnk_research_tools.waterschadeschatter.resources",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_ATTRS:
+        value = getattr(importlib.import_module(_LAZY_ATTRS[name]), name)
+    elif name in _LAZY_SUBMODULES:
+        importlib.import_module(_LAZY_SUBMODULES[name])
+        value = importlib.import_module(f"{__name__}.{name}")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value  # Next access does not go through __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_ATTRS) | set(_LAZY_SUBMODULES))
+
+
+if TYPE_CHECKING:
+    import hhnk_research_tools.threedi as threedi
+    import hhnk_research_tools.variables as variables
+    import hhnk_research_tools.waterschadeschatter as waterschadeschatter
+    from hhnk_research_tools.dataframe_functions import (
+        df_add_geometry_to_gdf,
+        df_convert_to_gdf,
+        gdf_write_to_csv,
+        gdf_write_to_geopackage,
+        gdf_write_to_geopackage_concurrent,
+    )
+    from hhnk_research_tools.folder_file_classes.database_cache import DatabaseCache
+    from hhnk_research_tools.folder_file_classes.folder_file_classes import (
+        File,
+        FileGDB,
+        FileGDBLayer,
+        Folder,
+    )
+    from hhnk_research_tools.folder_file_classes.sqlite_class import (
+        Sqlite,
+    )
+    from hhnk_research_tools.folder_file_classes.threedi_schematisation import (
+        RevisionsDir,
+        ThreediResult,
+        ThreediSchematisation,
+    )
+    from hhnk_research_tools.general_functions import (
+        check_create_new_file,
+        convert_gdb_to_gpkg,
+        current_time,
+        dict_to_class,
+        ensure_file_path,
+        get_functions,
+        get_pkg_resource_path,
+        get_uuid,
+        get_variables,
+        load_source,
+        time_delta,
+    )
+    from hhnk_research_tools.gis.instrumentation import RasterInstrumentation
+    from hhnk_research_tools.gis.raster import Raster, RasterMetadata
+    from hhnk_research_tools.gis.raster_calculator import RasterBlocks, RasterCalculatorV2
+    from hhnk_research_tools.gis.tile_index import TileIndex
+    from hhnk_research_tools.raster_functions import (
+        RasterCalculator,
+        build_vrt,
+        create_meta_from_gdf,
+        create_new_raster_file,
+        dx_dy_between_rasters,
+        gdf_to_raster,
+        hist_stats,
+        load_gdal_raster,
+        reproject,
+        save_raster_array_to_tiff,
+    )
+    from hhnk_research_tools.sql_functions import (
+        create_sqlite_connection,
+        database_to_gdf,
+        database_to_gdf_tiled,
+        execute_sql_changes,
+        execute_sql_selection,
+        sql_builder_select_by_location,
+        sql_builder_select_by_location_tiled,
+        sql_construct_select_query,
+        sql_create_update_case_statement,
+        sql_table_exists,
+        sqlite_bulk_update,
+        sqlite_replace_or_add_table,
+        sqlite_table_to_df,
+        sqlite_table_to_gdf,
+    )
+    from hhnk_research_tools.threedi.call_api import call_threedi_api
+    from hhnk_research_tools.threedi.read_api_file import read_api_file
+    from hhnk_research_tools.waterschadeschatter.wss_main import Waterschadeschatter
 
 # Set default logging to console
 logging.set_default_logconfig(
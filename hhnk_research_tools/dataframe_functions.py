@@ -1,5 +1,7 @@
 # %%
 import os
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
 
 import geopandas as gpd
 from shapely import wkb, wkt
@@ -100,8 +102,34 @@ def df_add_geometry_to_gdf(df, geometry_col, crs=DEF_TRGT_CRS) -> gpd.GeoDataFra
 
 
 # Saving
+def _gpkg_create_spatial_index(filepath, layer):
+    """Create the rtree spatial index of a gpkg layer after all features are written."""
+    from osgeo import ogr
+
+    ds = ogr.Open(str(filepath), update=1)
+    try:
+        ogr_layer = ds.GetLayerByName(layer)
+        geom_col = ogr_layer.GetGeometryColumn()
+        if geom_col:
+            ds.ExecuteSQL(f"SELECT CreateSpatialIndex('{layer}', '{geom_col}')")
+    finally:
+        ds = None
+
+
+def _arrow_write_supported() -> bool:
+    """Check if writing through the Arrow stream is possible, needs pyarrow and GDAL>=3.8."""
+    try:
+        import pyarrow  # noqa: F401
+        import pyogrio
+    except ImportError:
+        return False
+    return pyogrio.__gdal_version__ >= (3, 8, 0)
+
+
 # TODO is dit nodig? Staat vooral nog in banklevels
-def gdf_write_to_geopackage(gdf, path=None, filename=None, filepath=None, driver=GPKG_DRIVER, index=False):
+def gdf_write_to_geopackage(
+    gdf, path=None, filename=None, filepath=None, driver=GPKG_DRIVER, index=False, fast=False, use_arrow=None
+):
     """
     Functions outputs DataFrame of GeoDataFrame to .gpkg document
 
@@ -111,6 +139,10 @@ def gdf_write_to_geopackage(gdf, path=None, filename=None, filepath=None, driver
             filename (string, name of file to be created, without extension (.csv)
             driver -> 'GPKG' (driver to be used by .to_file function of gdf)
             index -> False (given as index parameter to .to_file function of gdf (Write row names or not)
+            fast -> False (write with pyogrio in one transaction per layer, the spatial index
+                is created after all features are written)
+            use_arrow -> None (only used when fast=True, write through the Arrow stream. Requires
+                pyarrow and GDAL>=3.8, None uses it when these are available)
 
     Return value: file path (path + filename + extension) if gdf is not empty, else None
     """
@@ -123,7 +155,23 @@ def gdf_write_to_geopackage(gdf, path=None, filename=None, filepath=None, driver
             os.remove(filepath)
         if not gdf.empty:
             ensure_file_path(filepath)
-            if filename is None:
+            if fast:
+                layer = filename if filename is not None else Path(filepath).stem
+                if use_arrow is None:
+                    use_arrow = _arrow_write_supported()
+                # pyogrio writes each layer in a single transaction. Building the
+                # spatial index per inserted feature is skipped and done once at the end.
+                gdf.to_file(
+                    filepath,
+                    layer=layer,
+                    driver=driver,
+                    index=index,
+                    engine="pyogrio",
+                    use_arrow=use_arrow,
+                    layer_options={"SPATIAL_INDEX": "NO"},
+                )
+                _gpkg_create_spatial_index(filepath, layer)
+            elif filename is None:
                 gdf.to_file(filepath, driver=driver, index=index)
             else:
                 gdf.to_file(filepath, layer=filename, driver=driver, index=index)
@@ -134,8 +182,32 @@ def gdf_write_to_geopackage(gdf, path=None, filename=None, filepath=None, driver
         raise e from None
 
 
+def gdf_write_to_geopackage_concurrent(gdf_dict: dict, path, max_workers=4, fast=True, **kwargs) -> list:
+    """
+    Write multiple (Geo)DataFrames concurrently, each to its own .gpkg. Writing
+    to the same file from multiple threads is not possible with gpkg.
+
+        gdf_write_to_geopackage_concurrent(
+            gdf_dict (dict, {filename: gdf}. Filename without extension, is also used as layer name)
+            path (string, folder to create the files in)
+            max_workers -> 4 (number of files written at the same time)
+            fast -> True (see gdf_write_to_geopackage)
+            kwargs (passed to gdf_write_to_geopackage)
+
+    Return value: list with file paths, None for empty gdfs.
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(gdf_write_to_geopackage, gdf, path=path, filename=filename, fast=fast, **kwargs)
+            for filename, gdf in gdf_dict.items()
+        ]
+        return [future.result() for future in futures]
+
+
 # TODO is dit nog nodig? staat alleen in banklevels
-def gdf_write_to_csv(gdf, path=None, filename=None, filepath=None, mode="w", cols=None, index=False):
+def gdf_write_to_csv(
+    gdf, path=None, filename=None, filepath=None, mode="w", cols=None, index=False, chunksize=100_000
+):
     """
     Functions outputs DataFrame of GeoDataFrame to .csv document
 
@@ -146,6 +218,8 @@ def gdf_write_to_csv(gdf, path=None, filename=None, filepath=None, mode="w", col
             mode -> 'w' (optional specification of write mode)
             cols -> None (specify columns to write to output)
             index -> False (given as index parameter to .to_csv function of gdf (Write row names or not)
+            chunksize -> 100_000 (number of rows converted and written at once, limits memory
+                use for large (geo)dataframes. None writes all rows at once)
 
     Return value: file path (path + filename + extension) if gdf is not empty, else None
     """
@@ -159,14 +233,21 @@ def gdf_write_to_csv(gdf, path=None, filename=None, filepath=None, mode="w", col
             os.remove(filepath)
         if not gdf.empty:
             ensure_file_path(filepath)
-            gdf.to_csv(
-                filepath,
-                sep=DEF_DELIMITER,
-                encoding=DEF_ENCODING,
-                columns=cols,
-                mode=mode,
-                index=index,
-            )
+            if chunksize is None:
+                chunksize = len(gdf)
+
+            for start in range(0, len(gdf), chunksize):
+                # Only the first chunk uses the given mode and writes the header.
+                first_chunk = start == 0
+                gdf.iloc[start : start + chunksize].to_csv(
+                    filepath,
+                    sep=DEF_DELIMITER,
+                    encoding=DEF_ENCODING,
+                    columns=cols,
+                    mode=mode if first_chunk else "a",
+                    header=first_chunk,
+                    index=index,
+                )
             return filepath
         else:
             return None
@@ -0,0 +1,186 @@
+# %%
+import hashlib
+import json
+import re
+import time
+
+import geopandas as gpd
+import pandas as pd
+
+import hhnk_research_tools.logger as logging
+from hhnk_research_tools.folder_file_classes.folder_file_classes import Folder
+
+logger = logging.get_logger(name=__name__)
+
+CACHE_FORMATS = {"parquet": ".parquet", "gpkg": ".gpkg"}
+
+
+def _normalize_sql(sql: str) -> str:
+    """Remove layout differences from sql so equal queries get the same key.
+    Whitespace inside string literals is kept.
+    """
+    parts = re.split(r"('(?:[^']|'')*')", sql.strip().rstrip(";"))
+    # Even parts are outside quotes, odd parts are the literals.
+    return "".join(re.sub(r"\s+", " ", p) if i % 2 == 0 else p for i, p in enumerate(parts))
+
+
+class DatabaseCache(Folder):
+    """Local cache of database_to_gdf results. Entries are content-addressed on the
+    normalized sql, the database service and the requested columns. Each entry is
+    stored as GeoParquet (or gpkg) with a .json sidecar containing the used sql and
+    timestamps.
+
+    Usage:
+        cache = hrt.DatabaseCache(r"C:/temp/database_cache")
+        gdf, sql = hrt.database_to_gdf(db_dict=db_dict, sql=sql, cache=cache)
+
+    Parameters
+    ----------
+    base : str
+        Folder to store the cache in, is created if it does not exist.
+    ttl : float
+        Time to live of an entry in seconds. Older entries are a cache miss.
+        None to never expire.
+    max_size_mb : float
+        Maximum size of the cache. The least recently used entries are evicted
+        when the cache grows beyond this size. None for no limit.
+    file_format : str
+        'parquet' (default, requires pyarrow) or 'gpkg'.
+    """
+
+    def __init__(self, base, ttl: float = 24 * 3600, max_size_mb: float = 2048, file_format: str = "parquet"):
+        super().__init__(base)
+        self.mkdir(parents=True)
+
+        if file_format not in CACHE_FORMATS:
+            raise ValueError(f"file_format should be one of {list(CACHE_FORMATS)}, got {file_format}")
+
+        self.ttl = ttl
+        self.max_size_mb = max_size_mb
+        self.file_format = file_format
+
+    def key(self, db_dict: dict, sql: str, columns: list = None, **kwargs) -> str:
+        """Create the cache key. kwargs are other options that change the result,
+        e.g. lower_cols or crs.
+        """
+        service = db_dict.get("service_name", db_dict.get("dsn"))
+        key_dict = {
+            "sql": _normalize_sql(sql),
+            "service": service,
+            "host": db_dict.get("host"),
+            "columns": columns,
+            **kwargs,
+        }
+        return hashlib.sha256(json.dumps(key_dict, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _meta_path(self, key):
+        return self.path / f"{key}.json"
+
+    def _data_path(self, key, file_format):
+        return self.path / f"{key}{CACHE_FORMATS[file_format]}"
+
+    def get(self, key: str):
+        """Return (df, sql) if the key is cached and not expired, otherwise None."""
+        meta_path = self._meta_path(key)
+        if not meta_path.exists():
+            return None
+
+        meta = json.loads(meta_path.read_text())
+        data_path = self._data_path(key, meta["file_format"])
+        if not data_path.exists():
+            return None
+        if self.ttl is not None and (time.time() - meta["created"]) > self.ttl:
+            logger.debug(f"Cache entry {key} expired")
+            return None
+
+        if meta["file_format"] == "parquet":
+            if meta["geo"]:
+                df = gpd.read_parquet(data_path)
+            else:
+                df = pd.read_parquet(data_path)
+        else:
+            df = gpd.read_file(data_path, engine="pyogrio")
+
+        # Keep track of usage for eviction
+        meta["last_access"] = time.time()
+        meta_path.write_text(json.dumps(meta))
+        logger.debug(f"Cache hit {key}")
+        return df, meta["sql"]
+
+    def put(self, key: str, df: pd.DataFrame, sql: str):
+        """Store df in the cache. Failures to write are logged and ignored,
+        the cache should never break the database request.
+        """
+        file_format = self.file_format
+        geo = isinstance(df, gpd.GeoDataFrame) and "geometry" in df.columns
+        if file_format == "gpkg" and not geo:
+            # gpkg can only store geometry tables here.
+            file_format = "parquet"
+
+        data_path = self._data_path(key, file_format)
+        try:
+            if file_format == "parquet":
+                df.to_parquet(data_path, index=False)
+            else:
+                data_path.unlink(missing_ok=True)
+                df.to_file(data_path, engine="pyogrio")
+        except Exception as e:
+            logger.warning(f"Could not write cache entry {key}: {e}")
+            data_path.unlink(missing_ok=True)
+            return
+
+        now = time.time()
+        meta = {"sql": sql, "created": now, "last_access": now, "file_format": file_format, "geo": geo}
+        self._meta_path(key).write_text(json.dumps(meta))
+
+        self.evict()
+
+    def entries(self) -> pd.DataFrame:
+        """Overview of the cache entries with their size and timestamps."""
+        records = []
+        for meta_path in self.path.glob("*.json"):
+            meta = json.loads(meta_path.read_text())
+            data_path = self._data_path(meta_path.stem, meta["file_format"])
+            size = data_path.stat().st_size if data_path.exists() else 0
+            records.append(
+                {
+                    "key": meta_path.stem,
+                    "size_mb": size / 1024**2,
+                    "created": meta["created"],
+                    "last_access": meta["last_access"],
+                    "file_format": meta["file_format"],
+                }
+            )
+        return pd.DataFrame(records, columns=["key", "size_mb", "created", "last_access", "file_format"])
+
+    def remove(self, key: str):
+        """Remove an entry from the cache."""
+        for file_format in CACHE_FORMATS:
+            self._data_path(key, file_format).unlink(missing_ok=True)
+        self._meta_path(key).unlink(missing_ok=True)
+
+    def evict(self):
+        """Remove expired entries and the least recently used entries until
+        the cache is smaller than max_size_mb.
+        """
+        entries = self.entries()
+        if entries.empty:
+            return
+
+        if self.ttl is not None:
+            expired = entries["created"] < (time.time() - self.ttl)
+            for key in entries.loc[expired, "key"]:
+                self.remove(key)
+            entries = entries[~expired]
+
+        if self.max_size_mb is not None:
+            entries = entries.sort_values("last_access", ascending=False)
+            over_size = entries["size_mb"].cumsum() > self.max_size_mb
+            for key in entries.loc[over_size, "key"]:
+                logger.debug(f"Evicting cache entry {key}")
+                self.remove(key)
+
+    def clear(self):
+        """Remove all entries."""
+        for key in self.entries()["key"]:
+            self.remove(key)
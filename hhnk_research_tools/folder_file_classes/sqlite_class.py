@@ -1,11 +1,13 @@
 # %%
 import os
 import sqlite3
+import time
 
 import pandas as pd
 
 import hhnk_research_tools as hrt
 from hhnk_research_tools.folder_file_classes.file_class import File
+from hhnk_research_tools.logger import metrics
 from hhnk_research_tools.variables import MOD_SPATIALITE_PATH
 
 
@@ -58,6 +60,7 @@ class Sqlite(File):
         columns: filter columns that are returned
         """
         conn = None
+        t0 = time.perf_counter()
         try:
             conn = self.connect()
 
@@ -79,6 +82,9 @@ class Sqlite(File):
             if id_col:
                 df.set_index(id_col, drop=True, inplace=True)
 
+            if metrics.enabled:
+                metrics.timing("sqlite.read_table", time.perf_counter() - t0, table=table_name)
+                metrics.incr("sqlite.read_table.rows", len(df), table=table_name)
             return df
         except KeyError as e:
             raise Exception(e, f"available columns are: {table_meta['name'].values}")
@@ -137,6 +143,28 @@ class Sqlite(File):
             if kill_connection and conn is not None:
                 conn.close()
 
+    def bulk_update(
+        self, df: pd.DataFrame, table_name: str, df_id_col: str, db_id_col: str, update_cols: dict, conn=None
+    ) -> int:
+        """Update columns of table_name with values from df in one transaction.
+        See hrt.sqlite_bulk_update for the parameters. Returns number of updated rows.
+        """
+        kill_connection = conn is None  # Only kill connection when it was not provided as input
+        try:
+            if conn is None:
+                conn = self.connect()
+            return hrt.sqlite_bulk_update(
+                df=df,
+                table_name=table_name,
+                df_id_col=df_id_col,
+                db_id_col=db_id_col,
+                update_cols=update_cols,
+                conn=conn,
+            )
+        finally:
+            if kill_connection and conn is not None:
+                conn.close()
+
     # TODO was sql_table_exists
     def sql_table_info(self, table_name, conn=None):
         """Return table info if it exists"""
@@ -4,11 +4,16 @@ from pathlib import Path
 import numpy as np
 
 import hhnk_research_tools as hrt
+import hhnk_research_tools.logger as logging
 from hhnk_research_tools.folder_file_classes.file_class import File
 from hhnk_research_tools.folder_file_classes.folder_file_classes import Folder
 from hhnk_research_tools.folder_file_classes.sqlite_class import Sqlite
 from hhnk_research_tools.gis.raster import Raster
+from hhnk_research_tools.threedi.cell_id_raster import CellIdRaster, load_cell_id_raster
 from hhnk_research_tools.threedi.threediresult_loader import ThreediResultLoader
+from hhnk_research_tools.threedi.timeseries import export_timeseries
+
+logger = logging.get_logger(name=__name__)
 
 # Third-party imports
 
@@ -147,9 +152,31 @@ class ThreediSchematisation(Folder):
 """
 
 
+def _close_threedigrid_handle(handle):
+    """Close the hdf5/netcdf files opened by a threedigrid admin, with the close or
+    context manager api of the admin.
+    """
+    try:
+        if hasattr(handle, "close"):
+            handle.close()
+        elif hasattr(handle, "__exit__"):
+            handle.__exit__(None, None, None)
+        else:
+            logger.warning(f"{type(handle).__name__} has no close or __exit__, files are not closed.")
+    except Exception:  # File can already be closed.
+        pass
+
+
 class ThreediResult(Folder):
     """Result of threedi simulation. Base files are .nc and .h5.
     Use .grid to access GridH5ResultAdmin and .admin to access GridH5Admin
+
+    The admins are cached per instance, so repeated access does not reopen the
+    files. The cache is invalidated when the mtime of the files changes.
+    Use .close() or a with statement to close the files:
+
+    with hrt.ThreediResult(folder) as result:
+        result.grid.nodes...
     """
 
     def __init__(self, base, create=False):
@@ -160,30 +187,104 @@ class ThreediResult(Folder):
         self.add_file("admin_path", "gridadmin.h5")
         self.add_file("aggregate_grid_path", "aggregate_results_3di.nc")
 
+        # Opened threedigrid admins; {name: (mtimes, admin)}
+        self._admins = {}
+
+    def _get_admin(self, name: str, files: list, open_admin):
+        """Return cached admin, reopen it when one of the files changed."""
+        mtimes = tuple(f.path.stat().st_mtime_ns if f.exists() else None for f in files)
+        if name in self._admins:
+            cached_mtimes, admin = self._admins[name]
+            if cached_mtimes == mtimes:
+                return admin
+            _close_threedigrid_handle(admin)
+
+        admin = open_admin()
+        self._admins[name] = (mtimes, admin)
+        return admin
+
     @property
     def grid(self):
         # moved imports here because gridbuilder has h5py issues
         from threedigrid.admin.gridresultadmin import GridH5ResultAdmin
 
-        return GridH5ResultAdmin(self.admin_path.base, self.grid_path.base)
+        return self._get_admin(
+            name="grid",
+            files=[self.admin_path, self.grid_path],
+            open_admin=lambda: GridH5ResultAdmin(self.admin_path.base, self.grid_path.base),
+        )
 
     @property
     def aggregate_grid(self):
         # moved imports here because gridbuilder has h5py issues
         from threedigrid.admin.gridresultadmin import GridH5AggregateResultAdmin
 
-        return GridH5AggregateResultAdmin(self.admin_path.base, self.aggregate_grid_path.base)
+        return self._get_admin(
+            name="aggregate_grid",
+            files=[self.admin_path, self.aggregate_grid_path],
+            open_admin=lambda: GridH5AggregateResultAdmin(self.admin_path.base, self.aggregate_grid_path.base),
+        )
 
     @property
     def admin(self):
         from threedigrid.admin.gridadmin import GridH5Admin
 
-        return GridH5Admin(self.admin_path.base)
+        return self._get_admin(
+            name="admin",
+            files=[self.admin_path],
+            open_admin=lambda: GridH5Admin(self.admin_path.base),
+        )
 
     @property
     def load(self):
         return ThreediResultLoader(self.grid)
 
+    def export_timeseries(
+        self,
+        output_file,
+        variable: str = "s1",
+        element: str = "nodes",
+        subset: str = None,
+        ids: list = None,
+        bbox: list = None,
+        chunk_size: int = 50,
+        overwrite: bool = False,
+    ):
+        """Stream timeseries of nodes or lines to parquet in chunks of timesteps.
+        See hrt.threedi.export_timeseries for the parameters.
+        """
+        return export_timeseries(
+            grid=self.grid,
+            output_file=output_file,
+            variable=variable,
+            element=element,
+            subset=subset,
+            ids=ids,
+            bbox=bbox,
+            chunk_size=chunk_size,
+            overwrite=overwrite,
+        )
+
+    def cell_id_raster(self, resolution: float = None, folder=None, overwrite: bool = False) -> CellIdRaster:
+        """Return the cached raster with the 2D cell id per pixel, stored in this folder
+        or in folder. See hrt.threedi.load_cell_id_raster.
+        """
+        return load_cell_id_raster(
+            admin_path=self.admin_path.path, resolution=resolution, folder=folder, overwrite=overwrite
+        )
+
+    def close(self):
+        """Close all opened admins."""
+        for _, admin in self._admins.values():
+            _close_threedigrid_handle(admin)
+        self._admins = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def __repr__(self):
         return f"""{self.path.name} @ {self.path}
 exists: {self.exists()}
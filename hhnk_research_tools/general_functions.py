@@ -3,12 +3,11 @@ import importlib
 import importlib.resources as pkg_resources  # Load resource from package
 import inspect
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from typing import Union
 from uuid import uuid4
 
-import geopandas as gpd
-
 
 def get_functions(cls, stringify=True):
     """Get a string with functions (methods) in a class."""
@@ -42,19 +41,88 @@ def ensure_file_path(filepath):
         raise e from None
 
 
-def convert_gdb_to_gpkg(gdb, gpkg, overwrite=False, verbose=True):
-    """Convert input filegdb to geopackage"""
+def _vector_translate_layer(src, dst, layer, batch_size=100_000, update=False):
+    """Copy one layer from src to dst with ogr VectorTranslate. Features are streamed and
+    written in transactions of batch_size features, so memory use does not depend on
+    the size of the layer. Returns the number of features.
+    """
+    from osgeo import gdal
+
+    gdal.UseExceptions()
+    options = gdal.VectorTranslateOptions(
+        options=["-gt", str(batch_size)],
+        format="GPKG",
+        accessMode="update" if update else None,
+        layers=[layer],
+        layerName=layer,
+        layerCreationOptions=["GEOMETRY_NAME=geom"],
+    )
+    ds = gdal.VectorTranslate(destNameOrDestDS=str(dst), srcDS=str(src), options=options)
+    feature_count = ds.GetLayerByName(layer).GetFeatureCount()
+    ds = None
+    return feature_count
+
+
+def convert_gdb_to_gpkg(gdb, gpkg, overwrite=False, verbose=True, layers=None, batch_size=100_000, max_workers=1):
+    """Convert input filegdb to geopackage
+
+    Features are streamed with ogr VectorTranslate in batches (transactions) of
+    batch_size, so layers are never fully loaded in memory.
+
+    gdb (hrt.FileGDB): input filegdb
+    gpkg (str, Path): output geopackage
+    layers (list): layers to convert, defaults to all available layers.
+    batch_size (int): number of features per transaction.
+    max_workers (int): number of layers converted at the same time. A gpkg cannot
+        be written by multiple threads, so with max_workers>1 each layer is converted
+        to a temporary gpkg first. These are then appended to the output.
+    """
 
     if gdb.exists():
         if check_create_new_file(output_file=gpkg, overwrite=overwrite):
             if verbose:
                 print(f"Write gpkg to {gpkg}")
-            for layer in gdb.available_layers():
-                if verbose:
-                    print(f"    {layer}")
-                gdf = gpd.read_file(str(gdb), layer=layer)
-
-                gdf.to_file(str(gpkg), layer=layer, driver="GPKG")
+            if layers is None:
+                layers = gdb.available_layers()
+            gpkg = Path(str(gpkg))
+            ensure_file_path(gpkg)
+
+            if max_workers == 1:
+                for i, layer in enumerate(layers):
+                    start_time = datetime.datetime.now()
+                    feature_count = _vector_translate_layer(
+                        src=gdb, dst=gpkg, layer=layer, batch_size=batch_size, update=i > 0
+                    )
+                    if verbose:
+                        print(f"    {layer} - {feature_count} features ({time_delta(start_time)}s)")
+                return
+
+            # Convert layers concurrently to temporary gpkgs
+            temp_paths = {layer: gpkg.with_name(f"{gpkg.stem}_{get_uuid()}.gpkg") for layer in layers}
+
+            def convert_layer(layer):
+                start_time = datetime.datetime.now()
+                feature_count = _vector_translate_layer(
+                    src=gdb, dst=temp_paths[layer], layer=layer, batch_size=batch_size
+                )
+                return feature_count, time_delta(start_time)
+
+            try:
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = {executor.submit(convert_layer, layer): layer for layer in layers}
+                    for future in as_completed(futures):
+                        feature_count, duration = future.result()
+                        if verbose:
+                            print(f"    {futures[future]} - {feature_count} features ({duration}s)")
+
+                # Gpkg to gpkg is a fast sqlite copy compared to reading the filegdb.
+                for i, layer in enumerate(layers):
+                    _vector_translate_layer(
+                        src=temp_paths[layer], dst=gpkg, layer=layer, batch_size=batch_size, update=i > 0
+                    )
+            finally:
+                for temp_path in temp_paths.values():
+                    temp_path.unlink(missing_ok=True)
 
 
 def check_create_new_file(
@@ -0,0 +1,123 @@
+# %%
+import time
+
+import pandas as pd
+
+import hhnk_research_tools.logger as logging
+
+logger = logging.get_logger(name=__name__)
+
+REPORT_COLUMNS = ["count", "total_s", "mean_ms", "max_ms", "mb"]
+
+
+class RasterInstrumentation:
+    """Timing of the block loop of raster calculations. Pass an instance as
+    instrumentation to RasterBlocks, RasterCalculatorV2, RasterCalculator or
+    Waterschadeschatter.run to record per block:
+        - read time and bytes per input key (stage 'read:{key}')
+        - compute time (stage 'compute')
+        - write time and bytes (stage 'write')
+        - skipped blocks, e.g. all nodata (stage 'skip')
+
+    The calculators only time when an instance is passed, so there is no overhead
+    when it is None.
+
+    Usage:
+        instrumentation = hrt.RasterInstrumentation(name="dem_calc")
+        calc = hrt.RasterCalculatorV2(..., instrumentation=instrumentation)
+        calc.run()
+        instrumentation.report()  # pd.DataFrame with totals per stage
+
+    Parameters
+    ----------
+    name : str
+        Name used in the logged report.
+    callbacks : list[callable]
+        Called on every record as callback(stage, key, seconds, nbytes, block).
+    keep_events : bool
+        Keep all records, available as .events_df(). Uses memory for every block.
+    """
+
+    def __init__(self, name: str = "", callbacks: list = None, keep_events: bool = False):
+        self.name = name
+        self.callbacks = callbacks or []
+        self.keep_events = keep_events
+        self.reset()
+
+    def reset(self):
+        """Remove all records."""
+        self.stats = {}  # {stage: [count, total_s, max_s, nbytes]}
+        self.events = []
+        self.block_id = None
+        self.blocks_total = 0
+        self.time_start = time.perf_counter()
+
+    @staticmethod
+    def now() -> float:
+        return time.perf_counter()
+
+    def block(self, block_id):
+        """Start a new block, records are linked to this block."""
+        self.block_id = block_id
+        self.blocks_total += 1
+
+    def record(self, stage: str, seconds: float = 0.0, nbytes: int = 0, key: str = None):
+        """Add a record. stage is 'read', 'compute', 'write' or 'skip', for reads the
+        input key is added to the stage.
+        """
+        name = stage if key is None else f"{stage}:{key}"
+        stat = self.stats.get(name)
+        if stat is None:
+            self.stats[name] = [1, seconds, seconds, nbytes]
+        else:
+            stat[0] += 1
+            stat[1] += seconds
+            stat[3] += nbytes
+            if seconds > stat[2]:
+                stat[2] = seconds
+
+        if self.keep_events:
+            self.events.append((self.block_id, stage, key, seconds, nbytes))
+        for callback in self.callbacks:
+            callback(stage, key, seconds, nbytes, self.block_id)
+
+    def read(self, key: str, seconds: float, nbytes: int):
+        self.record("read", seconds=seconds, nbytes=nbytes, key=key)
+
+    def compute(self, seconds: float):
+        self.record("compute", seconds=seconds)
+
+    def write(self, seconds: float, nbytes: int = 0):
+        self.record("write", seconds=seconds, nbytes=nbytes)
+
+    def skip(self):
+        self.record("skip")
+
+    @property
+    def skipped_blocks(self) -> int:
+        return self.stats.get("skip", [0])[0]
+
+    def report(self) -> pd.DataFrame:
+        """Totals per stage, sorted by total time."""
+        records = {
+            stage: [count, total, total / count * 1000, max_s * 1000, nbytes / 1024**2]
+            for stage, (count, total, max_s, nbytes) in self.stats.items()
+        }
+        df = pd.DataFrame.from_dict(records, orient="index", columns=REPORT_COLUMNS)
+        return df.sort_values("total_s", ascending=False)
+
+    def events_df(self) -> pd.DataFrame:
+        """All records, only available with keep_events=True."""
+        return pd.DataFrame(self.events, columns=["block", "stage", "key", "seconds", "nbytes"])
+
+    def log_report(self, level=logging.INFO):
+        """Log the report with the hrt logger."""
+        wall_time = time.perf_counter() - self.time_start
+        logger.log(
+            level,
+            f"{self.name} - {self.blocks_total} blocks ({self.skipped_blocks} skipped) in {wall_time:.2f}s\n"
+            f"{self.report().round(3).to_string()}",
+        )
+
+    def __repr__(self):
+        return f"RasterInstrumentation({self.name})\n{self.report().round(3).to_string()}"
@@ -1,23 +1,43 @@
 # %%
 import inspect
+import os
 from pathlib import Path
 
 import geopandas as gpd
-import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
 from osgeo import gdal
-from scipy import ndimage
 from shapely import geometry
 
 import hhnk_research_tools as hrt
 from hhnk_research_tools.folder_file_classes.file_class import File
 from hhnk_research_tools.general_functions import get_functions, get_variables
+from hhnk_research_tools.gis.tile_index import TileIndex
 
 # If anything goes wrong in gdal, make sure we raise the errors instead
 # of silenty ignoring the issues.
 gdal.UseExceptions()
 
+# Resampling of reads with a buffer size (target_res).
+RESAMPLE_ALGS = {
+    "nearest": gdal.GRIORA_NearestNeighbour,
+    "bilinear": gdal.GRIORA_Bilinear,
+    "cubic": gdal.GRIORA_Cubic,
+    "average": gdal.GRIORA_Average,
+    "mode": gdal.GRIORA_Mode,
+}
+
+# Resampling of Raster.warp
+WARP_RESAMPLE_ALGS = {
+    "nearest": "near",
+    "average": "average",
+    "mode": "mode",
+    "max": "max",
+    "min": "min",
+    "bilinear": "bilinear",
+    "cubic": "cubic",
+}
+
 
 # %%
 class Raster(File):
@@ -26,6 +46,7 @@ class Raster(File):
 
         self.source_set = False  # Tracks if the source exist on the system.
         self._array = None
+        self._tile_index = None
         self.min_block_size = min_block_size
 
     @property
@@ -41,22 +62,47 @@ class Raster(File):
     def array(self, raster_array, window=None, band_nr=1):
         self._array = raster_array
 
-    def _read_array(self, band=None, window=None):
+    def _buffer_size(self, window, target_res):
+        """Size of the array when window is read at target_res. Only coarser
+        resolutions are used, finer target_res returns the window size.
+        """
+        factor = max(abs(target_res / self.metadata.pixel_width), 1)
+        return max(1, int(np.ceil(window[2] / factor))), max(1, int(np.ceil(window[3] / factor)))
+
+    def _read_array(self, band=None, window=None, target_res=None, resampling="nearest"):
         # TODO hidden to public?
         """window=[x0, y0, x1, y1]--oud.
         window=[x0, y0, xsize, ysize]
         x0, y0 is left top corner!!
+
+        target_res (float): read at a coarser resolution (in m). GDAL serves the read from
+            the closest overview if the raster has them (see build_overviews), otherwise
+            the full resolution data is resampled. The array has the shape of the window
+            at target_res.
+        resampling (str): resampling of the read when target_res is used, see RESAMPLE_ALGS.
         """
         if band is None:
             gdal_src = self.open_gdal_source_read()
             band = gdal_src.GetRasterBand(1)
 
+        if window is None and target_res is not None:
+            window = [0, 0, self.metadata.x_res, self.metadata.y_res]
+
         if window is not None:
+            read_kwargs = {}
+            if target_res is not None:
+                buf_xsize, buf_ysize = self._buffer_size(window=window, target_res=target_res)
+                read_kwargs = {
+                    "buf_xsize": buf_xsize,
+                    "buf_ysize": buf_ysize,
+                    "resample_alg": RESAMPLE_ALGS[resampling],
+                }
             raster_array = band.ReadAsArray(
                 xoff=int(window[0]),
                 yoff=int(window[1]),
                 win_xsize=int(window[2]),
                 win_ysize=int(window[3]),
+                **read_kwargs,
             )
         else:
             raster_array = band.ReadAsArray()
@@ -66,21 +112,22 @@ class Raster(File):
 
         return raster_array
 
-    def get_array(self, window=None, band_count=None):
+    def get_array(self, window=None, band_count=None, target_res=None):
         # TODO hoe deze gebruiken tov _read_array? is het nuttig om
         # array ook in cls weg te schrijven.
+        """target_res (float): read at a coarser resolution, see _read_array."""
         try:
             if band_count is None:
                 band_count = self.band_count
 
             gdal_src = self.open_gdal_source_read()
             if band_count == 1:
-                raster_array = self._read_array(band=gdal_src.GetRasterBand(1), window=window)
+                raster_array = self._read_array(band=gdal_src.GetRasterBand(1), window=window, target_res=target_res)
 
             elif band_count == 3:
-                red_array = self._read_array(band=gdal_src.GetRasterBand(1), window=window)
-                green_array = self._read_array(band=gdal_src.GetRasterBand(2), window=window)
-                blue_array = self._read_array(band=gdal_src.GetRasterBand(3), window=window)
+                red_array = self._read_array(band=gdal_src.GetRasterBand(1), window=window, target_res=target_res)
+                green_array = self._read_array(band=gdal_src.GetRasterBand(2), window=window, target_res=target_res)
+                blue_array = self._read_array(band=gdal_src.GetRasterBand(3), window=window, target_res=target_res)
 
                 raster_array = np.dstack((red_array, green_array, blue_array))
             else:
@@ -164,8 +211,64 @@ class Raster(File):
         if self.exists():
             return self._metadata
 
-    def plot(self):
-        plt.imshow(self._array)
+    def plot(self, target_res=None):
+        """Plot the loaded array (see get_array). With target_res the raster is read
+        at that resolution for a quick-look, which is fast when it has overviews.
+        """
+        import matplotlib.pyplot as plt
+
+        if target_res is None:
+            array = self._array
+        else:
+            array = self._read_array(target_res=target_res).astype(float)
+            array[array == self.nodata] = np.nan
+        plt.imshow(array)
+
+    @property
+    def overview_count(self) -> int:
+        """Number of overviews (internal or .ovr) of the first band."""
+        gdal_src = self.open_gdal_source_read()
+        return gdal_src.GetRasterBand(1).GetOverviewCount()
+
+    def build_overviews(self, levels: list = None, resampling: str = "average", external: bool = False):
+        """Build overviews (pyramids), so reads with target_res are served from a
+        coarser level instead of the full resolution data.
+
+        levels (list[int]): decimation factors, e.g. [2, 4, 8]. None adds factors of 2
+            until the overview is smaller than 256 pixels.
+        resampling (str): 'nearest', 'average', 'mode', 'max', ... Use 'nearest' or
+            'mode' for classes like landuse.
+        external (bool): write the overviews to a .ovr next to the raster instead of
+            inside the file. Use this for rasters that should not be changed.
+        """
+        if levels is None:
+            levels = []
+            level = 2
+            while min(self.shape) / level >= 256:
+                levels.append(level)
+                level *= 2
+            if not levels:
+                levels = [2]
+
+        if external:
+            gdal_src = self.open_gdal_source_read()  # Read only creates a .ovr
+        else:
+            gdal_src = self.open_gdal_source_write()
+        gdal_src.BuildOverviews(resampling.upper(), [int(i) for i in levels])
+        gdal_src = None
+
+    @property
+    def tile_index(self):
+        """hrt.TileIndex of a vrt created with build_vrt, None for other rasters
+        or when the vrt has no tile index.
+        """
+        if self._tile_index is None:
+            index_path = TileIndex.vrt_index_path(self.path)
+            if self.path.suffix.lower() == ".vrt" and index_path.exists():
+                self._tile_index = TileIndex(index_path)
+            else:
+                self._tile_index = False  # Checked, don't check again
+        return self._tile_index or None
 
     @property
     def shape(self):
@@ -278,6 +381,8 @@ class Raster(File):
 
     def sum_labels(self, labels_raster, labels_index):
         """Calculate the sum of the rastervalues per label."""
+        from scipy import ndimage
+
         if labels_raster.shape != self.shape:
             raise Exception(f"label raster shape {labels_raster.shape} does not match the raster shape {self.shape}")
 
@@ -315,7 +420,9 @@ class Raster(File):
     def to_file(self):
         pass
 
-    def build_vrt(self, overwrite: bool, bounds, input_files: list, resolution="highest", bandlist=[1]):
+    def build_vrt(
+        self, overwrite: bool, bounds, input_files: list, resolution="highest", bandlist=[1], from_index=False
+    ):
         """Build vrt from input files.
         overwrite (bool)
         bounds (np.array): format should be; (xmin, ymin, xmax, ymax)
@@ -324,6 +431,12 @@ class Raster(File):
         resolution: "highest"|"lowest"|"average"
             instead of "user" option, provide a float for manual target_resolution
         bandList: doesnt work as expected, passing [1] works.
+        from_index (bool): write the vrt from the tile index instead of with gdal.BuildVRT,
+            without opening the input files. Only for input files with the same resolution,
+            nodata, datatype and crs (see hrt.TileIndex.check_uniform).
+
+        The headers of the input files are cached in a tile index next to the vrt
+        (hrt.TileIndex), only new or changed input files are opened on a rebuild.
         """
         if hrt.check_create_new_file(output_file=self.path, overwrite=overwrite):
             # Set inputfiles to list of strings.
@@ -342,15 +455,21 @@ class Raster(File):
                 yRes = None
 
             # Check resolution of input files
-            input_resolutions = []
-            for r in input_files:
-                r = Raster(r)
-                input_resolutions.append(r.metadata.pixel_width)
-            if len(np.unique(input_resolutions)) > 1:
+            self._tile_index = None
+            tile_index = TileIndex.from_vrt(self.path)
+            tile_index.update(input_files)
+            input_resolutions = tile_index.resolutions
+            if len(input_resolutions) > 1:
                 raise Exception(
                     f"Multiple resolutions ({input_resolutions}) found in input_files. We cannot handle that yet."
                 )
 
+            # Write vrt from the tile index when no resampling is needed.
+            if from_index and bandlist == [1] and xRes in [None, input_resolutions[0]]:
+                tile_index.write_vrt(self.path, bounds=bounds)
+                self.source_set = False
+                return
+
             # Build vrt
             vrt_options = gdal.BuildVRTOptions(
                 resolution=resolution,
@@ -429,11 +548,15 @@ functions: {get_functions(self)}
 variables: {get_variables(self)}
 """
 
-    def create(self, metadata, nodata, datatype=None, create_options=None, verbose=False, overwrite=False):
+    def create(
+        self, metadata, nodata, datatype=None, create_options=None, verbose=False, overwrite=False, profile=None
+    ):
         """Create empty raster
 
         metadata (RasterMetadata): metadata
         nodata (int): nodata value
+        profile (str): None or 'cog'. With 'cog' the raster is written with datatype aware,
+            multithreaded compression. Call .to_cog() when it is finished.
         """
         # Check if function should continue.
         if verbose:
@@ -445,6 +568,7 @@ variables: {get_variables(self)}
             datatype=datatype,
             create_options=create_options,
             overwrite=overwrite,
+            profile=profile,
         )
         target_ds = None
 
@@ -453,6 +577,160 @@ variables: {get_variables(self)}
         self.source_set = False
         self.source = None  # Update raster now it exists
 
+    def to_cog(self, output_file=None, overviews: bool = True, resampling: str = "average", max_z_error=None):
+        """Convert to Cloud Optimized GeoTIFF; tiled, with internal overviews and the
+        IFDs at the start of the file, compressed with all cpu's.
+
+        output_file (str, Path): output .tif. None replaces this raster, which should be
+            a .tif in that case.
+        overviews (bool): add internal overviews.
+        resampling (str): resampling of the overviews, use 'nearest' or 'mode' for classes.
+        max_z_error (float): max error of the LERC compression of floats, defaults to
+            COG_MAX_Z_ERROR.
+
+        Returns the output Raster.
+        """
+        from hhnk_research_tools.raster_functions import COG_MAX_Z_ERROR, get_cog_options
+
+        if max_z_error is None:
+            max_z_error = COG_MAX_Z_ERROR
+
+        in_place = output_file is None
+        if in_place:
+            if self.path.suffix.lower() not in [".tif", ".tiff"]:
+                raise ValueError(f"Pass output_file to convert {self.path.name} to cog.")
+            output_path = self.path.with_name(f"{self.path.stem}_cog_tmp.tif")
+        else:
+            output_path = Path(str(output_file))
+
+        gdal_src = self.open_gdal_source_read()
+        creation_options = get_cog_options(
+            datatype=gdal_src.GetRasterBand(1).DataType,
+            max_z_error=max_z_error,
+            overviews=overviews,
+            resampling=resampling,
+        )
+        cog_ds = gdal.Translate(str(output_path), gdal_src, format="COG", creationOptions=creation_options)
+        cog_ds.FlushCache()
+        cog_ds = None
+        gdal_src = None
+
+        if in_place:
+            os.replace(output_path, self.path)
+            self.source_set = False
+            return self
+        return Raster(output_path)
+
+    def read_array_bounds(self, bounds, shape, resampling: str = "nearest") -> np.ndarray:
+        """Read the raster resampled to the grid of bounds and shape, in memory with
+        gdal.Warp. Pixels outside the raster get nodata.
+
+        bounds (list): (xmin, ymin, xmax, ymax) of the grid
+        shape (list): (rows, cols) of the grid
+        resampling (str): 'nearest', 'average', 'mode', 'max', ... see Raster.warp. Use
+            'average', 'mode' or 'max' to aggregate a finer raster.
+        """
+        gdal_src = self.open_gdal_source_read()
+        mem_ds = gdal.Warp(
+            "",
+            gdal_src,
+            options=gdal.WarpOptions(
+                format="MEM",
+                outputBounds=bounds,
+                width=int(shape[1]),
+                height=int(shape[0]),
+                resampleAlg=WARP_RESAMPLE_ALGS[resampling],
+                srcNodata=self.nodata,
+                dstNodata=self.nodata,
+            ),
+        )
+        raster_array = mem_ds.GetRasterBand(1).ReadAsArray()
+        mem_ds = None
+        gdal_src = None
+        return raster_array
+
+    def warp(
+        self,
+        output_file,
+        target_res: float = None,
+        resampling: str = "nearest",
+        bounds=None,
+        target_aligned: bool = False,
+        dst_crs: str = None,
+        nodata=None,
+        datatype=None,
+        profile=None,
+        memory_limit_mb: int = 512,
+        overwrite: bool = False,
+    ):
+        """Resample and/or reproject the raster to output_file with gdal.Warp.
+
+        The warp is done in chunks that fit in memory_limit_mb, with all cpu's. The
+        metadata of this raster is not changed.
+
+        Parameters
+        ----------
+        output_file (str, Path): output .tif
+        target_res (float): pixel size of the output, None keeps the resolution.
+        resampling (str): 'nearest', 'average', 'mode', 'max', 'min', 'bilinear' or 'cubic'.
+            Use 'nearest' or 'mode' for classes like landuse.
+        bounds (list): (xmin, ymin, xmax, ymax) of the output, None uses the bounds
+            of this raster.
+        target_aligned (bool): align the output grid to multiples of target_res
+            (gdalwarp -tap), the output bounds are extended to the aligned grid.
+        dst_crs (str): e.g. 'EPSG:28992', None keeps the crs.
+        nodata (float): nodata of the output, defaults to the nodata of this raster.
+        datatype (int): gdal datatype of the output, defaults to the datatype of this raster.
+        profile (str): None or 'cog', see hrt.raster_functions.get_create_options.
+        memory_limit_mb (int): memory used by the warper for a chunk.
+        overwrite (bool): overwrite output_file if it exists.
+
+        Returns the output Raster, None when it exists and overwrite is False.
+        """
+        from hhnk_research_tools.raster_functions import get_create_options
+
+        if resampling not in WARP_RESAMPLE_ALGS:
+            raise ValueError(f"resampling should be one of {list(WARP_RESAMPLE_ALGS)}, got {resampling}")
+        if not hrt.check_create_new_file(output_file=output_file, overwrite=overwrite):
+            return None
+
+        if target_res is None and target_aligned:
+            target_res = self.metadata.pixel_width
+        if bounds is None and dst_crs is None and not target_aligned:
+            bounds = self.metadata.bbox_gdal
+        if nodata is None:
+            nodata = self.nodata
+
+        gdal_src = self.open_gdal_source_read()
+        if datatype is None:
+            datatype = gdal_src.GetRasterBand(1).DataType
+
+        warp_options = gdal.WarpOptions(
+            format="GTiff",
+            outputBounds=bounds,
+            xRes=target_res,
+            yRes=target_res,
+            targetAlignedPixels=target_aligned,
+            dstSRS=dst_crs,
+            srcNodata=self.nodata,
+            dstNodata=nodata,
+            outputType=datatype,
+            resampleAlg=WARP_RESAMPLE_ALGS[resampling],
+            creationOptions=get_create_options(datatype=datatype, profile=profile),
+            multithread=True,
+            warpOptions=["NUM_THREADS=ALL_CPUS"],
+            warpMemoryLimit=memory_limit_mb,  # Values < 10000 are in MB
+        )
+        dst_ds = gdal.Warp(str(output_file), gdal_src, options=warp_options)
+        dst_ds.FlushCache()
+        dst_ds = None
+        gdal_src = None
+
+        output_raster = Raster(output_file)
+        if profile == "cog":
+            output_raster.to_cog(resampling="nearest" if resampling in ["nearest", "mode"] else "average")
+        return output_raster
+
     def sum(self):
         """Calculate sum of raster"""
         raster_sum = 0
@@ -552,6 +830,12 @@ class RasterMetadata:
     def shape(self):
         return [self.y_res, self.x_res]
 
+    def window_bounds(self, window) -> tuple:
+        """(xmin, ymin, xmax, ymax) of window [x0, y0, xsize, ysize] in pixels."""
+        x_min = self.x_min + window[0] * self.pixel_width
+        y_max = self.y_max + window[1] * self.pixel_height
+        return x_min, y_max + window[3] * self.pixel_height, x_min + window[2] * self.pixel_width, y_max
+
     @property
     def pixelarea(self):
         return abs(self.georef[1] * self.georef[5])
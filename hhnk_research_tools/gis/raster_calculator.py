@@ -1,13 +1,76 @@
 import datetime
+import hashlib
 import json
+import os
+import time
 import types
 from dataclasses import dataclass
+from pathlib import Path
 
 import geopandas as gpd
 import numpy as np
 import pandas as pd
 
 import hhnk_research_tools as hrt
+from hhnk_research_tools.gis.instrumentation import RasterInstrumentation
+from hhnk_research_tools.gis.raster import WARP_RESAMPLE_ALGS
+from hhnk_research_tools.logger import metrics
+
+
+def _window_on_grid(metadata, window, raster_metadata):
+    """Window [x0, y0, xsize, ysize] on the grid of metadata as window on the grid of
+    raster_metadata. None when the grids have another resolution or alignment, or when
+    the window is not inside the raster.
+    """
+    if (metadata.pixel_width, metadata.pixel_height) != (raster_metadata.pixel_width, raster_metadata.pixel_height):
+        return None
+
+    x0 = window[0] + (metadata.x_min - raster_metadata.x_min) / metadata.pixel_width
+    y0 = window[1] + (metadata.y_max - raster_metadata.y_max) / metadata.pixel_height
+    if not (np.isclose(x0, np.round(x0)) and np.isclose(y0, np.round(y0))):
+        return None
+
+    x0, y0 = int(np.round(x0)), int(np.round(y0))
+    if x0 < 0 or y0 < 0 or x0 + window[2] > raster_metadata.x_res or y0 + window[3] > raster_metadata.y_res:
+        return None
+    return [x0, y0, window[2], window[3]]
+
+
+def _code_signature(code: types.CodeType) -> str:
+    """Hash of the bytecode and constants of code, including nested functions."""
+    signature = hashlib.blake2b(code.co_code)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            signature.update(_code_signature(const).encode())
+        else:
+            signature.update(repr(const).encode())
+    return signature.hexdigest()
+
+
+def _value_signature(value) -> str:
+    """Value of a kwarg, closure cell or global as str for the run signature. Functions
+    are hashed on their code, arrays and (Geo)DataFrames on their data. Dicts, lists and
+    tuples are handled per item.
+    """
+    if isinstance(value, types.ModuleType):
+        return value.__name__
+    code = getattr(value, "__code__", None)
+    if code is not None:
+        return _code_signature(code)
+    if isinstance(value, np.ndarray):
+        signature = hashlib.blake2b(f"{value.dtype}{value.shape}".encode())
+        signature.update(np.ascontiguousarray(value).tobytes())
+        return signature.hexdigest()
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        names = list(value.columns) if isinstance(value, pd.DataFrame) else [value.name]
+        signature = hashlib.blake2b(repr(names).encode())
+        signature.update(pd.util.hash_pandas_object(value, index=True).to_numpy().tobytes())
+        return signature.hexdigest()
+    if isinstance(value, dict):
+        return json.dumps({str(k): _value_signature(v) for k, v in value.items()}, sort_keys=True)
+    if isinstance(value, (list, tuple)):
+        return json.dumps([_value_signature(v) for v in value])
+    return repr(value)
 
 
 @dataclass
@@ -16,8 +79,9 @@ class RasterBlocks:
     General function to load blocks of selected files with a given window.
     Also loads the masks and can check if a block is fully nodata, in which
     case it stopts loading.
-    Input files should have the same extent, so make a vrt of them first if
-    they are not. This is handled in RasterCalculator.
+    Input files should have the same extent, unless metadata is passed. Then the
+    window is on the grid of metadata and inputs with another extent or resolution
+    are resampled to that grid per block. This is handled in RasterCalculatorV2.
 
     For speed this class does not check if all inputs exist. This should still
     be the case.
@@ -37,6 +101,18 @@ class RasterBlocks:
     mask_keys (list[str]):
         Keys to add to nodatamask. Keys already listed in nodata_keys and yesdata_dict
         do not have to be defined here.
+    instrumentation (hrt.RasterInstrumentation):
+        Records the read time and bytes per key when passed.
+    metadata (hrt.RasterMetadata):
+        Grid of the window. When None the window is used on every input as is.
+    resample_dict (dict): {key:str}
+        Resampling of inputs that are not on the grid of metadata, defaults to
+        'nearest'. Use 'average', 'mode' or 'max' to aggregate finer inputs.
+        See hrt.Raster.read_array_bounds.
+
+    Vrts with a tile index (built with build_vrt) are read directly from the tile when
+    the window lies inside one tile. Windows that touch no tile are not read and filled
+    with nodata.
     """
 
     window: list
@@ -44,6 +120,9 @@ class RasterBlocks:
     nodata_keys: list[str] = None
     yesdata_dict: dict[str : list[float]] = None
     mask_keys: list[str] = None
+    instrumentation: RasterInstrumentation = None
+    metadata: hrt.RasterMetadata = None
+    resample_dict: dict[str:str] = None
 
     def __post_init__(self):
         self.cont = True
@@ -84,9 +163,51 @@ class RasterBlocks:
         except Exception as e:
             raise Exception("Something went wrong. Do all inputs exist?") from e
 
+    def _read_raster_window(self, key):
+        """Read window, for vrts with a tile index (see hrt.TileIndex) the window is read
+        directly from the tile when it lies inside one tile, with the nodata of the vrt.
+        Windows without any tile are filled with nodata without reading.
+        """
+        raster = self.raster_paths_dict[key]
+        window = self.window
+        if self.metadata is not None:
+            window = _window_on_grid(metadata=self.metadata, window=self.window, raster_metadata=raster.metadata)
+            if window is None:
+                # Other resolution, alignment or extent; resample to the grid of the window.
+                resampling = "nearest" if self.resample_dict is None else self.resample_dict.get(key, "nearest")
+                return raster.read_array_bounds(
+                    bounds=self.metadata.window_bounds(self.window),
+                    shape=(self.window[3], self.window[2]),
+                    resampling=resampling,
+                )
+
+        tile_index = raster.tile_index
+        if tile_index is None:
+            return raster._read_array(window=window)
+
+        if not tile_index.window_has_tiles(metadata=raster.metadata, window=window):
+            nodata = 0 if raster.nodata is None else raster.nodata
+            return np.full((int(window[3]), int(window[2])), nodata, dtype=tile_index.dtype)
+
+        array = tile_index.read_window(metadata=raster.metadata, window=window, nodata=raster.nodata)
+        if array is None:
+            array = raster._read_array(window=window)
+        return array
+
     def read_array_window(self, key):
         """Read window from hrt.Raster"""
-        return self.raster_paths_dict[key]._read_array(window=self.window)
+        if self.instrumentation is None and not metrics.enabled:
+            return self._read_raster_window(key)
+
+        t0 = time.perf_counter()
+        array = self._read_raster_window(key)
+        seconds = time.perf_counter() - t0
+        if self.instrumentation is not None:
+            self.instrumentation.read(key=key, seconds=seconds, nbytes=array.nbytes)
+        if metrics.enabled:
+            metrics.timing("raster_blocks.read", seconds, key=key)
+            metrics.incr("raster_blocks.read_bytes", array.nbytes, key=key)
+        return array
 
     @property
     def masks_all(self):
@@ -97,8 +218,9 @@ class RasterBlocks:
 class RasterCalculatorV2:
     """
     Base setup for raster calculations. The input rasters defined in raster_paths_dict
-    are looped over per block. Note that all input rasters should have the same extent.
-    This can be achieved with .vrt if the original rasters do not have the same extent.
+    are looped over per block, on the grid of the metadata raster. Inputs with another
+    extent or resolution are resampled to that grid per block, in memory (see
+    resample_dict).
     For each block the custom_run_window_function will be run. This always takes a
     block as input and also returns the block. For example:
 
@@ -130,7 +252,27 @@ class RasterCalculatorV2:
     min_block_size (int): min block size for generator blocks_df, higher is faster but
         uses more RAM.
     verbose (bool): print progress
-    tempdir (hrt.Folder): pass if you want temp vrt's to be created in a specific tempdir
+    tempdir (hrt.Folder): folder for temp vrt's of create_vrt. Not used by run, inputs
+        on another grid are resampled per block. Defaults to a temp_<date> folder next
+        to raster_out, made when create_vrt is called.
+    instrumentation (hrt.RasterInstrumentation): records read, compute and write time
+        per block and logs a report after run.
+    profile (str): None or 'cog'. With 'cog' the output is written with datatype aware,
+        multithreaded compression and converted to a Cloud Optimized GeoTIFF after run.
+    output_datatype (int): gdal datatype of the output, e.g. gdal.GDT_Byte for classes.
+        Defaults to Float32. Blocks returned by custom_run_window_function are cast to it.
+    resample_dict (dict): {key:str}
+        Resampling of inputs with another resolution than the metadata raster, e.g.
+        {"storage": "nearest", "landuse": "mode"}. Defaults to 'nearest'. Use 'average',
+        'mode' or 'max' to aggregate finer inputs. See hrt.Raster.read_array_bounds.
+
+    With run(incremental=True) a signature of the inputs is stored per block in a
+    sidecar next to the output (<raster_out stem>.blocks.json). On the next incremental
+    run only blocks with changed inputs are calculated and written in the existing
+    output. Inputs with a tile index (vrts from build_vrt) are compared on the mtime
+    and size of the tiles in the block, without reading them. Other inputs are compared
+    on a hash of the block. Incremental runs need profile=None, use Raster.to_cog on the
+    output afterwards.
     """
 
     def __init__(
@@ -146,6 +288,10 @@ class RasterCalculatorV2:
         min_block_size: int = 4096,
         verbose: bool = False,
         tempdir: hrt.Folder = None,
+        instrumentation: RasterInstrumentation = None,
+        profile: str = None,
+        output_datatype: int = None,
+        resample_dict: dict[str:str] = None,
     ):
         self.raster_out = raster_out
         self.raster_paths_dict = raster_paths_dict
@@ -157,15 +303,16 @@ class RasterCalculatorV2:
         self.output_nodata = output_nodata
         self.min_block_size = min_block_size
         self.verbose = verbose
+        self.instrumentation = instrumentation
+        self.profile = profile
+        self.output_datatype = output_datatype
+        self.resample_dict = resample_dict
 
         # Local vars
-        if tempdir is None:
-            self.tempdir = raster_out.parent.full_path(f"temp_{hrt.current_time(date=True)}")
-        else:
-            self.tempdir = tempdir
+        self.tempdir = tempdir
 
-        # If bounds of input rasters are not the same a temp vrt is created
-        # The path to these files are stored here.
+        # Rasters that are read per block. Inputs with other bounds are resampled per
+        # block, so these are the input rasters unless create_vrt is used.
         self.raster_paths_same_bounds = self.raster_paths_dict.copy()
 
         # Filled when running
@@ -176,12 +323,13 @@ class RasterCalculatorV2:
         """Raster of which metadata is used to create output."""
         return self.raster_paths_dict[self.metadata_key]
 
-    def verify(self, overwrite: bool = False) -> bool:
-        """Verify if all inputs can be accessed and if they have the same bounds."""
+    def verify(self, overwrite: bool = False, incremental: bool = False) -> bool:
+        """Verify if all inputs can be accessed. With incremental an existing output is
+        kept, to be updated per block.
+        """
         cont = True
 
-        # Check if all input rasters have the same bounds
-        bounds = {}
+        # Check if all input rasters exist
         for key, r in self.raster_paths_dict.items():
             if cont:
                 if not isinstance(r, hrt.Raster):
@@ -190,7 +338,6 @@ class RasterCalculatorV2:
                     print(f"Missing input raster key: {key} @ {r}")
                     cont = False
                     continue
-                bounds[key] = r.metadata.bounds
 
         # nodata_keys and yesdata_dict are mutually exclusive.
         if self.yesdata_dict is not None:
@@ -198,35 +345,25 @@ class RasterCalculatorV2:
                 if key in self.nodata_keys:
                     raise ValueError(f"Key:'{key}' not allowed to be passed to both yesdata_dict and nodata_keys.")
 
-        # Check resolution
-        if cont:
-            vrt_keys = []
-            for key, r in self.raster_paths_dict.items():
-                if r.metadata.pixelarea > self.metadata_raster.metadata.pixelarea:
-                    print(f"Resolution of {key} is not the same as metadataraster {self.metadata_key}, creating vrt")
-                    self.create_vrt(key)
-                    vrt_keys.append(key)
-                if r.metadata.pixelarea < self.metadata_raster.metadata.pixelarea:
-                    cont = False
-                    raise NotImplementedError(
-                        f"Resolution of {key} is smaller than metadataraster {self.metadata_key}, \
-this is not implemented or tested if it works."
-                    )
-
-        # Check bounds, if they are not the same as the metadata_raster, create a vrt
+        # Inputs on another grid are resampled per block
         if cont:
-            for key, r in self.raster_paths_dict.items():
-                if r.metadata.bounds != self.metadata_raster.metadata.bounds:
-                    # Create vrt if it was not already created in resolution check
-                    if key not in vrt_keys:
-                        self.create_vrt(key)
-
-                    if self.verbose:
-                        print(f"{key} does not have same extent as {self.metadata_key}, creating vrt")
+            if self.resample_dict is not None:
+                for key, resampling in self.resample_dict.items():
+                    if key not in self.raster_paths_dict:
+                        raise KeyError(f"Key:'{key}' in resample_dict is not in raster_paths_dict.")
+                    if resampling not in WARP_RESAMPLE_ALGS:
+                        raise ValueError(f"resampling of {key} should be one of {list(WARP_RESAMPLE_ALGS)}")
+
+            if self.verbose:
+                for key, r in self.raster_paths_dict.items():
+                    if r.metadata.georef != self.metadata_raster.metadata.georef or (
+                        r.metadata.shape != self.metadata_raster.metadata.shape
+                    ):
+                        print(f"{key} does not have the same grid as {self.metadata_key}, resampling per block")
 
         # Check if we should create new file
         if cont:
-            if self.raster_out is not None:
+            if self.raster_out is not None and not (incremental and self.raster_out.exists()):
                 cont = hrt.check_create_new_file(output_file=self.raster_out, overwrite=overwrite)
                 if cont is False:
                     if self.verbose:
@@ -239,7 +376,12 @@ this is not implemented or tested if it works."
         if self.verbose:
             print(f"Creating output raster: {self.raster_out.name} @ {self.raster_out.path}")
 
-        self.raster_out.create(metadata=self.metadata_raster.metadata, nodata=self.output_nodata)
+        self.raster_out.create(
+            metadata=self.metadata_raster.metadata,
+            nodata=self.output_nodata,
+            datatype=self.output_datatype,
+            profile=self.profile,
+        )
 
     def create_vrt(self, raster_key: str):
         """Create vrt of input rasters with the extent of the metadata raster
@@ -251,6 +393,8 @@ this is not implemented or tested if it works."
         input_raster = self.raster_paths_dict[raster_key]
 
         # Create temp output folder.
+        if self.tempdir is None:
+            self.tempdir = self.raster_out.parent.full_path(f"temp_{hrt.current_time(date=True)}")
         self.tempdir.create()
         output_raster = self.tempdir.full_path(f"{input_raster.stem}.vrt")
         print(f"Creating temporary vrt; {output_raster.name} @ {output_raster}")
@@ -264,7 +408,81 @@ this is not implemented or tested if it works."
 
         self.raster_paths_same_bounds[raster_key] = output_raster
 
-    def run(self, overwrite: bool = False, **kwargs):
+    @property
+    def block_signatures_path(self) -> Path:
+        """Sidecar with the input signatures per block, written by run(incremental=True)."""
+        return self.raster_out.path.with_name(f"{self.raster_out.stem}.blocks.json")
+
+    def _run_signature(self, kwargs) -> str:
+        """Hash of everything that changes all blocks; the output grid, nodata and
+        datatype, the masks and the code, closure, globals and kwargs of
+        custom_run_window_function. Changes in functions called by
+        custom_run_window_function are not found, use run(overwrite=True) then.
+        """
+        func = self.custom_run_window_function
+        code = getattr(func, "__code__", None)
+        closure = {}
+        func_globals = {}
+        if code is not None:
+            for name, cell in zip(code.co_freevars, getattr(func, "__closure__", None) or []):
+                try:
+                    closure[name] = _value_signature(cell.cell_contents)
+                except ValueError:  # Empty cell
+                    closure[name] = None
+            namespace = getattr(func, "__globals__", {})
+            func_globals = {name: _value_signature(namespace[name]) for name in code.co_names if name in namespace}
+
+        run_dict = {
+            "georef": list(self.metadata_raster.metadata.georef),
+            "shape": list(self.metadata_raster.metadata.shape),
+            "output_nodata": self.output_nodata,
+            "output_datatype": self.output_datatype,
+            "resample_dict": self.resample_dict,
+            "nodata_keys": self.nodata_keys,
+            "mask_keys": self.mask_keys,
+            "yesdata_dict": self.yesdata_dict,
+            "function": getattr(func, "__qualname__", repr(func)),
+            "code": None if code is None else _code_signature(code),
+            "closure": closure,
+            "globals": func_globals,
+            "kwargs": {key: _value_signature(value) for key, value in kwargs.items()},
+        }
+        run_str = json.dumps(run_dict, sort_keys=True, default=str)
+        return hashlib.blake2b(run_str.encode(), digest_size=16).hexdigest()
+
+    def _block_signature(self, window, block: RasterBlocks = None):
+        """Hash of the inputs of a block. Inputs with a tile index are hashed on the
+        path, mtime and size of the tiles in the window (from the files, so edits of a
+        tile are found without rebuilding the vrt). Other inputs are hashed on their
+        data, which is taken from block. Returns None when block is needed but not passed.
+        """
+        signature = hashlib.blake2b(digest_size=16)
+        bounds = self.metadata_raster.metadata.window_bounds(window)
+        for key, raster in self.raster_paths_same_bounds.items():
+            signature.update(key.encode())
+            tile_index = raster.tile_index
+            if tile_index is not None:
+                for tile_path in tile_index.gdf["path"].iloc[np.sort(tile_index.query(bounds))]:
+                    stat = os.stat(tile_path)
+                    signature.update(f"{tile_path}:{stat.st_mtime_ns}:{stat.st_size}".encode())
+            elif block is None:
+                return None
+            elif key in block.blocks:  # Not read when an earlier key is all nodata
+                signature.update(np.ascontiguousarray(block.blocks[key]).tobytes())
+        return signature.hexdigest()
+
+    def read_block_signatures(self, run_signature: str) -> dict:
+        """Block signatures of the previous incremental run, {} when there is no output
+        or it was created with another grid, function or kwargs.
+        """
+        if not (self.raster_out.exists() and self.block_signatures_path.exists()):
+            return {}
+        signatures = json.loads(self.block_signatures_path.read_text())
+        if signatures.get("run") != run_signature:
+            return {}
+        return signatures["blocks"]
+
+    def run(self, overwrite: bool = False, incremental: bool = False, **kwargs):
         """Start raster calculation.
 
         Parameters
@@ -272,13 +490,30 @@ this is not implemented or tested if it works."
         overwrite : bool, optional, by default False
             False -> if output already exists this will not run.
             True  -> remove existing output and continue
+        incremental : bool, optional, by default False
+            Only calculate the blocks of which the inputs changed since the previous
+            incremental run, see block_signatures_path. The output is created from scratch
+            when there are no signatures or the grid, masks, function or kwargs changed.
+            Not possible with profile='cog', blocks cannot be updated in a COG.
         **kwargs:
             extra arguments that can be passed to the custom_run_window_function
         """
+        if incremental and self.profile == "cog":
+            raise ValueError("incremental run is not possible with profile='cog', use profile=None.")
 
         try:
-            cont = self.verify(overwrite=overwrite)
-            if cont:
+            previous_signatures = {}
+            update = False  # Update blocks of the existing output
+            if incremental:
+                run_signature = self._run_signature(kwargs)
+                if not overwrite:
+                    previous_signatures = self.read_block_signatures(run_signature=run_signature)
+                update = bool(previous_signatures)
+                # Without valid signatures the output is replaced.
+                overwrite = not update
+
+            cont = self.verify(overwrite=overwrite, incremental=update)
+            if cont and not update:
                 self.create()
 
             if cont:
@@ -294,9 +529,28 @@ this is not implemented or tested if it works."
                 gdal_src = self.raster_out.open_gdal_source_write()
                 band_out = gdal_src.GetRasterBand(1)
 
+                instrumentation = self.instrumentation
+                if instrumentation is not None:
+                    instrumentation.reset()
+
+                block_signatures = {}
+                blocks_written = 0
+
                 # Loop over generated blocks and do calculation per block
                 for idx, block_row in self.blocks_df.iterrows():
                     window = block_row["window_readarray"]
+                    if instrumentation is not None:
+                        instrumentation.block(idx)
+
+                    if incremental:
+                        # Skip blocks of which the inputs did not change, try without reading first.
+                        block_id = "_".join(str(int(i)) for i in window)
+                        signature = self._block_signature(window=window)
+                        if signature is not None and signature == previous_signatures.get(block_id):
+                            block_signatures[block_id] = signature
+                            if instrumentation is not None:
+                                instrumentation.skip()
+                            continue
 
                     # Load the blocks for the given window.
                     block = RasterBlocks(
@@ -305,28 +559,65 @@ this is not implemented or tested if it works."
                         nodata_keys=self.nodata_keys,
                         yesdata_dict=self.yesdata_dict,
                         mask_keys=self.mask_keys,
+                        instrumentation=instrumentation,
+                        metadata=self.metadata_raster.metadata,
+                        resample_dict=self.resample_dict,
                     )
 
+                    if incremental:
+                        if signature is None:
+                            signature = self._block_signature(window=window, block=block)
+                        block_signatures[block_id] = signature
+                        if signature == previous_signatures.get(block_id):
+                            if instrumentation is not None:
+                                instrumentation.skip()
+                            continue
+
                     # The blocks have an attribute that can prevent further calculation
                     # if certain conditions are met. It is False when a raster in the
                     # nodata keys has all value as nodata. Output should be nodata as well
                     if block.cont:
                         # Calculate output raster block with custom function.
+                        t0 = time.perf_counter()
                         block_out = self.custom_run_window_function(block=block, **kwargs)
+                        t1 = time.perf_counter()
 
                         band_out.WriteArray(block_out, xoff=window[0], yoff=window[1])
+                        blocks_written += 1
+
+                        if instrumentation is not None:
+                            instrumentation.compute(seconds=t1 - t0)
+                            instrumentation.write(seconds=time.perf_counter() - t1, nbytes=block_out.nbytes)
 
                         if self.verbose:
                             print(
                                 f"{idx} / {blocks_total} ({hrt.time_delta(time_start)}s) - {self.raster_out.name}",
                                 end="\r",
                             )
+                    else:
+                        if update:
+                            # Block can have data from the previous run.
+                            block_out = np.full((int(window[3]), int(window[2])), self.output_nodata)
+                            band_out.WriteArray(block_out, xoff=window[0], yoff=window[1])
+                            blocks_written += 1
+                        if instrumentation is not None:
+                            instrumentation.skip()
 
                 # band_out.FlushCache()  # close file after writing, slow, needed?
                 gdal_src = None  # Very important..
                 band_out = None
+                if self.profile == "cog":
+                    self.raster_out.to_cog()
+                if incremental:
+                    self.block_signatures_path.write_text(
+                        json.dumps({"run": run_signature, "blocks": block_signatures}, indent=1)
+                    )
+                    if self.verbose:
+                        print(f"\nUpdated {blocks_written} of {len(self.blocks_df)} blocks")
                 if self.verbose:
                     print("\nDone")
+                if instrumentation is not None:
+                    instrumentation.log_report()
             else:
                 if self.verbose:
                     print(f"{self.raster_out.name} not created, .verify was false.")
@@ -437,6 +728,8 @@ this is not implemented or tested if it works."
                                 nodata_keys=self.nodata_keys,
                                 yesdata_dict={self.metadata_key: [row_label[label_col]]},
                                 mask_keys=self.mask_keys,
+                                metadata=self.metadata_raster.metadata,
+                                resample_dict=self.resample_dict,
                             )
 
                             # The blocks have an attribute that can prevent further calculation
@@ -462,7 +755,7 @@ this is not implemented or tested if it works."
 
                         if self.verbose:
                             print(
-                                f"{index+1} / {blocks_total} ({hrt.time_delta(time_start)}s) - {stats_json.name}",
+                                f"{index + 1} / {blocks_total} ({hrt.time_delta(time_start)}s) - {stats_json.name}",
                                 end="\r",
                             )
 
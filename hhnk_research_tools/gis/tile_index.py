@@ -0,0 +1,362 @@
+# %%
+import os
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+from osgeo import gdal, gdal_array
+from shapely import geometry
+
+import hhnk_research_tools.logger as logging
+
+logger = logging.get_logger(name=__name__)
+
+gdal.UseExceptions()
+
+TILE_COLUMNS = [
+    "path",
+    "mtime_ns",
+    "size",
+    "x_res",
+    "y_res",
+    "pixel_width",
+    "pixel_height",
+    "nodata",
+    "datatype",
+    "block_width",
+    "block_height",
+    "projection",
+    "geometry",
+]
+MAX_OPEN_TILES = 64  # Tiles kept open by TileIndex.read_window
+TILE_DTYPES = {
+    "mtime_ns": "int64",
+    "size": "int64",
+    "x_res": "int64",
+    "y_res": "int64",
+    "pixel_width": "float64",
+    "pixel_height": "float64",
+    "nodata": "float64",
+    "block_width": "int64",
+    "block_height": "int64",
+}
+
+
+def _read_tile_header(path) -> dict:
+    """Read georeference and band info of a tile, without reading data."""
+    stat = os.stat(path)
+    gdal_src = gdal.Open(str(path), gdal.GA_ReadOnly)
+    x_min, pixel_width, _, y_max, _, pixel_height = gdal_src.GetGeoTransform()
+    band = gdal_src.GetRasterBand(1)
+    block_width, block_height = band.GetBlockSize()
+    nodata = band.GetNoDataValue()
+
+    header = {
+        "path": str(path),
+        "mtime_ns": stat.st_mtime_ns,
+        "size": stat.st_size,
+        "x_res": gdal_src.RasterXSize,
+        "y_res": gdal_src.RasterYSize,
+        "pixel_width": pixel_width,
+        "pixel_height": pixel_height,
+        "nodata": np.nan if nodata is None else nodata,
+        "datatype": gdal.GetDataTypeName(band.DataType),
+        "block_width": block_width,
+        "block_height": block_height,
+        "geometry": geometry.box(
+            minx=x_min,
+            miny=y_max + gdal_src.RasterYSize * pixel_height,
+            maxx=x_min + gdal_src.RasterXSize * pixel_width,
+            maxy=y_max,
+        ),
+        "projection": gdal_src.GetProjection(),
+    }
+    band = None
+    gdal_src = None
+    return header
+
+
+class TileIndex:
+    """Index of the tiles of a mosaic (vrt) with their bounds and header info, stored
+    as a gpkg sidecar next to the vrt (<vrt stem>.tiles.gpkg).
+
+    On update only new or changed tiles (by mtime and size) are opened, their headers
+    are read concurrently. The vrt can be written from the index (write_vrt), so
+    rebuilding a mosaic of thousands of tiles does not open every tile again. This
+    only works when all tiles have the same resolution, nodata, datatype and crs.
+
+    Usage:
+        tile_index = TileIndex.from_vrt(vrt_path)
+        tile_index.update(tile_paths)
+        tile_index.write_vrt(vrt_path)
+
+    Parameters
+    ----------
+    path : str, Path
+        Path of the gpkg.
+    """
+
+    def __init__(self, path):
+        self.path = Path(str(path))
+        self.gdf = None
+        if self.path.exists():
+            self.gdf = gpd.read_file(self.path)
+            if not set(TILE_COLUMNS).issubset(self.gdf.columns):
+                self.gdf = None  # Index of an older version, rebuilt on update
+        if self.gdf is None:
+            self.gdf = gpd.GeoDataFrame(columns=TILE_COLUMNS, geometry="geometry").astype(TILE_DTYPES)
+
+        self._tree = None
+        self._datasets = {}  # Open tiles {path: gdal dataset}, see read_window
+
+    @staticmethod
+    def vrt_index_path(vrt_path) -> Path:
+        """Path of the TileIndex of a vrt."""
+        vrt_path = Path(str(vrt_path))
+        return vrt_path.with_name(f"{vrt_path.stem}.tiles.gpkg")
+
+    @classmethod
+    def from_vrt(cls, vrt_path):
+        """TileIndex stored next to the vrt."""
+        return cls(cls.vrt_index_path(vrt_path))
+
+    def __len__(self):
+        return len(self.gdf)
+
+    @property
+    def tile_paths(self) -> list:
+        return self.gdf["path"].tolist()
+
+    @property
+    def dtype(self) -> np.dtype:
+        """Numpy dtype of the tiles."""
+        gdal_datatype = gdal.GetDataTypeByName(self.gdf["datatype"].iloc[0])
+        return np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(gdal_datatype))
+
+    @property
+    def resolutions(self) -> list:
+        """Unique pixel widths of the tiles."""
+        return self.gdf["pixel_width"].unique().tolist()
+
+    def update(self, tile_paths: list, max_workers: int = 8) -> bool:
+        """Update the index to contain exactly tile_paths. Headers of new and changed
+        tiles are read with max_workers threads. Saves the index when anything changed.
+
+        Returns True when the index changed.
+        """
+        tile_paths = [str(Path(str(p)).absolute()) for p in tile_paths]
+        known = self.gdf.set_index("path")
+
+        to_read = []
+        for tile_path in tile_paths:
+            if tile_path in known.index:
+                stat = os.stat(tile_path)
+                row = known.loc[tile_path]
+                if row["mtime_ns"] == stat.st_mtime_ns and row["size"] == stat.st_size:
+                    continue
+            to_read.append(tile_path)
+        removed = set(known.index) - set(tile_paths)
+
+        if not to_read and not removed:
+            return False
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            headers = list(executor.map(_read_tile_header, to_read))
+
+        crs = self.gdf.crs
+        if crs is None and headers:
+            crs = headers[0]["projection"] or None  # Empty without crs
+        new_df = pd.DataFrame(headers, columns=TILE_COLUMNS).set_index("path")
+
+        unchanged = [p for p in tile_paths if p not in new_df.index]
+        gdf = pd.concat([known.loc[unchanged, TILE_COLUMNS[1:]], new_df]).loc[tile_paths].reset_index()
+        self.gdf = gpd.GeoDataFrame(gdf.astype(TILE_DTYPES), geometry="geometry", crs=crs)
+        self._tree = None
+        self._datasets = {}
+        logger.info(f"Read {len(to_read)} tile headers, removed {len(removed)} tiles from {self.path.name}")
+
+        self.save()
+        return True
+
+    def save(self):
+        self.gdf.to_file(self.path, driver="GPKG")
+
+    @property
+    def tree(self) -> shapely.STRtree:
+        """STRtree over the tile bounds, built on first use."""
+        if self._tree is None:
+            self._tree = shapely.STRtree(self.gdf.geometry.values)
+        return self._tree
+
+    def query(self, bounds) -> np.ndarray:
+        """Positions of the tiles that overlap bounds (xmin, ymin, xmax, ymax). Tiles that
+        only touch the bounds are not included.
+        """
+        bbox = geometry.box(*bounds)
+        overlap = self.tree.query(bbox, predicate="intersects")
+        return np.setdiff1d(overlap, self.tree.query(bbox, predicate="touches"))
+
+    def query_within(self, bounds):
+        """Position of a tile that contains bounds (xmin, ymin, xmax, ymax), None if
+        the bounds are not inside a single tile.
+        """
+        positions = self.tree.query(geometry.box(*bounds), predicate="within")
+        if len(positions) == 0:
+            return None
+        return positions[0]
+
+    def _open_tile(self, tile_path):
+        """Open tile, the last MAX_OPEN_TILES tiles are kept open."""
+        if tile_path not in self._datasets:
+            if len(self._datasets) >= MAX_OPEN_TILES:
+                self._datasets.pop(next(iter(self._datasets)))
+            self._datasets[tile_path] = gdal.Open(tile_path, gdal.GA_ReadOnly)
+        return self._datasets[tile_path]
+
+    def read_window(self, metadata, window, nodata=None):
+        """Read a window of the mosaic directly from the tile that contains it, instead
+        of through the vrt.
+
+        metadata (hrt.RasterMetadata): metadata of the mosaic (vrt).
+        window (list): [x0, y0, xsize, ysize] in pixels of the mosaic.
+        nodata (float): nodata of the mosaic. Nodata of the tile is set to this value
+            when they differ, as the vrt does.
+
+        Returns the array, or None when the window is not inside a single tile with the
+        same resolution and pixel alignment as the mosaic, or when the nodata of the
+        tile cannot be converted to the nodata of the mosaic.
+        """
+        x_min, y_min, x_max, y_max = metadata.window_bounds(window)
+        position = self.query_within((x_min, y_min, x_max, y_max))
+        if position is None:
+            return None
+        tile = self.gdf.iloc[position]
+        if tile["pixel_width"] != metadata.pixel_width or tile["pixel_height"] != metadata.pixel_height:
+            return None
+
+        tile_x_min, _, _, tile_y_max = tile.geometry.bounds
+        xoff = (x_min - tile_x_min) / metadata.pixel_width
+        yoff = (y_max - tile_y_max) / metadata.pixel_height
+        if not (np.isclose(xoff, np.round(xoff)) and np.isclose(yoff, np.round(yoff))):
+            return None
+
+        band = self._open_tile(tile["path"]).GetRasterBand(1)
+        array = band.ReadAsArray(
+            xoff=int(np.round(xoff)),
+            yoff=int(np.round(yoff)),
+            win_xsize=int(window[2]),
+            win_ysize=int(window[3]),
+        )
+
+        tile_nodata = tile["nodata"]
+        if np.isnan(tile_nodata) or tile_nodata == nodata:
+            return array
+        # Nodata of the tile is the nodata of the vrt, read through the vrt when the
+        # vrt has no nodata or it does not fit in the datatype of the tile.
+        if nodata is None:
+            return None
+        with np.errstate(invalid="ignore", over="ignore"):
+            if np.array(nodata).astype(array.dtype) != nodata:
+                return None
+        array[array == tile_nodata] = nodata
+        return array
+
+    def window_has_tiles(self, metadata, window) -> bool:
+        """Check if a window (pixels of the mosaic) overlaps any tile."""
+        return len(self.query(metadata.window_bounds(window))) > 0
+
+    def check_uniform(self):
+        """Raise ValueError when the tiles do not have the same resolution, nodata,
+        datatype and crs, write_vrt only supports uniform tiles.
+        """
+        if len(self) == 0:
+            raise ValueError(f"No tiles in {self.path.name}, run .update first.")
+
+        checks = {
+            "resolutions": self.gdf[["pixel_width", "pixel_height"]].drop_duplicates(),
+            "nodata values": self.gdf["nodata"].drop_duplicates(),  # nan (no nodata) is also a value
+            "datatypes": self.gdf["datatype"].drop_duplicates(),
+            "crs": self.gdf["projection"].fillna("").drop_duplicates(),
+        }
+        for name, values in checks.items():
+            if len(values) > 1:
+                raise ValueError(
+                    f"Tiles in {self.path.name} have different {name} ({values.to_numpy().tolist()}), use gdal.BuildVRT."
+                )
+
+    def write_vrt(self, vrt_path, bounds=None):
+        """Write a vrt of all tiles from the index, without opening the tiles.
+        Only single band tiles with the same resolution, nodata, datatype and crs are
+        supported (see check_uniform), use gdal.BuildVRT otherwise.
+
+        bounds (list): (xmin, ymin, xmax, ymax), None uses the bounds of the tiles.
+        """
+        vrt_path = Path(str(vrt_path)).absolute()
+        self.check_uniform()
+
+        gdf = self.gdf
+        if bounds is None:
+            bounds = gdf.total_bounds
+        else:
+            gdf = gdf[gdf.intersects(geometry.box(*bounds))]
+        x_min, y_min, x_max, y_max = bounds
+        pixel_width = self.gdf["pixel_width"].iloc[0]
+        pixel_height = self.gdf["pixel_height"].iloc[0]
+
+        nodata_values = self.gdf["nodata"].dropna()
+        nodata = None if nodata_values.empty else nodata_values.iloc[0]
+
+        vrt = ET.Element(
+            "VRTDataset",
+            rasterXSize=str(int(round((x_max - x_min) / pixel_width))),
+            rasterYSize=str(int(round((y_max - y_min) / abs(pixel_height)))),
+        )
+        if self.gdf.crs is not None:
+            ET.SubElement(vrt, "SRS", dataAxisToSRSAxisMapping="1,2").text = self.gdf.crs.to_wkt()
+        ET.SubElement(vrt, "GeoTransform").text = f"{x_min}, {pixel_width}, 0, {y_max}, 0, {pixel_height}"
+
+        band = ET.SubElement(vrt, "VRTRasterBand", dataType=self.gdf["datatype"].iloc[0], band="1")
+        if nodata is not None:
+            ET.SubElement(band, "NoDataValue").text = repr(float(nodata))
+
+        for _, tile in gdf.iterrows():
+            source = ET.SubElement(band, "ComplexSource")
+            try:
+                filename = os.path.relpath(tile["path"], vrt_path.parent)
+                relative = "1"
+            except ValueError:  # Other drive on Windows
+                filename = tile["path"]
+                relative = "0"
+            ET.SubElement(source, "SourceFilename", relativeToVRT=relative).text = filename
+            ET.SubElement(source, "SourceBand").text = "1"
+            ET.SubElement(
+                source,
+                "SourceProperties",
+                RasterXSize=str(tile["x_res"]),
+                RasterYSize=str(tile["y_res"]),
+                DataType=tile["datatype"],
+                BlockXSize=str(tile["block_width"]),
+                BlockYSize=str(tile["block_height"]),
+            )
+            ET.SubElement(source, "SrcRect", xOff="0", yOff="0", xSize=str(tile["x_res"]), ySize=str(tile["y_res"]))
+            tile_x_min, _, _, tile_y_max = tile.geometry.bounds
+            ET.SubElement(
+                source,
+                "DstRect",
+                xOff=str((tile_x_min - x_min) / pixel_width),
+                yOff=str((tile_y_max - y_max) / pixel_height),
+                xSize=str(tile["x_res"]),
+                ySize=str(tile["y_res"]),
+            )
+            if not np.isnan(tile["nodata"]):
+                ET.SubElement(source, "NODATA").text = repr(float(tile["nodata"]))
+
+        ET.indent(vrt)
+        ET.ElementTree(vrt).write(vrt_path)
+
+    def __repr__(self):
+        return f"TileIndex({self.path.name}, {len(self)} tiles)"
@@ -5,9 +5,22 @@ This is applied by default in the __init__ of hhnk_research_tools. So when it is
 in a project, the logging will be set according to these rules.
 """
 
+import atexit
+import itertools
+import json
 import logging
+import logging.config
+import logging.handlers
+import math
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from logging import *  # noqa: F401,F403 # type: ignore
 
+METRICS_LOGGER_NAME = "hhnk_research_tools.metrics"
+_metrics_ids = itertools.count()  # Names of the loggers of unnamed Metrics instances
+
 
 def get_logconfig_dict(level_root="WARNING", level_dict=None, log_filepath=None):
     """Make a dict for the logging.
@@ -126,3 +139,169 @@ def get_logger(name: str, level=None):
     if level is not None:
         logger.setLevel(level)
     return logger
+
+
+class JsonFormatter(logging.Formatter):
+    """Format records as one json object per line (JSON lines).
+    The dict passed as extra={"metric": {...}} is added to the object.
+    """
+
+    def format(self, record):
+        data = {
+            "time": record.created,
+            "level": record.levelname,
+            "name": record.name,
+            "message": record.getMessage(),
+        }
+        metric = getattr(record, "metric", None)
+        if metric is not None:
+            data.update(metric)
+        if record.exc_info:
+            data["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class Metrics:
+    """Counters, timers and histograms, written as JSON lines to a file.
+
+    Records are put on a queue and written by a background thread (QueueHandler and
+    QueueListener), so emitting a metric does not wait for disk io. Metrics are
+    disabled by default; all methods return immediately until enable() is called.
+    Totals are kept in memory and written as one 'summary' record on disable().
+
+    Usage:
+        hrt.logging.metrics.enable("metrics.jsonl")
+        hrt.logging.metrics.incr("rows", 10, table="peilgebied")
+        with hrt.logging.metrics.timer("calculation"):
+            ...
+        hrt.logging.metrics.disable()  # flushes the queue
+
+    Hot code should check metrics.enabled before doing extra work (e.g. timing).
+
+    Every instance writes to its own child logger of METRICS_LOGGER_NAME, so multiple
+    instances do not write records to each other's files.
+
+    Parameters
+    ----------
+    name : str
+        Name of the child logger, defaults to a unique number.
+    """
+
+    def __init__(self, name: str = None):
+        self.enabled = False
+        if name is None:
+            name = str(next(_metrics_ids))
+        self._logger = logging.getLogger(f"{METRICS_LOGGER_NAME}.{name}")
+        self._logger.propagate = False
+        self._lock = threading.Lock()
+        self._listener = None
+        self._queue_handler = None
+        self._file_handler = None
+        self.reset()
+
+    def reset(self):
+        """Remove the totals."""
+        with self._lock:
+            self.counters = {}  # {name: total}
+            self.timers = {}  # {name: [count, total, min, max]}
+            self.histograms = {}  # {name: {"stats": [count, total, min, max], "buckets": {upper: count}}}
+
+    def enable(self, filepath, mode: str = "a"):
+        """Start writing metrics to filepath (JSON lines)."""
+        if self.enabled:
+            self.disable()
+
+        self._file_handler = logging.FileHandler(str(filepath), mode=mode)
+        self._file_handler.setFormatter(JsonFormatter())
+        metrics_queue = queue.SimpleQueue()
+        self._queue_handler = logging.handlers.QueueHandler(metrics_queue)
+        self._logger.addHandler(self._queue_handler)
+        self._logger.setLevel(logging.INFO)
+        self._listener = logging.handlers.QueueListener(metrics_queue, self._file_handler)
+        self._listener.start()
+        self.enabled = True
+
+    def disable(self):
+        """Write the summary, flush the queue and close the file."""
+        if not self.enabled:
+            return
+        self._emit("summary", "summary", None, self.summary())
+        self.enabled = False
+        self._listener.stop()  # Writes all records that are still in the queue
+        self._logger.removeHandler(self._queue_handler)
+        self._file_handler.close()
+        self._listener = self._queue_handler = self._file_handler = None
+
+    def _emit(self, kind, name, value, tags):
+        self._logger.info(name, extra={"metric": {"type": kind, "metric": name, "value": value, **tags}})
+
+    @staticmethod
+    def _update_stats(stats, value):
+        if stats is None:
+            return [1, value, value, value]
+        stats[0] += 1
+        stats[1] += value
+        stats[2] = min(stats[2], value)
+        stats[3] = max(stats[3], value)
+        return stats
+
+    def incr(self, name: str, value=1, **tags):
+        """Add value to counter name."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+        self._emit("counter", name, value, tags)
+
+    def timing(self, name: str, seconds: float, **tags):
+        """Record a duration in seconds."""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.timers[name] = self._update_stats(self.timers.get(name), seconds)
+        self._emit("timer", name, seconds, tags)
+
+    @contextmanager
+    def timer(self, name: str, **tags):
+        """Time the with block."""
+        if not self.enabled:
+            yield
+            return
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timing(name, time.perf_counter() - t0, **tags)
+
+    def histogram(self, name: str, value: float, **tags):
+        """Record a value in a histogram with power of 2 buckets (upper bounds)."""
+        if not self.enabled:
+            return
+        bucket = 0 if value <= 0 else 2 ** math.ceil(math.log2(value))
+        with self._lock:
+            hist = self.histograms.setdefault(name, {"stats": None, "buckets": {}})
+            hist["stats"] = self._update_stats(hist["stats"], value)
+            hist["buckets"][bucket] = hist["buckets"].get(bucket, 0) + 1
+        self._emit("histogram", name, value, tags)
+
+    def summary(self) -> dict:
+        """Totals of all counters, timers and histograms."""
+
+        def stats_dict(stats):
+            count, total, vmin, vmax = stats
+            return {"count": count, "total": total, "mean": total / count, "min": vmin, "max": vmax}
+
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "timers": {name: stats_dict(stats) for name, stats in self.timers.items()},
+                "histograms": {
+                    name: {**stats_dict(hist["stats"]), "buckets": dict(sorted(hist["buckets"].items()))}
+                    for name, hist in self.histograms.items()
+                },
+            }
+
+
+# Shared instance, used by the hrt functions that emit metrics.
+metrics = Metrics(name="default")
+atexit.register(metrics.disable)
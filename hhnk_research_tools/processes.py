@@ -1,57 +1,394 @@
 # -*- coding: utf-8 -*-
+import math
 import multiprocessing as mp
+from multiprocessing import shared_memory
 
+import numpy as np
+import pandas as pd
+import shapely
 from tqdm import tqdm
 
+# Target function and shared kwargs, set once per worker by _init_worker.
+_worker = {}
 
-def multiprocess(df, target_function, processes=mp.cpu_count(), use_pbar=True, stepsize=None, **kwargs):
+
+def _attach_shared_array(name, shape, dtype):
+    return SharedArray(name=name, shape=shape, dtype=dtype)
+
+
+class SharedArray:
+    """Numpy array in shared memory. The object is pickled as the name of the memory
+    block, so workers attach to the same memory without copying the data. Attached
+    arrays are read-only.
+
+    The process that created the array owns the memory and should call unlink() when
+    the workers are done. BatchedPool(share_memory=True) does this when the pool exits.
+
+    Parameters
+    ----------
+    array : np.ndarray
+        Array to copy into shared memory. Only numeric dtypes are supported.
+    name, shape, dtype :
+        Attach to an existing block, used when unpickling.
+    """
+
+    def __init__(self, array=None, name=None, shape=None, dtype=None):
+        if array is not None:
+            array = np.ascontiguousarray(array)
+            if array.dtype == object:
+                raise TypeError("SharedArray does not support object arrays, use SharedGeometries for geometries")
+            # Size 0 is not allowed for shared memory
+            self._shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            self.array = np.ndarray(array.shape, dtype=array.dtype, buffer=self._shm.buf)
+            self.array[...] = array
+            self.owner = True
+        else:
+            self._shm = shared_memory.SharedMemory(name=name)
+            self.array = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf)
+            self.array.flags.writeable = False
+            self.owner = False
+
+    @property
+    def name(self):
+        return self._shm.name
+
+    def __len__(self):
+        return len(self.array)
+
+    def __getitem__(self, item):
+        return self.array[item]
+
+    def __reduce__(self):
+        return (_attach_shared_array, (self.name, self.array.shape, self.array.dtype.str))
+
+    def close(self):
+        """Release the array of this process."""
+        self.array = None
+        try:
+            self._shm.close()
+        except BufferError:
+            pass  # Views of the array still exist, the memory is released when they are deleted.
+
+    def unlink(self):
+        """Close and free the shared memory, only by the owner."""
+        self.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+class SharedGeometries:
+    """Read-only geometries in shared memory, stored as one WKB blob with offsets.
+    Workers attach without copying; single geometries are decoded on access.
+
+    Usage in the target function:
+        geometry = shared_geometries[idx]  # shapely geometry
+        geometries = shared_geometries.geometries  # all geometries as np.ndarray
+
+    Parameters
+    ----------
+    geometries : gpd.GeoSeries, np.ndarray, list
+        Shapely geometries, None for missing geometries.
+    """
+
+    def __init__(self, geometries):
+        wkb = shapely.to_wkb(np.asarray(geometries, dtype=object))
+        lengths = np.fromiter((0 if b is None else len(b) for b in wkb), dtype=np.int64, count=len(wkb))
+        offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(lengths)
+
+        blob = np.frombuffer(b"".join(b for b in wkb if b is not None), dtype=np.uint8)
+        self.blob = SharedArray(blob)
+        self.offsets = SharedArray(offsets)
+        self.crs = getattr(geometries, "crs", None)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, idx):
+        start, end = self.offsets[idx], self.offsets[idx + 1]
+        if start == end:
+            return None
+        return shapely.from_wkb(self.blob.array[start:end].tobytes())
+
+    @property
+    def geometries(self) -> np.ndarray:
+        """Decode all geometries."""
+        offsets = self.offsets.array
+        blob = self.blob.array
+        wkb = np.array(
+            [blob[start:end].tobytes() if end > start else None for start, end in zip(offsets[:-1], offsets[1:])],
+            dtype=object,
+        )
+        return shapely.from_wkb(wkb)
+
+    def close(self):
+        self.blob.close()
+        self.offsets.close()
+
+    def unlink(self):
+        self.blob.unlink()
+        self.offsets.unlink()
+
+
+class SharedGeoDataFrame:
+    """GeoDataFrame in shared memory. The geometry column is stored as SharedGeometries,
+    numeric, bool and datetime columns and a numeric index as SharedArray. Other columns
+    (e.g. strings) cannot be shared, these are pickled with the object.
+
+    BatchedPool passes it to the target function as a GeoDataFrame, which is built
+    once per worker with to_gdf.
+
+    Parameters
+    ----------
+    gdf : gpd.GeoDataFrame
+    """
+
+    def __init__(self, gdf):
+        self.columns = list(gdf.columns)
+        self.geometry_name = gdf.geometry.name
+        self.crs = gdf.crs
+
+        self.data = {}  # {column: SharedArray | SharedGeometries | np.ndarray}
+        for col in self.columns:
+            if col == self.geometry_name:
+                self.data[col] = SharedGeometries(gdf[col].values)
+            else:
+                self.data[col] = _to_shared_array(gdf[col].to_numpy())
+        self.index = _to_shared_array(gdf.index.to_numpy())
+        self.index_name = gdf.index.name
+
+    def __len__(self):
+        return len(self.index)
+
+    def _shared(self) -> list:
+        return [v for v in [*self.data.values(), self.index] if isinstance(v, (SharedArray, SharedGeometries))]
+
+    def to_gdf(self):
+        """Build the GeoDataFrame, geometries are decoded and arrays are copied."""
+        import geopandas as gpd
+
+        data = {}
+        for col, value in self.data.items():
+            if isinstance(value, SharedGeometries):
+                data[col] = value.geometries
+            elif isinstance(value, SharedArray):
+                data[col] = value.array.copy()
+            else:
+                data[col] = value
+        index = self.index.array.copy() if isinstance(self.index, SharedArray) else self.index
+        return gpd.GeoDataFrame(
+            data,
+            columns=self.columns,
+            index=pd.Index(index, name=self.index_name),
+            geometry=self.geometry_name,
+            crs=self.crs,
+        )
+
+    def close(self):
+        for shared in self._shared():
+            shared.close()
+
+    def unlink(self):
+        for shared in self._shared():
+            shared.unlink()
+
+
+def _to_shared_array(array):
+    """SharedArray for numeric arrays, other arrays are returned unchanged."""
+    if array.dtype.kind in "biufcmM":
+        return SharedArray(array)
+    return array
+
+
+def _to_shared(value):
+    """Put numeric arrays and geometries in shared memory, return other values unchanged."""
+    if isinstance(value, np.ndarray) and value.dtype != object:
+        return SharedArray(value)
+    if isinstance(value, pd.Series) and hasattr(value, "crs"):  # GeoSeries
+        return SharedGeometries(value)
+    if isinstance(value, pd.DataFrame) and hasattr(value, "set_geometry"):  # GeoDataFrame
+        return SharedGeoDataFrame(value)
+    return value
+
+
+def _from_shared(value):
+    """Value as passed to the target function."""
+    if isinstance(value, SharedArray):
+        return value.array
+    if isinstance(value, SharedGeoDataFrame):
+        return value.to_gdf()
+    return value
+
+
+def _init_worker(target_function, kwargs):
+    _worker["target_function"] = target_function
+    # Shared arrays are passed as (read-only) np.ndarray, SharedGeoDataFrame as
+    # GeoDataFrame and SharedGeometries as is.
+    _worker["kwargs"] = {k: _from_shared(v) for k, v in kwargs.items()}
+
+
+def _run_batch(batch):
+    """Run the target function on every item of a batch. Returns [(idx, result), ...]."""
+    start, chunk = batch
+    target_function = _worker["target_function"]
+    kwargs = _worker["kwargs"]
+
+    if isinstance(chunk, pd.DataFrame):
+        items = chunk.iterrows()
+    else:
+        items = enumerate(chunk, start)
+    return [(idx, target_function(idx, item, **kwargs)) for idx, item in items]
+
+
+class BatchedPool:
+    """Process pool that calls target_function(idx, item, **kwargs) on every row of a
+    DataFrame or every item of an array/list. The pool is kept alive between calls,
+    work is sent in batches of chunksize items and kwargs are sent only once per
+    worker (through the pool initializer), so cheap functions are not dominated by
+    the overhead of pickling every single task.
+
+    !!!!!
+    WINDOWS WARNING: DOES NOT WORK IF target_function IS IN THE SAME NOTEBOOK. THIS SHOULD BE DEFINED IN A SEPARATE
+    .py FILE THAT IS IMPORTED WHERE YOU CALL THE FUNCTION.
+    !!!!!
+
+    Usage:
+        with BatchedPool(target_function, processes=4, raster=raster) as pool:
+            results = pool.map(df)
+
+    Parameters
+    ----------
+    target_function : callable
+        function(idx, item, **kwargs). For a DataFrame idx is the index and item the row
+        (like df.iterrows()), for arrays and lists idx is the position.
+    processes : int
+        Number of worker processes.
+    chunksize : int
+        Number of items per batch. None uses about 4 batches per process.
+    share_memory : bool
+        Put large kwargs in shared memory instead of copying them to every worker;
+        numeric np.ndarray become read-only arrays and GeoSeries become SharedGeometries
+        in the target function. GeoDataFrames are shared as SharedGeoDataFrame and
+        passed as GeoDataFrame. The memory is freed when the pool exits.
+    **kwargs
+        Passed to every call of target_function.
+    """
+
+    def __init__(self, target_function, processes=mp.cpu_count(), chunksize=None, share_memory=False, **kwargs):
+        self.target_function = target_function
+        self.processes = processes
+        self.chunksize = chunksize
+
+        # Shared memory created by this pool, freed on close.
+        self._shared = []
+        if share_memory:
+            kwargs = {k: _to_shared(v) for k, v in kwargs.items()}
+            self._shared = [
+                v for v in kwargs.values() if isinstance(v, (SharedArray, SharedGeometries, SharedGeoDataFrame))
+            ]
+        self.kwargs = kwargs
+
+        self.pool = mp.Pool(processes=processes, initializer=_init_worker, initargs=(target_function, kwargs))
+
+    def _batches(self, data, start, end, chunksize):
+        """Split data[start:end] in slices of chunksize."""
+        for batch_start in range(start, end, chunksize):
+            batch_end = min(batch_start + chunksize, end)
+            if isinstance(data, pd.DataFrame):
+                yield batch_start, data.iloc[batch_start:batch_end]
+            else:
+                yield batch_start, data[batch_start:batch_end]
+
+    def imap(self, data, ordered=True, stepsize=None, callback=None, use_pbar=False):
+        """Yield (idx, result) for every item of data.
+
+        Parameters
+        ----------
+        data : pd.DataFrame, np.ndarray, list
+        ordered : bool
+            Yield results in the order of data. If False results are yielded as soon as
+            their batch is finished.
+        stepsize : int
+            Only send stepsize items to the pool at once, limits the memory use for
+            very large inputs. None sends everything.
+        callback : callable
+            Called as callback(nr_done, nr_total) after every finished batch.
+        use_pbar : bool
+            Show a tqdm progressbar.
+        """
+        total = len(data)
+        chunksize = self.chunksize
+        if chunksize is None:
+            chunksize = max(1, math.ceil(total / (self.processes * 4)))
+        if stepsize is None:
+            stepsize = max(total, 1)
+
+        imap_func = self.pool.imap if ordered else self.pool.imap_unordered
+        pbar = tqdm(total=total, unit="row") if use_pbar else None
+
+        done = 0
+        try:
+            for step_start in range(0, total, stepsize):
+                step_end = min(step_start + stepsize, total)
+                for batch_result in imap_func(_run_batch, self._batches(data, step_start, step_end, chunksize)):
+                    done += len(batch_result)
+                    if pbar is not None:
+                        pbar.update(len(batch_result))
+                    if callback is not None:
+                        callback(done, total)
+                    yield from batch_result
+        finally:
+            if pbar is not None:
+                pbar.close()
+
+    def map(self, data, stepsize=None, callback=None, use_pbar=False) -> list:
+        """Return list with the result for every item of data, in the order of data.
+        See imap for the parameters.
+        """
+        return [
+            result
+            for _, result in self.imap(data, ordered=True, stepsize=stepsize, callback=callback, use_pbar=use_pbar)
+        ]
+
+    def _unlink_shared(self):
+        for shared in self._shared:
+            shared.unlink()
+        self._shared = []
+
+    def close(self):
+        """Wait for the workers to finish and stop the pool."""
+        self.pool.close()
+        self.pool.join()
+        self._unlink_shared()
+
+    def terminate(self):
+        """Stop the workers immediately."""
+        self.pool.terminate()
+        self.pool.join()
+        self._unlink_shared()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+def multiprocess(
+    df, target_function, processes=mp.cpu_count(), use_pbar=True, stepsize=None, share_memory=False, **kwargs
+):
     """Input every row of the df in the target function. the target function should always contain (idx,row) as the first two arguments
     subsequent arguments are passed with the kwargs.
     Stepsize splits the dataframe into smaller pieces to prevent the loop from breaking.
+    Rows are sent to one pool in batches, see BatchedPool.
+    share_memory passes large arrays, GeoSeries and GeoDataFrames in the kwargs through shared memory.
     !!!!!
     WINDOWS WARNING: DOES NOT WORK IF target_function IS IN THE SAME NOTEBOOK. THIS SHOULD BE DEFINED IN A SEPARATE
     .py FILE THAT IS IMPORTED WHERE YOU CALL THE FUNCTION.
     !!!!!
     """
-
-    if stepsize == None:
-        stepsize = len(df)
-
-    def update_pbar(*a):
-        """show progress of the function"""
-        pbar.update()
-
-    def main_multi():
-        multi_step = {0: 0}
-        results_local = {}
-        i = 0
-        while multi_step[i] != len(df):
-            i += 1
-            multi_step[i] = min(multi_step[i - 1] + stepsize, len(df))
-
-            # Apply async with or without progressbar
-            with mp.Pool(processes=processes) as pool:
-                results_local[i] = [
-                    pool.apply_async(
-                        target_function,
-                        args=(idx, row),
-                        kwds=kwargs,
-                        callback=update_pbar,
-                    )
-                    for idx, row in df.iloc[multi_step[i - 1] : multi_step[i]].iterrows()
-                ]
-                results_local[i] = [p.get() for p in results_local[i]]
-        return results_local
-
-    # Call target function with or without pbar
-    if use_pbar == True:
-        with tqdm(total=len(df), unit="row") as pbar:
-            results_local = main_multi()
-    else:
-        results_local = main_multi()
-
-    # combine results
-    results = []
-    for i in results_local:
-        results.extend(results_local[i])
-    return results
+    with BatchedPool(target_function, processes=processes, share_memory=share_memory, **kwargs) as pool:
+        return pool.map(df, stepsize=stepsize, use_pbar=use_pbar)
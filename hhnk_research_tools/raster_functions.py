@@ -1,10 +1,10 @@
 # %%
 import datetime
 import json
+import time
 import types
 
 import numpy as np
-from IPython.display import display
 from osgeo import gdal, ogr
 
 import hhnk_research_tools.logger as logging
@@ -14,10 +14,26 @@ from hhnk_research_tools.general_functions import (
     ensure_file_path,
 )
 from hhnk_research_tools.gis.raster import Raster, RasterMetadata
+from hhnk_research_tools.gis.tile_index import TileIndex
 from hhnk_research_tools.variables import DEF_TRGT_CRS, GDAL_DATATYPE, GEOTIFF
 
 DEFAULT_CREATE_OPTIONS = ["COMPRESS=ZSTD", "TILED=YES", "PREDICTOR=2", "ZSTD_LEVEL=1"]
 
+# Cloud Optimized GeoTIFF profile
+COG = "cog"
+COG_MAX_Z_ERROR = 0.001  # Max error of the lossy LERC compression of floats (1mm for depths)
+FLOAT_DATATYPES = [gdal.GDT_Float32, gdal.GDT_Float64]
+
+# Integer datatypes from small to large, used by get_smallest_datatype.
+INT_DATATYPES = [
+    (np.uint8, gdal.GDT_Byte),
+    (np.int16, gdal.GDT_Int16),
+    (np.uint16, gdal.GDT_UInt16),
+    (np.int32, gdal.GDT_Int32),
+    (np.uint32, gdal.GDT_UInt32),
+]
+AUTO = "auto"
+
 
 logger = logging.getLogger(name=__name__)
 
@@ -137,11 +153,15 @@ def gdf_to_raster(
     then rasterized.
     wsa.polygon_to_raster(polygon_gdf=mask_gdf[mask_type], valuefield='val', raster_output_path=mask_path[mask_type],
     nodata=0, meta=meta, epsg=28992, driver='GTiff')
+    datatype='auto' uses the smallest datatype that fits the values of value_field and nodata.
     """
     try:
         if type(raster_out) == Raster:
             raster_out = raster_out.path
 
+        if datatype == AUTO:
+            datatype = get_smallest_datatype(values=gdf[value_field], nodata=nodata)
+
         gdf = gdf[[value_field, "geometry"]]  # filter unnecessary columns
         ogr_ds, polygon = _gdf_to_ogr(gdf, epsg)
         # make sure folders exist
@@ -168,7 +188,98 @@ def gdf_to_raster(
         raise e
 
 
+# Datatypes
+def get_smallest_datatype(values, nodata=None) -> int:
+    """Smallest gdal datatype that fits all values and nodata.
+
+    Values that are all whole numbers get the smallest integer type that fits the range
+    of values and nodata, e.g. Byte for landuse. Other values (decimals, nan) get
+    Float32, or Float64 when they do not fit in Float32.
+
+    values (np.ndarray, pd.Series): values to store, e.g. a raster array.
+    nodata (float): nodata value of the output raster.
+    """
+    values = np.asarray(values).ravel()
+    if values.dtype == bool:
+        values = values.astype(np.uint8)
+    if nodata is not None:
+        values = np.append(values, nodata)
+    if values.size == 0:
+        return gdal.GDT_Byte
+
+    if np.issubdtype(values.dtype, np.floating):
+        finite = values[np.isfinite(values)]
+        if finite.size < values.size or np.any(np.mod(finite, 1) != 0):
+            # nan, inf or decimals can only be stored as float
+            if np.max(np.abs(finite), initial=0) > np.finfo(np.float32).max:
+                return gdal.GDT_Float64
+            return gdal.GDT_Float32
+
+    vmin, vmax = values.min(), values.max()
+    for np_dtype, gdal_datatype in INT_DATATYPES:
+        info = np.iinfo(np_dtype)
+        if info.min <= vmin and vmax <= info.max:
+            return gdal_datatype
+    return gdal.GDT_Float64
+
+
+def scale_to_int(raster_array, nodata, decimals: int):
+    """Store floats as integers, value * 10**decimals (like run_label_stats). Nodata is
+    not scaled. Set the scale (10**-decimals) on the band, so gdal and other readers
+    that apply it get the original values back.
+
+    Returns the scaled array and the scale.
+    """
+    nodata_mask = raster_array == nodata
+    if np.issubdtype(raster_array.dtype, np.floating):
+        nodata_mask |= np.isnan(raster_array)
+
+    scaled = np.round(raster_array * 10**decimals)
+    if np.any(scaled[~nodata_mask] == nodata):
+        raise ValueError(f"Scaled values collide with nodata ({nodata}), use another nodata or less decimals")
+    scaled[nodata_mask] = nodata
+    return scaled, 10**-decimals
+
+
 # Saving
+def get_create_options(datatype=GDAL_DATATYPE, profile=None) -> list:
+    """GTiff creation options for writing a raster block by block.
+
+    profile=None returns DEFAULT_CREATE_OPTIONS.
+    profile='cog' uses lossless, datatype aware compression with multithreading; ZSTD
+    with the floating point predictor (PREDICTOR=3) for floats and PREDICTOR=2 for
+    integers. Convert the raster with Raster.to_cog when it is finished, to add
+    overviews and the COG layout. The lossy LERC compression of floats is only applied
+    there, so the error is not applied twice.
+    """
+    if profile is None:
+        return DEFAULT_CREATE_OPTIONS
+    if profile != COG:
+        raise ValueError(f"profile should be None or '{COG}', got {profile}")
+
+    predictor = "PREDICTOR=3" if datatype in FLOAT_DATATYPES else "PREDICTOR=2"
+    compression = ["COMPRESS=ZSTD", predictor, "ZSTD_LEVEL=1"]
+    return compression + ["TILED=YES", "BLOCKXSIZE=512", "BLOCKYSIZE=512", "NUM_THREADS=ALL_CPUS", "BIGTIFF=IF_SAFER"]
+
+
+def get_cog_options(datatype=GDAL_DATATYPE, max_z_error=COG_MAX_Z_ERROR, overviews=True, resampling="average") -> list:
+    """Creation options of the gdal COG driver; LERC_ZSTD with max_z_error for floats
+    and ZSTD with a predictor for integers, internal overviews and multithreading.
+    https://gdal.org/drivers/raster/cog.html
+    """
+    if datatype in FLOAT_DATATYPES:
+        compression = ["COMPRESS=LERC_ZSTD", f"MAX_Z_ERROR={max_z_error}", "LEVEL=1"]
+    else:
+        compression = ["COMPRESS=ZSTD", "PREDICTOR=YES", "LEVEL=1"]
+    return compression + [
+        "BLOCKSIZE=512",
+        "NUM_THREADS=ALL_CPUS",
+        "BIGTIFF=IF_SAFER",
+        f"OVERVIEWS={'AUTO' if overviews else 'NONE'}",
+        f"OVERVIEW_RESAMPLING={resampling.upper()}",
+    ]
+
+
 def _set_band_data(data_source, num_bands, nodata):
     try:
         for i in range(1, num_bands + 1):
@@ -190,9 +301,12 @@ def create_new_raster_file(
     num_bands=1,
     create_options=None,
     overwrite=False,
+    profile=None,
 ):
     """
     ONLY FOR SINGLE BAND
+    profile (str): None or 'cog', creation options when create_options is None.
+        See get_create_options.
     https://gdal.org/drivers/raster/gtiff.html#creation-options
     https://kokoalberti.com/articles/geotiff-compression-optimization-guide/
     Create new empty gdal raster using metadata from raster from sqlite (dem)
@@ -217,7 +331,7 @@ def create_new_raster_file(
             # options=[f"COMPRESS=LERC_DEFLATE", f"TILED=YES", "PREDICTOR=2", "ZSTD_LEVEL=1", "MAX_Z_ERROR=0.001"]
             # elif datatype==gdal.GDT_Int16:
             # options=[f"COMPRESS=LERC_ZSTD", f"TILED=YES", "PREDICTOR=2", "ZSTD_LEVEL=1", "MAX_Z_ERROR=0.001"]
-            create_options = DEFAULT_CREATE_OPTIONS
+            create_options = get_create_options(datatype=datatype, profile=profile)
 
             # else:
             #     options = [f"COMPRESS=DEFLATE", f"TILED=YES", "PREDICTOR=2", "ZSTD_LEVEL=1"]
@@ -257,6 +371,7 @@ def save_raster_array_to_tiff(
     create_options=None,
     num_bands=1,
     overwrite=False,
+    decimals=None,
 ):
     """
     ONLY FOR SINGLE BAND
@@ -266,11 +381,20 @@ def save_raster_array_to_tiff(
     raster_array (values to be converted to tif)
     nodata (nodata value)
     metadata (dictionary)
-    datatype -> gdal.GDT_Float32
+    datatype -> gdal.GDT_Float32, 'auto' uses the smallest datatype that fits the values
+        and nodata, see get_smallest_datatype.
     compression -> 'DEFLATE'
     num_bands -> 1
+    decimals -> store floats as integers (value * 10**decimals) with the scale set on
+        the band, see scale_to_int. Use with datatype='auto'.
     """
     try:
+        scale = None
+        if decimals is not None:
+            raster_array, scale = scale_to_int(raster_array=raster_array, nodata=nodata, decimals=decimals)
+        if datatype == AUTO:
+            datatype = get_smallest_datatype(values=raster_array, nodata=nodata)
+
         target_ds = create_new_raster_file(
             file_name=output_file,
             nodata=nodata,
@@ -281,19 +405,42 @@ def save_raster_array_to_tiff(
         )  # create new raster
         if target_ds is not None:  # is None when raster already exists and was not overwritten.
             for i in range(1, num_bands + 1):
-                target_ds.GetRasterBand(i).WriteArray(raster_array)  # fill file with data
+                band = target_ds.GetRasterBand(i)
+                band.WriteArray(raster_array)  # fill file with data
+                if scale is not None:
+                    band.SetScale(scale)
+                    band.SetOffset(0)
+                band = None
             target_ds = None
     except Exception as e:
         raise e
 
 
-def build_vrt(raster_folder, vrt_name="combined_rasters", bandlist=[1], bounds=None, overwrite=False):
+def build_vrt(
+    raster_folder,
+    vrt_name="combined_rasters",
+    bandlist=[1],
+    bounds=None,
+    overwrite=False,
+    cog_file=None,
+    from_index=False,
+):
     """create vrt from all rasters in a folder.
 
+    The headers of the rasters are cached in a tile index next to the vrt
+    ({vrt_name}.tiles.gpkg, see hrt.TileIndex). On a rebuild only new or changed
+    rasters are opened.
+
     raster_folder (str)
     bounds (np.array): format should be; (xmin, ymin, xmax, ymax),
         if None will use input files.
-    bandList doesnt work as expected, passing [1] works."""
+    bandList doesnt work as expected, passing [1] works.
+    cog_file (str, Path): also write the mosaic to this Cloud Optimized GeoTIFF, with
+        multithreaded compression. Should be outside raster_folder.
+    from_index (bool): write the vrt from the tile index instead of with gdal.BuildVRT,
+        so the rasters are not opened. Only for rasters with the same resolution,
+        nodata, datatype and crs (see hrt.TileIndex.check_uniform).
+    """
     raster_folder = Folder(raster_folder)
     output_path = raster_folder.full_path(f"{vrt_name}.vrt")
 
@@ -303,26 +450,30 @@ def build_vrt(raster_folder, vrt_name="combined_rasters", bandlist=[1], bounds=N
 
     tifs_list = [str(i) for i in raster_folder.find_ext(["tif", "tiff"])]
 
-    resolutions = []
-    for r in tifs_list:
-        r = Raster(r)
-        resolutions.append(r.metadata.pixel_width)
-    if len(np.unique(resolutions)) > 1:
+    tile_index = TileIndex.from_vrt(output_path.path)
+    tile_index.update(tifs_list)
+    resolutions = tile_index.resolutions
+    if len(resolutions) > 1:
         raise Exception(f"Multiple resolutions ({resolutions}) found in folder. We cannot handle that yet.")
 
-    vrt_options = gdal.BuildVRTOptions(
-        resolution="highest",
-        separate=False,
-        resampleAlg="nearest",
-        addAlpha=False,
-        outputBounds=bounds,
-        bandList=bandlist,
-    )
-    ds = gdal.BuildVRT(destName=str(output_path), srcDSOrSrcDSTab=tifs_list, options=vrt_options)
-    ds.FlushCache()
+    if from_index and bandlist == [1]:
+        tile_index.write_vrt(output_path.path, bounds=bounds)
+    else:
+        vrt_options = gdal.BuildVRTOptions(
+            resolution="highest",
+            separate=False,
+            resampleAlg="nearest",
+            addAlpha=False,
+            outputBounds=bounds,
+            bandList=bandlist,
+        )
+        ds = gdal.BuildVRT(destName=str(output_path), srcDSOrSrcDSTab=tifs_list, options=vrt_options)
+        ds.FlushCache()
 
     if not output_path.exists():
         print("Something went wrong, vrt not created.")
+    elif cog_file is not None and check_create_new_file(output_file=cog_file, overwrite=overwrite):
+        output_path.to_cog(output_file=cog_file)
 
 
 def create_meta_from_gdf(gdf, res) -> dict:
@@ -378,6 +529,8 @@ class RasterCalculator:
     custom_run_window_function: function that takes window of small and big raster
         as input and does calculation with these arrays.
     customize below function for this, can take more inputs.
+    instrumentation: hrt.RasterInstrumentation -> records the time per block. Reading
+        and writing happen in custom_run_window_function, so this is recorded as compute.
 
     def custom_run_window_function(self, raster1_window, raster2_window, band_out, **kwargs):
         #hrt.Raster_calculator custom_run_window_function
@@ -403,6 +556,7 @@ class RasterCalculator:
         custom_run_window_function,
         output_nodata,
         verbose=False,
+        instrumentation=None,
     ):
         self.raster1 = raster1
         self.raster2 = raster2
@@ -420,6 +574,7 @@ class RasterCalculator:
         self.custom_run_window_function = types.MethodType(custom_run_window_function, self)
         self.output_nodata = output_nodata
         self.verbose = verbose
+        self.instrumentation = instrumentation
 
     def _checkbounds(self, raster1, raster2):
         x1, x2, y1, y2 = raster1.metadata.bounds
@@ -471,6 +626,10 @@ class RasterCalculator:
             target_ds = self.raster_out.open_gdal_source_write()
             band_out = target_ds.GetRasterBand(1)
 
+            instrumentation = self.instrumentation
+            if instrumentation is not None:
+                instrumentation.reset()
+
             for idx, block_row in self.blocks_df.iterrows():
                 # Load landuse
                 window = {}
@@ -485,7 +644,13 @@ class RasterCalculator:
                     "raster2": window[self.raster_mapping["raster2"]],
                 }
 
+                if instrumentation is not None:
+                    instrumentation.block(idx)
+                t0 = time.perf_counter()
                 self.custom_run_window_function(windows=windows, band_out=band_out, **kwargs)
+                if instrumentation is not None:
+                    instrumentation.compute(seconds=time.perf_counter() - t0)
+
                 if self.verbose:
                     print(f"{idx} / {self.blocks_total}", end="\r")
                 # break
@@ -493,21 +658,17 @@ class RasterCalculator:
             band_out.FlushCache()  # close file after writing
             band_out = None
             target_ds = None
+            if instrumentation is not None:
+                instrumentation.log_report()
 
 
-def reproject(src: Raster, target_res: float, output_path: str):
-    """src : hrt.Raster
+def reproject(src: Raster, target_res: float, output_path: str, resampling: str = "nearest"):
+    """Resample src to target_res, with the same extent. See hrt.Raster.warp for more options.
+    src : hrt.Raster
     output_path : str
-    meta_new : hrt.core
+    resampling : str, 'nearest', 'average', 'mode', 'max', ...
     """
-    # https://svn.osgeo.org/gdal/trunk/autotest/alg/reproject.py
-    src.metadata.update_resolution(target_res)
-
-    src_ds = src.source
-    dst_ds = create_new_raster_file(file_name=output_path, nodata=src.nodata, meta=src.metadata)
-
-    if dst_ds is not None:
-        gdal.ReprojectImage(src_ds, dst_ds, src_wkt="EPSG:28992")
+    return src.warp(output_file=output_path, target_res=target_res, resampling=resampling)
 
 
 def hist_stats(histogram: dict, stat_type: str, ignore_keys=[0]):
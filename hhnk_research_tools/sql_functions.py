@@ -2,11 +2,15 @@
 import os
 import re
 import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import Union
 
 import geopandas as gpd
+import numpy as np
 import oracledb
 import pandas as pd
+import shapely
 from osgeo import ogr
 from shapely import Polygon, wkt
 
@@ -73,6 +77,114 @@ def sql_create_update_case_statement(
         raise e from None
 
 
+def sqlite_bulk_update(
+    df: pd.DataFrame,
+    table_name: str,
+    df_id_col: str,
+    db_id_col: str,
+    update_cols: dict,
+    excluded_ids=[],
+    conn=None,
+    database_path=None,
+) -> int:
+    """
+    Update columns of a sqlite table with the values in a dataframe. Replaces
+    sql_create_update_case_statement + execute_sql_changes for large updates.
+    The values are inserted with executemany into a temporary table, followed by
+    one set-based UPDATE ... FROM. Everything runs in one transaction and is
+    rolled back on failure. When conn already has an open transaction the update
+    runs in a savepoint and is not committed, that is left to the caller.
+    For ids that are in df more than once, the values of the last row are used.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+        Dataframe with the ids and new values.
+    table_name : str
+        Table in the database to update.
+    df_id_col : str
+        Id column in df.
+    db_id_col : str
+        Id column in table_name to match df_id_col with.
+    update_cols : dict
+        {df_column : database_column}, new values in df_column are written to
+        database_column.
+    excluded_ids : list
+        Ids in df_id_col that should not be updated.
+    conn : sqlite3.Connection
+        Supply either conn or database_path.
+    database_path : str
+
+    Returns
+    -------
+    rowcount : int
+        Number of rows updated in table_name.
+    """
+    if (conn is None and database_path is None) or (conn is not None and database_path is not None):
+        raise Exception("Provide exactly one of conn or database_path")
+
+    df = df[~df[df_id_col].isin(excluded_ids)]
+    df = df.drop_duplicates(subset=df_id_col, keep="last")
+    if df.empty:
+        return 0
+
+    # Convert to python types and nan to None (null), sqlite3 cannot bind numpy types.
+    df_cols = [df_id_col] + list(update_cols.keys())
+    df_values = df[df_cols].astype(object).where(df[df_cols].notna(), None)
+    rows = list(zip(*[df_values[c].tolist() for c in df_cols]))
+
+    temp_table = "hrt_bulk_update"
+    temp_cols = [f"val{i}" for i in range(len(update_cols))]
+
+    if sqlite3.sqlite_version_info >= (3, 33, 0):
+        set_statement = ", ".join(f"{db_col} = {temp_table}.{t}" for db_col, t in zip(update_cols.values(), temp_cols))
+        update_query = f"""UPDATE {table_name}
+            SET {set_statement}
+            FROM {temp_table}
+            WHERE {table_name}.{db_id_col} = {temp_table}.id"""
+    else:
+        # UPDATE FROM is not available before sqlite 3.33, use correlated subqueries.
+        set_statement = ", ".join(
+            f"{db_col} = (SELECT {t} FROM {temp_table} WHERE {temp_table}.id = {table_name}.{db_id_col})"
+            for db_col, t in zip(update_cols.values(), temp_cols)
+        )
+        update_query = f"""UPDATE {table_name}
+            SET {set_statement}
+            WHERE {db_id_col} IN (SELECT id FROM {temp_table})"""
+
+    kill_conn = conn is None
+    try:
+        if conn is None:
+            conn = create_sqlite_connection(database_path=database_path)
+
+        # Do not commit a transaction of the caller, use a savepoint within it.
+        own_transaction = not conn.in_transaction
+        try:
+            conn.execute("BEGIN" if own_transaction else f"SAVEPOINT {temp_table}")
+            conn.execute(f"DROP TABLE IF EXISTS temp.{temp_table}")
+            conn.execute(f"CREATE TEMP TABLE {temp_table} (id PRIMARY KEY, {', '.join(temp_cols)})")
+            conn.executemany(f"INSERT INTO {temp_table} VALUES ({', '.join(['?'] * len(df_cols))})", rows)
+            rowcount = conn.execute(update_query).rowcount
+            conn.execute(f"DROP TABLE temp.{temp_table}")
+            if own_transaction:
+                conn.commit()
+            else:
+                conn.execute(f"RELEASE SAVEPOINT {temp_table}")
+        except Exception as e:
+            if own_transaction:
+                conn.rollback()
+            else:
+                conn.execute(f"ROLLBACK TO SAVEPOINT {temp_table}")
+                conn.execute(f"RELEASE SAVEPOINT {temp_table}")
+            raise e from None
+
+        logger.info(f"Updated {rowcount} rows in {table_name} ({len(rows)} rows provided)")
+        return rowcount
+    finally:
+        if kill_conn and conn is not None:
+            conn.close()
+
+
 def sql_construct_select_query(table_name, columns=None) -> str:
     """
     Construct sql queries that select either all
@@ -224,6 +336,8 @@ def sqlite_replace_or_add_table(db, dst_table_name, src_table_name, select_state
 
     columns HAS to be a list of tuples containing the name
     of the column and it's type
+
+    Returns the number of rows that were inserted or replaced.
     """
     try:
         query_list = []
@@ -250,7 +364,11 @@ def sqlite_replace_or_add_table(db, dst_table_name, src_table_name, select_state
         else:
             # If the backup table exists, we replace any rows that are changed since last backup
             query = f"REPLACE INTO {dst_table_name} " f"SELECT * from {src_table_name}"
+        changes_start = conn.total_changes
         execute_sql_changes(query=query, conn=conn)
+        rowcount = conn.total_changes - changes_start
+        logger.info(f"{rowcount} rows written to {dst_table_name}")
+        return rowcount
     except Exception as e:
         raise e from None
     finally:
@@ -371,6 +489,64 @@ def sql_builder_select_by_location(
     return sql
 
 
+def sql_builder_select_by_location_tiled(
+    schema: str,
+    table_name: str,
+    polygon_wkt: Polygon,
+    tile_size: float = 2000,
+    geomcolumn: str = None,
+    epsg_code="28992",
+    simplify=False,
+    include_todays_mutations=False,
+) -> gpd.GeoDataFrame:
+    """Split the selection polygon into a grid of tiles and create the
+    sql_builder_select_by_location sql for every tile. Tiles that do not
+    intersect with the polygon, or only touch its edge, are dropped.
+
+    Parameters
+    ----------
+    tile_size : float
+        Width and height of the tiles in the units of epsg_code (m).
+    Other parameters are passed to sql_builder_select_by_location.
+
+    Returns
+    -------
+    tiles_gdf : gpd.GeoDataFrame
+        Tile geometry (the polygon clipped to the tile) and column 'sql'.
+    """
+    xmin, ymin, xmax, ymax = polygon_wkt.bounds
+    xs = np.arange(xmin, xmax, tile_size)
+    ys = np.arange(ymin, ymax, tile_size)
+    xx, yy = np.meshgrid(xs, ys)
+    boxes = shapely.box(xx.ravel(), yy.ravel(), xx.ravel() + tile_size, yy.ravel() + tile_size)
+
+    # Clip polygon to the tiles so the sql only contains the relevant part.
+    tiles = shapely.intersection(boxes, polygon_wkt)
+
+    # Tiles that touch the edge of the polygon give (multi)lines or points, only keep
+    # the polygon parts. These would only return features that other tiles return too.
+    collections = shapely.get_type_id(tiles) == 7
+    for i in np.flatnonzero(collections):
+        parts = shapely.get_parts(tiles[i])
+        tiles[i] = shapely.union_all(parts[np.isin(shapely.get_type_id(parts), [3, 6])])
+    tiles = tiles[np.isin(shapely.get_type_id(tiles), [3, 6]) & (shapely.area(tiles) > 0)]
+
+    tiles_gdf = gpd.GeoDataFrame(geometry=tiles, crs=f"EPSG:{epsg_code}")
+    tiles_gdf["sql"] = [
+        sql_builder_select_by_location(
+            schema=schema,
+            table_name=table_name,
+            polygon_wkt=tile,
+            geomcolumn=geomcolumn,
+            epsg_code=epsg_code,
+            simplify=simplify,
+            include_todays_mutations=include_todays_mutations,
+        )
+        for tile in tiles_gdf.geometry
+    ]
+    return tiles_gdf
+
+
 def _oracle_curve_polygon_to_linear(blob_curvepolygon):
     """
     Turn curved polygon from oracle database into linear one
@@ -427,6 +603,8 @@ def database_to_gdf(
     lower_cols=True,
     remove_blob_cols=True,
     crs="EPSG:28992",
+    cache=None,
+    refresh=False,
 ) -> Union[gpd.GeoDataFrame, str]:
     """
     Connect to (oracle) database, create a cursor and execute sql
@@ -452,6 +630,12 @@ def database_to_gdf(
         remove columns that contain oracle blob data
     crs: str
         EPSG code, defaults to 28992.
+    cache: hrt.DatabaseCache
+        When provided, the result is read from this local cache if the same
+        query was done before. New results are written to the cache.
+    refresh: bool
+        Ignore the cached result and query the database again. The cache
+        is updated with the new result.
 
     Returns
     -------
@@ -465,86 +649,205 @@ def database_to_gdf(
             "Dont pass sdo_util.to_wkt_geometry in the sql. It will be added here. Just use e.g. SHAPE as column."
         )
 
-    with oracledb.connect(**db_dict) as con:
-        cur = oracledb.Cursor(con)
-
-        # Modify sql to efficiently fetch description only
-        sql = sql.replace(";", "")
-        sql = sql.replace("select ", "SELECT ")  # Voor de mensen die geen caps gebruiken
-        sql = sql.replace("where ", "WHERE ")  # Voor de mensen die geen caps gebruiken
-        sql = sql.replace("from ", "FROM ")  # Voor de mensen die geen caps gebruiken
-        pattern = r"FETCH FIRST \d+ ROWS ONLY"
-        replacement = "FETCH FIRST 0 ROWS ONLY"
-        matched_upper = re.search(pattern, sql)
-        matched_lower = re.search(pattern.lower(), sql)
-        if matched_upper:
-            sql_desc = re.sub(pattern, replacement, sql)
-        elif matched_lower:
-            sql_desc = re.sub(pattern.lower(), replacement, sql)
+    if cache is not None:
+        cache_key = cache.key(
+            db_dict=db_dict,
+            sql=sql,
+            columns=columns,
+            lower_cols=lower_cols,
+            remove_blob_cols=remove_blob_cols,
+            crs=crs,
+        )
+        if not refresh:
+            cached = cache.get(cache_key)
+            if cached is not None:
+                logging.metrics.incr("database_to_gdf.cache_hits")
+                return cached
+
+    with logging.metrics.timer("database_to_gdf.query"), oracledb.connect(**db_dict) as con:
+        df, sql2 = _database_to_gdf(
+            con=con,
+            sql=sql,
+            columns=columns,
+            lower_cols=lower_cols,
+            remove_blob_cols=remove_blob_cols,
+            crs=crs,
+        )
+    logging.metrics.incr("database_to_gdf.rows", len(df))
+
+    if cache is not None:
+        cache.put(cache_key, df=df, sql=sql2)
+    return df, sql2
+
+
+def _database_to_gdf(con, sql, columns=None, lower_cols=True, remove_blob_cols=True, crs="EPSG:28992"):
+    """Execute sql on an open (oracle) connection. See database_to_gdf for the parameters."""
+    cur = oracledb.Cursor(con)
+
+    # Modify sql to efficiently fetch description only
+    sql = sql.replace(";", "")
+    sql = sql.replace("select ", "SELECT ")  # Voor de mensen die geen caps gebruiken
+    sql = sql.replace("where ", "WHERE ")  # Voor de mensen die geen caps gebruiken
+    sql = sql.replace("from ", "FROM ")  # Voor de mensen die geen caps gebruiken
+    pattern = r"FETCH FIRST \d+ ROWS ONLY"
+    replacement = "FETCH FIRST 0 ROWS ONLY"
+    matched_upper = re.search(pattern, sql)
+    matched_lower = re.search(pattern.lower(), sql)
+    if matched_upper:
+        sql_desc = re.sub(pattern, replacement, sql)
+    elif matched_lower:
+        sql_desc = re.sub(pattern.lower(), replacement, sql)
+    else:
+        sql_desc = f"{sql} {replacement}"
+
+    # Retrieve column names
+    select_search_str = "SELECT *"
+    if columns is None:
+        cur.execute(sql_desc)  # TODO hier kan nog een WHERE staan met spatial select
+        columns_out = [i[0] for i in cur.description]
+
+        if "SELECT *" in sql:
+            cols_dict = {c: c for c in columns_out}
         else:
-            sql_desc = f"{sql} {replacement}"
+            # When columns are passed, use those for the sql
+            select_search_str = sql.split("FROM")[0]
+
+            cols_sql = select_search_str.split("SELECT")[1].replace("\n", "").split(",")
+            cols_sql = [c.lstrip().rstrip() for c in cols_sql]
+            cols_dict = dict(zip(columns_out, cols_sql))
+
+    elif isinstance(columns, list):
+        cols_dict = {c: c for c in columns}
+        columns_out = cols_dict.keys()
+    else:
+        raise ValueError("Columns must be a list {columns}")
+
+    # Modify geometry column name to get WKT geometry
+    for key, col in cols_dict.items():
+        for geomcol in ["shape", "geometrie", "geometry"]:
+            if col.lower() == geomcol:
+                cols_dict[key] = f"sdo_util.to_wktgeometry({col}) as geometry"
+            # Find pattern e.g.: a.shape
+            if re.search(pattern=rf"(^|\w+\.){geomcol.lower()}$", string=col.lower()):
+                cols_dict[key] = f"sdo_util.to_wktgeometry({col}) as geometry"
+
+    col_select = ", ".join(cols_dict.values())
+    sql2 = sql.replace(select_search_str, f"SELECT {col_select} ")
+
+    # Execute modified sql request
+    try:
+        cur.execute(sql2)
+    except Exception as e:
+        logger.error(f"""Failed request. Here is the sql:
+{sql}""")
+        raise e
 
-        # Retrieve column names
-        select_search_str = "SELECT *"
-        if columns is None:
-            cur.execute(sql_desc)  # TODO hier kan nog een WHERE staan met spatial select
-            columns_out = [i[0] for i in cur.description]
+    # load cursor to dataframe
+    df = pd.DataFrame(cur.fetchall(), columns=columns_out)
 
-            if "SELECT *" in sql:
-                cols_dict = {c: c for c in columns_out}
-            else:
-                # When columns are passed, use those for the sql
-                select_search_str = sql.split("FROM")[0]
+    # Take column names from cursor and replace exotic geometry column names
+    for i in df.columns:
+        name = i
+        if lower_cols:
+            name = i.lower()
+        if i.lower() in ("shape", "geometrie"):
+            name = "geometry"
 
-                cols_sql = select_search_str.split("SELECT")[1].replace("\n", "").split(",")
-                cols_sql = [c.lstrip().rstrip() for c in cols_sql]
-                cols_dict = dict(zip(columns_out, cols_sql))
+        df.rename(columns={i: name}, inplace=True)
 
-        elif isinstance(columns, list):
-            cols_dict = {c: c for c in columns}
-            columns_out = cols_dict.keys()
-        else:
-            raise ValueError("Columns must be a list {columns}")
+    # make geodataframe and convert curve geometry to linear
+    if "geometry" in df.columns:
+        df = df.set_geometry(gpd.GeoSeries(df["geometry"].apply(_oracle_curve_polygon_to_linear)), crs=crs)
 
-        # Modify geometry column name to get WKT geometry
-        for key, col in cols_dict.items():
-            for geomcol in ["shape", "geometrie", "geometry"]:
-                if col.lower() == geomcol:
-                    cols_dict[key] = f"sdo_util.to_wktgeometry({col}) as geometry"
-                # Find pattern e.g.: a.shape
-                if re.search(pattern=rf"(^|\w+\.){geomcol.lower()}$", string=col.lower()):
-                    cols_dict[key] = f"sdo_util.to_wktgeometry({col}) as geometry"
+    # remove blob columns from oracle
+    if remove_blob_cols:
+        df = _remove_blob_columns(df)
 
-        col_select = ", ".join(cols_dict.values())
-        sql2 = sql.replace(select_search_str, f"SELECT {col_select} ")
+    return df, sql2
 
-        # Execute modified sql request
-        try:
-            cur.execute(sql2)
-        except Exception as e:
-            logger.error(f"""Failed request. Here is the sql:
-{sql}""")
-            raise e
 
-        # load cursor to dataframe
-        df = pd.DataFrame(cur.fetchall(), columns=columns_out)
+def database_to_gdf_tiled(
+    db_dict: dict,
+    tiles_gdf: gpd.GeoDataFrame,
+    id_col: str = "objectid",
+    max_workers: int = 4,
+    columns: list[str] = None,
+    lower_cols=True,
+    remove_blob_cols=True,
+    crs="EPSG:28992",
+) -> tuple[gpd.GeoDataFrame, gpd.GeoDataFrame]:
+    """
+    Run the sql of every tile concurrently on a pool of (oracle) connections and
+    merge the results into one GeoDataFrame. Features that touch multiple tiles
+    are only kept once, based on id_col.
 
-        # Take column names from cursor and replace exotic geometry column names
-        for i in df.columns:
-            name = i
-            if lower_cols:
-                name = i.lower()
-            if i.lower() in ("shape", "geometrie"):
-                name = "geometry"
+    Create the tiles with sql_builder_select_by_location_tiled.
 
-            df.rename(columns={i: name}, inplace=True)
+    Parameters
+    ----------
+    db_dict: dict
+        connection dict, see database_to_gdf.
+    tiles_gdf: gpd.GeoDataFrame
+        Tiles with column 'sql'.
+    id_col: str
+        Primary key column used to deduplicate features. Should be the name
+        after applying lower_cols.
+    max_workers: int
+        Number of concurrent queries (and pooled connections).
+    Other parameters are passed to database_to_gdf.
+
+    Returns
+    -------
+    gdf : Geodataframe with data of all tiles.
+    tiles_gdf : copy of the input with per tile the number of features and duration (s).
+    """
+    tiles_gdf = tiles_gdf.copy()
+    tiles_total = len(tiles_gdf)
+
+    pool = oracledb.create_pool(min=1, max=max_workers, increment=1, **db_dict)
+
+    def run_tile(sql):
+        time_start = time.perf_counter()
+        with pool.acquire() as con:
+            gdf, _ = _database_to_gdf(
+                con=con,
+                sql=sql,
+                columns=columns,
+                lower_cols=lower_cols,
+                remove_blob_cols=remove_blob_cols,
+                crs=crs,
+            )
+        return gdf, round(time.perf_counter() - time_start, 2)
+
+    gdf_list = []
+    empty_gdf = gpd.GeoDataFrame(geometry=gpd.GeoSeries([], crs=crs))
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(run_tile, sql): idx for idx, sql in tiles_gdf["sql"].items()}
+
+            for count, future in enumerate(as_completed(futures), start=1):
+                idx = futures[future]
+                gdf, duration = future.result()
+                if gdf.empty:
+                    empty_gdf = gdf  # Has the columns of the query
+                else:
+                    gdf_list.append(gdf)
+
+                tiles_gdf.loc[idx, "features"] = len(gdf)
+                tiles_gdf.loc[idx, "duration"] = duration
+                logger.info(f"{count} / {tiles_total} tiles - {len(gdf)} features ({duration}s)")
+    finally:
+        pool.close(force=True)
 
-        # make geodataframe and convert curve geometry to linear
-        if "geometry" in df.columns:
-            df = df.set_geometry(gpd.GeoSeries(df["geometry"].apply(_oracle_curve_polygon_to_linear)), crs=crs)
+    if not gdf_list:
+        # Same columns and crs as a result with features
+        if "geometry" in empty_gdf.columns:
+            empty_gdf = empty_gdf.set_geometry(gpd.GeoSeries([], index=empty_gdf.index, crs=crs))
+        return gpd.GeoDataFrame(empty_gdf), tiles_gdf
 
-        # remove blob columns from oracle
-        if remove_blob_cols:
-            df = _remove_blob_columns(df)
+    gdf = pd.concat(gdf_list, ignore_index=True)
+    if id_col not in gdf.columns:
+        raise ValueError(f"id_col '{id_col}' not found in columns {list(gdf.columns)}")
+    gdf = gdf.drop_duplicates(subset=id_col).reset_index(drop=True)
 
-        return df, sql2
+    return gdf, tiles_gdf
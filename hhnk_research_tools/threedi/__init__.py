@@ -1,5 +1,9 @@
+from hhnk_research_tools.threedi.cell_id_raster import CellIdRaster, gridadmin_hash, load_cell_id_raster
 from hhnk_research_tools.threedi.geometry_functions import (
     coordinates_to_points,
     grid_nodes_to_gdf,
     line_geometries_to_coords,
+    line_geometries_to_geoseries,
 )
+from hhnk_research_tools.threedi.grid_to_raster import GridToRaster
+from hhnk_research_tools.threedi.timeseries import export_timeseries
@@ -0,0 +1,242 @@
+# %%
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+import hhnk_research_tools.logger as logging
+
+logger = logging.get_logger(name=__name__)
+
+CELL_ID_NODATA = 0  # 3Di node ids start at 1
+
+
+def gridadmin_hash(admin_path) -> str:
+    """Sha256 of the gridadmin.h5. The hash is cached in a .json next to the gridadmin
+    and only recalculated when the size or mtime of the file changes.
+    """
+    admin_path = Path(str(admin_path))
+    hash_path = admin_path.with_name(f"{admin_path.name}.sha256.json")
+    stat = admin_path.stat()
+
+    if hash_path.exists():
+        cached = json.loads(hash_path.read_text())
+        if cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["sha256"]
+
+    file_hash = hashlib.sha256()
+    with open(admin_path, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            file_hash.update(chunk)
+    sha256 = file_hash.hexdigest()
+
+    hash_path.write_text(json.dumps({"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256}))
+    return sha256
+
+
+def _rasterize_cells(cell_ids, cell_coords):
+    """Rasterize the 2D cells to a grid with the size of the smallest cell. 3Di cells are
+    a quadtree, so every cell covers a whole number of these gridcells.
+
+    Returns grid and its [x_min, y_max, cellsize].
+    """
+    xmin, ymin, xmax, ymax = cell_coords
+
+    cell_sizes = xmax - xmin
+    dx = cell_sizes.min()
+    x0 = xmin.min()
+    y1 = ymax.max()
+    ncols = int(np.round((xmax.max() - x0) / dx))
+    nrows = int(np.round((y1 - ymin.min()) / dx))
+
+    id_grid = np.full((nrows, ncols), CELL_ID_NODATA, dtype=np.int32)
+    col0 = np.round((xmin - x0) / dx).astype(np.int64)
+    row0 = np.round((y1 - ymax) / dx).astype(np.int64)
+    factors = np.round(cell_sizes / dx).astype(np.int64)
+
+    # Fill all cells of the same size at once; there are only a few refinement levels.
+    for k in np.unique(factors):
+        sel = factors == k
+        offsets = np.arange(k)
+        rows = row0[sel][:, None, None] + offsets[None, :, None]
+        cols = col0[sel][:, None, None] + offsets[None, None, :]
+        id_grid[rows, cols] = cell_ids[sel][:, None, None]
+    return id_grid, [float(x0), float(y1), float(dx)]
+
+
+def _nearest_index(coords, origin, resolution, size):
+    """Index of coords in a grid axis starting at origin, with a mask of the valid indices."""
+    idx = np.floor((coords - origin) / resolution).astype(np.int64)
+    return idx, (idx >= 0) & (idx < size)
+
+
+class CellIdRaster:
+    """Raster with the 2D cell id of a gridadmin per pixel, stored as .npy with a .json
+    containing the georeference. The array is opened memory-mapped, so only the
+    windows that are read are loaded from disk.
+
+    Use load_cell_id_raster to create or open it.
+    """
+
+    def __init__(self, npy_path):
+        self.npy_path = Path(str(npy_path))
+        self.json_path = self.npy_path.with_suffix(".json")
+
+        georef = json.loads(self.json_path.read_text())
+        self.x_min = georef["x_min"]
+        self.y_max = georef["y_max"]
+        self.resolution = georef["resolution"]
+        self.gridadmin_hash = georef["gridadmin_hash"]
+        self.gridadmin = georef.get("gridadmin")
+
+        self.array = np.load(self.npy_path, mmap_mode="r")
+
+    @property
+    def shape(self):
+        return self.array.shape
+
+    @property
+    def bounds(self):
+        """[x_min, x_max, y_min, y_max]"""
+        nrows, ncols = self.shape
+        return [
+            self.x_min,
+            self.x_min + ncols * self.resolution,
+            self.y_max - nrows * self.resolution,
+            self.y_max,
+        ]
+
+    def read(self, x_min, y_max, pixel_width, xsize, ysize, pixel_height=None) -> np.ndarray:
+        """Cell ids for a window of another grid, sampled on the pixel centers.
+        Pixels outside the cells get CELL_ID_NODATA.
+
+        x_min, y_max is the left top corner of the window. pixel_height is negative,
+        defaults to -pixel_width.
+        """
+        if pixel_height is None:
+            pixel_height = -pixel_width
+        x = x_min + (np.arange(xsize) + 0.5) * pixel_width
+        y = y_max + (np.arange(ysize) + 0.5) * pixel_height
+        cols, valid_cols = _nearest_index(x, self.x_min, self.resolution, self.shape[1])
+        rows, valid_rows = _nearest_index(-y, -self.y_max, self.resolution, self.shape[0])
+
+        block = np.full((ysize, xsize), CELL_ID_NODATA, dtype=np.int32)
+        if not (valid_cols.any() and valid_rows.any()):
+            return block
+
+        # Slice the memmap first so only the rows/cols within the window are read.
+        rows, cols = rows[valid_rows], cols[valid_cols]
+        sub = self.array[rows.min() : rows.max() + 1, cols.min() : cols.max() + 1]
+        block[np.ix_(valid_rows, valid_cols)] = sub[np.ix_(rows - rows.min(), cols - cols.min())]
+        return block
+
+    def read_metadata(self, metadata, window=None) -> np.ndarray:
+        """Cell ids on the grid of a hrt.RasterMetadata.
+        window=[x0, y0, xsize, ysize] in pixels of metadata.
+        """
+        if window is None:
+            window = [0, 0, metadata.shape[1], metadata.shape[0]]
+        return self.read(
+            x_min=metadata.x_min + window[0] * metadata.pixel_width,
+            y_max=metadata.y_max + window[1] * metadata.pixel_height,
+            pixel_width=metadata.pixel_width,
+            pixel_height=metadata.pixel_height,
+            xsize=int(window[2]),
+            ysize=int(window[3]),
+        )
+
+    def __repr__(self):
+        return f"CellIdRaster({self.npy_path.name}, shape={self.shape}, resolution={self.resolution})"
+
+
+def load_cell_id_raster(admin_path, resolution: float = None, folder=None, overwrite: bool = False) -> CellIdRaster:
+    """Create or open the cached cell id raster of a gridadmin.
+
+    The artifact is keyed on the hash of the gridadmin and the resolution, so it is
+    reused by all scenarios with the same gridadmin and recreated when the
+    gridadmin changes. The path of the gridadmin is stored in the .json, only the
+    artifacts of older versions of this gridadmin are removed. So a folder can be
+    shared by the results of several gridadmins.
+
+    Parameters
+    ----------
+    admin_path : str, Path
+        gridadmin.h5
+    resolution : float
+        Pixel size of the raster. None uses the size of the smallest cell, which is
+        the smallest raster that still contains all cells exactly.
+    folder : str, Path
+        Folder to store the artifact in, defaults to the folder of the gridadmin.
+    overwrite : bool
+        Recreate the artifact if it exists.
+    """
+    admin_path = Path(str(admin_path)).resolve()
+    folder = admin_path.parent if folder is None else Path(str(folder))
+
+    admin_hash = gridadmin_hash(admin_path)
+    res_str = "cellsize" if resolution is None else f"{resolution}m"
+    npy_path = folder / f"cell_ids_{res_str}_{admin_hash[:16]}.npy"
+
+    if npy_path.exists() and npy_path.with_suffix(".json").exists() and not overwrite:
+        return CellIdRaster(npy_path)
+
+    from threedigrid.admin.gridadmin import GridH5Admin
+
+    # Remove artifacts of older versions of this gridadmin
+    for old_json_path in folder.glob(f"cell_ids_{res_str}_*.json"):
+        if old_json_path == npy_path.with_suffix(".json"):
+            continue
+        try:
+            old_admin = json.loads(old_json_path.read_text()).get("gridadmin")
+        except (OSError, ValueError):
+            continue
+        if old_admin == str(admin_path):
+            old_json_path.with_suffix(".npy").unlink(missing_ok=True)
+            old_json_path.unlink(missing_ok=True)
+
+    admin = GridH5Admin(str(admin_path))
+    try:
+        cells = admin.cells.subset("2D_OPEN_WATER").only("id", "cell_coords").data
+    finally:
+        admin.h5py_file.close()
+    id_grid, (x0, y1, dx) = _rasterize_cells(cells["id"], cells["cell_coords"])
+
+    tmp_path = npy_path.with_name(f"{npy_path.stem}_tmp.npy")
+    if resolution is None or resolution == dx:
+        resolution = dx
+        np.save(tmp_path, id_grid)
+    else:
+        nrows = int(np.ceil(id_grid.shape[0] * dx / resolution))
+        ncols = int(np.ceil(id_grid.shape[1] * dx / resolution))
+        array = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=np.int32, shape=(nrows, ncols))
+
+        x = x0 + (np.arange(ncols) + 0.5) * resolution
+        cols, valid_cols = _nearest_index(x, x0, dx, id_grid.shape[1])
+        cols = cols[valid_cols]
+        # Write in row chunks of about 64MB
+        chunk_rows = max(1, 2**24 // ncols)
+        for row_start in range(0, nrows, chunk_rows):
+            row_end = min(row_start + chunk_rows, nrows)
+            y = y1 - (np.arange(row_start, row_end) + 0.5) * resolution
+            rows, valid_rows = _nearest_index(-y, -y1, dx, id_grid.shape[0])
+
+            block = np.full((row_end - row_start, ncols), CELL_ID_NODATA, dtype=np.int32)
+            block[np.ix_(valid_rows, valid_cols)] = id_grid[np.ix_(rows[valid_rows], cols)]
+            array[row_start:row_end] = block
+        array.flush()
+        del array
+
+    os.replace(tmp_path, npy_path)
+    georef = {
+        "x_min": x0,
+        "y_max": y1,
+        "resolution": float(resolution),
+        "gridadmin_hash": admin_hash,
+        "gridadmin": str(admin_path),
+    }
+    npy_path.with_suffix(".json").write_text(json.dumps(georef))
+    logger.info(f"Created {npy_path.name}")
+
+    return CellIdRaster(npy_path)
@@ -1,46 +1,65 @@
 import geopandas as gpd
 import numpy as np
-from shapely.geometry import LineString, Point
+import shapely
+
+
+def _coordinates_to_points(coordinates) -> np.ndarray:
+    """Create points from a (2, n) coordinate array as stored in the gridadmin.
+    The x and y rows are passed as views, so float64 input is not copied.
+    """
+    coordinates = np.asarray(coordinates, dtype=np.float64)
+    return shapely.points(coordinates[0], coordinates[1])
 
 
 def coordinates_to_points(nodes):
-    """Input is r.nodes"""
-    res_crds = nodes.coordinates
-    crds_lst = np.vstack(res_crds.T)
-    # convert to shapely format so we can create a geodataframe
-    crds = [Point(crd) for crd in crds_lst]
-    return crds
+    """Input is r.nodes, returns array with shapely Points"""
+    return _coordinates_to_points(nodes.coordinates)
 
 
 def grid_nodes_to_gdf(results):
     try:
-        nodes_gdf_crds = coordinates_to_points(results.nodes)
-        nodes_gdf = gpd.GeoDataFrame(geometry=nodes_gdf_crds, crs=f"EPSG:28992")
+        nodes_gdf = gpd.GeoDataFrame(geometry=coordinates_to_points(results.nodes), crs="EPSG:28992")
         return nodes_gdf
     except Exception as e:
         raise e from None
 
 
+def line_geometries_to_geoseries(lines, crs="EPSG:28992") -> gpd.GeoSeries:
+    """
+    Vectorized version of line_geometries_to_coords. Coordinates of all lines are
+    concatenated and turned into LineStrings with one shapely.linestrings call.
+    Lines with less than 2 points get the same dummy geometry.
+    Usage: lines = results.lines.channels.line_geometries where results = GridH5ResultAdmin object
+    """
+    dummy = np.array([0.0, 25000, 0.0, 25000])  # x1, x2, y1, y2
+    lines = [line if len(line) >= 4 else dummy for line in lines]
+    if len(lines) == 0:
+        return gpd.GeoSeries([], crs=crs)
+
+    # Each line is stored as [x1..xn, y1..yn]
+    sizes = np.fromiter((line.size for line in lines), dtype=np.int64, count=len(lines))
+    npoints = sizes // 2
+    starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    flat = np.concatenate(lines).astype(np.float64)
+
+    # Ragged offsets; line index and point index within the line for every coordinate.
+    line_idx = np.repeat(np.arange(len(lines)), npoints)
+    point_offsets = np.concatenate(([0], np.cumsum(npoints)[:-1]))
+    point_idx = np.arange(npoints.sum()) - point_offsets[line_idx]
+
+    x = flat[starts[line_idx] + point_idx]
+    y = flat[starts[line_idx] + npoints[line_idx] + point_idx]
+    geoms = shapely.linestrings(x, y, indices=line_idx)
+    return gpd.GeoSeries(geoms, crs=crs)
+
+
 def line_geometries_to_coords(lines):
     """
     Coordinates read from threedi results netcdf can't be used as is in geodataframe
     Usage: lines = results.lines.channels.line_geometries where results = GridH5ResultAdmin object
+    Returns list of LineStrings, use line_geometries_to_geoseries to get a GeoSeries directly.
     """
-    coords = []
-    for line in lines:
-        if len(line) >= 4:
-            x_coords = line[: int(line.size / 2)].tolist()
-            y_coords = line[int(line.size / 2) :].tolist()
-        else:
-            # Fill in dummy coords
-            x_coords = [0.0, 25000]
-            y_coords = [0.0, 25000]
-        line_list = []
-        for x, y in zip(x_coords, y_coords):
-            line_list.append([x, y])
-        # Creates set of ([x1, y1], [x2, y2] ...., [xn, yn])
-        coords.append(LineString(line_list))
-    return coords
+    return list(line_geometries_to_geoseries(lines).values)
 
 
 def extract_boundary_from_polygon(polygon, df_geo_col):
@@ -55,7 +74,7 @@ def extract_boundary_from_polygon(polygon, df_geo_col):
 
 
 def point_geometries_to_wkt(points):
-    coords = []
-    for point_x, point_y in zip(points[0], points[1]):
-        coords.append(Point([point_x, point_y]))
-    return coords
+    """Input is (2, n) array with coordinates, e.g. r.nodes.coordinates. Returns
+    array with shapely Points.
+    """
+    return _coordinates_to_points(points)
@@ -2,6 +2,7 @@
 import tempfile
 
 import geopandas as gpd
+import numpy as np
 import pandas as pd
 import shapely.wkt as wkt
 
@@ -67,64 +68,74 @@ class Grid:
     def read_1d2d_lines(self):
         return read_1d2d_lines(self.admin)
 
+    def cell_id_raster(self, resolution: float = None, folder=None):
+        """Return the cached raster with the 2D cell id per pixel, stored next to the gridadmin
+        or in folder.
+        """
+        return hrt.threedi.load_cell_id_raster(admin_path=self.admin_path, resolution=resolution, folder=folder)
+
     def import_levees(self):
         return import_levees(self.admin)
 
 
+def _lookup_index(ids, lookup_ids):
+    """Position of ids in lookup_ids (searchsorted on the sorted lookup_ids)
+    and a mask of the ids that were found.
+    """
+    ids = np.asarray(ids)
+    lookup_ids = np.asarray(lookup_ids)
+    if len(lookup_ids) == 0:
+        return np.zeros(len(ids), dtype=np.int64), np.zeros(len(ids), dtype=bool)
+
+    sorter = np.argsort(lookup_ids, kind="stable")
+    pos = np.searchsorted(lookup_ids, ids, sorter=sorter)
+    idx = sorter[np.clip(pos, 0, len(lookup_ids) - 1)]
+    return idx, lookup_ids[idx] == ids
+
+
 def read_1d2d_lines(results):
     """Uitlezen 1d2d lijnelementen
     Alle 1d2d lijnelementen in het model.
+
+    Arrays are read once from the gridadmin and joined on the 1D node id.
     """
-    try:
-        # Creates geodataframe with geometries of 1d2d subset of nodes in 3di results
-        coords = hrt.threedi.line_geometries_to_coords(results.lines.subset(one_d_two_d).line_geometries)
-        one_d_two_d_lines_gdf = gpd.GeoDataFrame(geometry=coords, crs=f"EPSG:{DEF_TRGT_CRS}")
-
-        # 1d nodes om te bepalen bij welk kunstwerk het hoort
-        one_d_two_d_lines_gdf[one_d_node_id_col] = [a[1] for a in results.lines.subset(one_d_two_d).line_nodes]
-        one_d_two_d_lines_gdf[node_id_col] = results.nodes.filter(
-            id__in=one_d_two_d_lines_gdf[one_d_node_id_col].tolist()
-        ).content_pk
-        one_d_two_d_lines_gdf.index = one_d_two_d_lines_gdf[one_d_node_id_col]
-
-        # Get values corresponding to id's in onetwo_line_geo from results and add to dataframe
-        oned_nodes_list = results.nodes.filter(id__in=one_d_two_d_lines_gdf[one_d_node_id_col].tolist())
-        oned_conn_nodes_id_list = oned_nodes_list.connectionnodes.id.tolist()
-        oned_conn_nodes_init_wlvl_list = oned_nodes_list.connectionnodes.initial_waterlevel.tolist()
-        oned_conn_nodes_storage_area_list = oned_nodes_list.connectionnodes.storage_area
-        oned_added_calculation_nodes_list = oned_nodes_list.added_calculationnodes.id.tolist()
-
-        # Add node geometries
-        one_d_two_d_lines_gdf[node_geometry_col] = point_geometries_to_wkt(oned_nodes_list.coordinates)
-
-        # Add information about node type
-        one_d_two_d_lines_gdf[node_type_col] = None  # if frame is empty this prevents .loc from producing an error.
-        one_d_two_d_lines_gdf.loc[
-            one_d_two_d_lines_gdf[one_d_node_id_col].isin(oned_conn_nodes_id_list),
-            node_type_col,
-        ] = connection_val
-        one_d_two_d_lines_gdf.loc[
-            one_d_two_d_lines_gdf[one_d_node_id_col].isin(oned_added_calculation_nodes_list),
-            node_type_col,
-        ] = added_calc_val
-
-        # Add initial waterlevel to nodes
-        one_d_two_d_lines_gdf.loc[
-            one_d_two_d_lines_gdf[one_d_node_id_col].isin(oned_conn_nodes_id_list),
-            init_wlevel_col,
-        ] = oned_conn_nodes_init_wlvl_list
-
-        # Add storage area from connection nodes to the table
-        storage_area_lst = oned_conn_nodes_storage_area_list
-        # storage_area_lst = [a.decode(UTF8) for a in oned_conn_nodes_storage_area_list]
-        one_d_two_d_lines_gdf.loc[
-            one_d_two_d_lines_gdf[one_d_node_id_col].isin(oned_conn_nodes_id_list),
-            storage_area_col,
-        ] = storage_area_lst
-        one_d_two_d_lines_gdf[storage_area_col] = pd.to_numeric(one_d_two_d_lines_gdf[storage_area_col])
-        return one_d_two_d_lines_gdf
-    except Exception as e:
-        raise e from None
+    lines = results.lines.subset(one_d_two_d)
+    line_geometries = lines.line_geometries
+    # 1d nodes om te bepalen bij welk kunstwerk het hoort
+    one_d_node_ids = np.asarray(lines.line_nodes).reshape(-1, 2)[:, 1]
+
+    # Creates geodataframe with geometries of 1d2d subset of nodes in 3di results
+    geoms = hrt.threedi.line_geometries_to_geoseries(line_geometries, crs=f"EPSG:{DEF_TRGT_CRS}")
+    one_d_two_d_lines_gdf = gpd.GeoDataFrame(geometry=geoms)
+    one_d_two_d_lines_gdf[one_d_node_id_col] = one_d_node_ids
+
+    # Node values of the 1d node of each line
+    nodes = results.nodes
+    node_idx, _ = _lookup_index(one_d_node_ids, nodes.id)
+    one_d_two_d_lines_gdf[node_id_col] = np.asarray(nodes.content_pk)[node_idx]
+    one_d_two_d_lines_gdf.index = one_d_two_d_lines_gdf[one_d_node_id_col]
+
+    # Add node geometries
+    one_d_two_d_lines_gdf[node_geometry_col] = point_geometries_to_wkt(np.asarray(nodes.coordinates)[:, node_idx])
+
+    # Add information about node type
+    conn_idx, is_conn = _lookup_index(one_d_node_ids, nodes.connectionnodes.id)
+    _, is_added_calc = _lookup_index(one_d_node_ids, nodes.added_calculationnodes.id)
+
+    node_type = np.full(len(one_d_node_ids), None, dtype=object)
+    node_type[is_conn] = connection_val
+    node_type[is_added_calc] = added_calc_val
+    one_d_two_d_lines_gdf[node_type_col] = pd.Series(node_type, index=one_d_two_d_lines_gdf.index, dtype=object)
+
+    # Add initial waterlevel and storage area from connection nodes to the table
+    init_wlevel = np.full(len(one_d_node_ids), np.nan)
+    init_wlevel[is_conn] = np.asarray(nodes.connectionnodes.initial_waterlevel)[conn_idx[is_conn]]
+    one_d_two_d_lines_gdf[init_wlevel_col] = init_wlevel
+
+    storage_area = np.full(len(one_d_node_ids), None, dtype=object)
+    storage_area[is_conn] = np.asarray(nodes.connectionnodes.storage_area)[conn_idx[is_conn]]
+    one_d_two_d_lines_gdf[storage_area_col] = pd.to_numeric(storage_area).astype(float)
+    return one_d_two_d_lines_gdf
 
 
 def import_levees(results):
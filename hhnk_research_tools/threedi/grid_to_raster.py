@@ -0,0 +1,165 @@
+# %%
+import datetime
+
+import numpy as np
+
+import hhnk_research_tools as hrt
+import hhnk_research_tools.logger as logging
+from hhnk_research_tools.gis.raster import Raster
+from hhnk_research_tools.threedi.cell_id_raster import CELL_ID_NODATA
+
+logger = logging.get_logger(name=__name__)
+
+THREEDI_NODATA = -9999  # Value of dry cells in the 3Di results
+
+
+def map_cell_values(cell_ids, lookup, dem_block, dem_nodata, output="depth", output_nodata=-9999) -> np.ndarray:
+    """Map per cell values to pixels with a gather of lookup on cell_ids.
+
+    cell_ids (np.ndarray): cell id per pixel, CELL_ID_NODATA outside the cells.
+    lookup (np.ndarray): waterlevel per cell id, nan for dry cells and at CELL_ID_NODATA.
+    dem_block (np.ndarray): dem on the same pixels as cell_ids.
+    output (str): 'level' or 'depth'. Both are only filled where the depth is larger than 0.
+    """
+    level = lookup[cell_ids]
+    depth = level - dem_block
+
+    mask = np.isnan(depth) | (depth <= 0) | (dem_block == dem_nodata)
+    block_out = level if output == "level" else depth
+    block_out[mask] = output_nodata
+    return block_out
+
+
+class GridToRaster:
+    """Map per cell 3Di results (e.g. max waterlevel) to rasters on the grid of the dem.
+
+    The 2D cells are rasterized once per gridadmin to a cell id raster, which is
+    stored next to the result and reused (see hrt.threedi.load_cell_id_raster).
+    Results are mapped to the pixels of the dem with a vectorized gather of the
+    cell values on the cell ids, block by block.
+
+    Usage:
+        grid_to_raster = GridToRaster(threedi_result=hrt.ThreediResult(folder), dem=hrt.Raster(dem_path))
+        grid_to_raster.run(output_raster=hrt.Raster("max_depth.tif"), timestep="max", output="depth")
+
+    Parameters
+    ----------
+    threedi_result (hrt.ThreediResult): folder with gridadmin.h5 and results_3di.nc
+    dem (hrt.Raster): dem, used as output grid and to calculate depth.
+    min_block_size (int): min block size for generator blocks_df, higher is faster but
+        uses more RAM.
+    cell_id_resolution (float): resolution of the cached cell id raster. None uses the
+        smallest cell size, which is exact for dems aligned with the grid.
+    verbose (bool): print progress
+    """
+
+    def __init__(
+        self,
+        threedi_result,
+        dem: Raster,
+        min_block_size: int = 4096,
+        cell_id_resolution: float = None,
+        verbose: bool = False,
+    ):
+        self.threedi_result = threedi_result
+        self.dem = dem
+        self.min_block_size = min_block_size
+        self.cell_id_resolution = cell_id_resolution
+        self.verbose = verbose
+
+    def cell_values(self, variable: str = "s1", timestep="max", chunk_size: int = 50) -> np.ndarray:
+        """Lookup array with per cell values, indexed by cell id. Dry cells are nan.
+
+        timestep : int | 'max'
+            Index of the timestep or 'max' for the maximum over all timesteps.
+            The maximum is calculated in chunks of chunk_size timesteps.
+        """
+        nodes = self.threedi_result.grid.nodes.subset("2D_OPEN_WATER")
+        ids = nodes.id
+
+        if timestep == "max":
+            nr_timesteps = len(nodes.timestamps)
+            values = np.full(len(ids), -np.inf)
+            for t_start in range(0, nr_timesteps, chunk_size):
+                chunk = getattr(nodes.timeseries(indexes=slice(t_start, t_start + chunk_size)), variable)
+                chunk = np.where(chunk == THREEDI_NODATA, -np.inf, chunk)
+                values = np.maximum(values, chunk.max(axis=0))
+            values[np.isinf(values)] = np.nan
+        else:
+            values = getattr(nodes.timeseries(indexes=[int(timestep)]), variable)[0].astype(np.float64)
+            values[values == THREEDI_NODATA] = np.nan
+
+        lookup = np.full(ids.max() + 1, np.nan)
+        lookup[ids] = values
+        return lookup
+
+    def run(
+        self,
+        output_raster: Raster,
+        variable: str = "s1",
+        timestep="max",
+        output: str = "depth",
+        output_nodata: float = -9999,
+        overwrite: bool = False,
+    ):
+        """Create raster with waterlevel or depth.
+
+        Parameters
+        ----------
+        output_raster (hrt.Raster): output location
+        variable (str): result variable, 's1' for waterlevel.
+        timestep (int | 'max'): timestep index or 'max' for the maximum of all timesteps.
+        output (str): 'level' or 'depth'. Depth is level - dem. Both are only filled where
+            the depth is larger than 0.
+        output_nodata (float): nodata of output raster
+        overwrite (bool): overwrite output_raster if it exists.
+        """
+        if output not in ["level", "depth"]:
+            raise ValueError(f"output should be 'level' or 'depth', got {output}")
+
+        if not hrt.check_create_new_file(
+            output_file=output_raster,
+            overwrite=overwrite,
+            input_files=[self.threedi_result.grid_path.path, self.dem.path],
+        ):
+            return
+
+        cell_id_raster = self.threedi_result.cell_id_raster(resolution=self.cell_id_resolution)
+        lookup = self.cell_values(variable=variable, timestep=timestep)
+
+        output_raster.create(metadata=self.dem.metadata, nodata=output_nodata, verbose=self.verbose)
+        gdal_src = output_raster.open_gdal_source_write()
+        band_out = gdal_src.GetRasterBand(1)
+
+        # Blocks from a new Raster, so the block size of the dem is not changed.
+        blocks_df = Raster(self.dem.path, min_block_size=self.min_block_size).generate_blocks()
+        if self.verbose:
+            time_start = datetime.datetime.now()
+            blocks_total = len(blocks_df)
+
+        for idx, block_row in blocks_df.iterrows():
+            window = block_row["window_readarray"]
+
+            cell_ids = cell_id_raster.read_metadata(metadata=self.dem.metadata, window=window)
+            if np.all(cell_ids == CELL_ID_NODATA):
+                continue
+
+            dem_block = self.dem._read_array(window=window)
+            block_out = map_cell_values(
+                cell_ids=cell_ids,
+                lookup=lookup,
+                dem_block=dem_block,
+                dem_nodata=self.dem.nodata,
+                output=output,
+                output_nodata=output_nodata,
+            )
+            band_out.WriteArray(block_out, xoff=window[0], yoff=window[1])
+
+            if self.verbose:
+                print(f"{idx} / {blocks_total} ({hrt.time_delta(time_start)}s) - {output_raster.name}", end="\r")
+
+        band_out.FlushCache()
+        band_out = None
+        gdal_src = None
+        if self.verbose:
+            print("\nDone")
@@ -0,0 +1,118 @@
+# %%
+from pathlib import Path
+
+import numpy as np
+
+import hhnk_research_tools.logger as logging
+
+logger = logging.get_logger(name=__name__)
+
+# threedigrid filter to select elements within a bbox.
+BBOX_FILTERS = {"nodes": "coordinates__in_bbox", "lines": "line_coords__in_bbox"}
+
+
+def export_timeseries(
+    grid,
+    output_file,
+    variable: str = "s1",
+    element: str = "nodes",
+    subset: str = None,
+    ids: list = None,
+    bbox: list = None,
+    chunk_size: int = 50,
+    overwrite: bool = False,
+) -> Path:
+    """Stream the timeseries of a result variable to a parquet file, chunk_size
+    timesteps at a time. Memory use is bounded by chunk_size * number of selected
+    elements, so long simulations on big grids do not have to fit in memory.
+
+    Output is in long format with columns; time (s), id, {variable}.
+    Each chunk is written as a parquet row group. When no elements or timesteps
+    are selected an empty table with these columns is written.
+
+    Parameters
+    ----------
+    grid : threedigrid.admin.gridresultadmin.GridH5ResultAdmin
+        e.g. hrt.ThreediResult.grid
+    output_file : str, Path
+        .parquet file
+    variable : str
+        Result variable, e.g. 's1' (waterlevel) for nodes or 'q' (discharge) for lines.
+    element : str
+        'nodes' or 'lines'
+    subset : str
+        threedigrid subset, e.g. '2D_ALL' or '1D_ALL'. None for all elements.
+    ids : list
+        Only export these node/line ids.
+    bbox : list
+        Only export elements within [xmin, ymin, xmax, ymax].
+    chunk_size : int
+        Number of timesteps read and written at once.
+    overwrite : bool
+        Overwrite output_file if it exists.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    output_file = Path(str(output_file))
+    if output_file.exists():
+        if not overwrite:
+            logger.info(f"{output_file.name} already exists")
+            return output_file
+        output_file.unlink()
+
+    if element not in BBOX_FILTERS:
+        raise ValueError(f"element should be one of {list(BBOX_FILTERS)}, got {element}")
+
+    # Select elements
+    model = getattr(grid, element)
+    if subset is not None:
+        model = model.subset(subset)
+    if ids is not None:
+        model = model.filter(id__in=np.asarray(ids))
+    if bbox is not None:
+        model = model.filter(**{BBOX_FILTERS[element]: list(bbox)})
+
+    element_ids = np.asarray(model.id)
+    timestamps = np.asarray(model.timestamps)
+    nr_elements = len(element_ids)
+    nr_timesteps = len(timestamps)
+    logger.info(f"Exporting {variable} of {nr_elements} {element} for {nr_timesteps} timesteps to {output_file.name}")
+
+    schema = pa.schema(
+        [
+            ("time", pa.from_numpy_dtype(timestamps.dtype)),
+            ("id", pa.from_numpy_dtype(element_ids.dtype)),
+            (variable, pa.float64()),
+        ]
+    )
+    writer = pq.ParquetWriter(output_file, schema)
+    try:
+        if nr_elements == 0 or nr_timesteps == 0:
+            logger.warning(f"No {element} or timesteps selected, {output_file.name} is empty")
+            writer.write_table(schema.empty_table())
+
+        for t_start in range(0, nr_timesteps if nr_elements > 0 else 0, chunk_size):
+            t_end = min(t_start + chunk_size, nr_timesteps)
+            values = getattr(model.timeseries(indexes=slice(t_start, t_end)), variable)
+
+            table = pa.table(
+                {
+                    "time": np.repeat(timestamps[t_start:t_end], nr_elements),
+                    "id": np.tile(element_ids, t_end - t_start),
+                    variable: np.asarray(values, dtype=np.float64).ravel(),
+                },
+                schema=schema,
+            )
+            writer.write_table(table)
+            logger.debug(f"{t_end} / {nr_timesteps} timesteps written")
+    except Exception as e:
+        writer.close()
+        writer = None
+        output_file.unlink(missing_ok=True)
+        raise e
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return output_file
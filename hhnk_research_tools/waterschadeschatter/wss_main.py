@@ -1,4 +1,7 @@
 # %%
+import time
+
+import numpy as np
 from osgeo import gdal
 
 import hhnk_research_tools as hrt
@@ -69,9 +72,14 @@ class Waterschadeschatter:
         calculation_type="sum",
         verbose=False,
         overwrite=False,
+        instrumentation=None,
+        profile=None,
     ):
         """
         Calculation type options: 'sum','direct','indirect'
+        instrumentation (hrt.RasterInstrumentation): records read, compute and write time
+            per block and logs a report at the end.
+        profile (str): None or 'cog', write the output as Cloud Optimized GeoTIFF.
         """
 
         if output_raster.exists():
@@ -82,7 +90,11 @@ class Waterschadeschatter:
 
         # Create output raster
         output_raster.create(
-            metadata=self.depth_raster.metadata, nodata=DMG_NODATA, verbose=verbose, overwrite=overwrite
+            metadata=self.depth_raster.metadata,
+            nodata=DMG_NODATA,
+            verbose=verbose,
+            overwrite=overwrite,
+            profile=profile,
         )
 
         # Load raster so we can edit it.
@@ -97,6 +109,9 @@ class Waterschadeschatter:
         pixel_factor = self.depth_raster.pixelarea
         blocks_df = self.depth_raster.generate_blocks()
 
+        if instrumentation is not None:
+            instrumentation.reset()
+
         len_total = len(blocks_df)
         for idx, block_row in blocks_df.iterrows():
             # Load landuse
@@ -106,13 +121,23 @@ class Waterschadeschatter:
             window_lu[0] += dx_min
             window_lu[1] += dy_min
 
+            if instrumentation is not None:
+                instrumentation.block(idx)
+            t0 = time.perf_counter()
             lu_block = self.lu_raster._read_array(window=window_lu)
-            lu_block = lu_block.astype(int)
+            if instrumentation is not None:
+                instrumentation.read(key="landuse", seconds=time.perf_counter() - t0, nbytes=lu_block.nbytes)
+            # Landuse is used as index of the damage tables, keep the native (narrow) integer
+            # type and only cast float rasters.
+            if not np.issubdtype(lu_block.dtype, np.integer):
+                lu_block = lu_block.astype(np.int32)
             lu_block[lu_block == self.lu_raster.nodata] = 0
             # TODO np.all(self.polder==folder.dst.tmp.polder.nodata) is mogelijk net iets sneller.
             if lu_block.mean() != 0:
                 # Load depth
+                t0 = time.perf_counter()
                 depth_block = self.depth_raster._read_array(window=window_depth)
+                t1 = time.perf_counter()
                 # depth_mask = depth_block==self.depth_raster.nodata
                 # depth_block[depth_mask] = np.nan #Schadetabel loopt vanaf -0.01cm
 
@@ -127,15 +152,27 @@ class Waterschadeschatter:
                     pixel_factor=pixel_factor,
                     calculation_type=calculation_type,
                 )
+                t2 = time.perf_counter()
                 # Write to file
                 dmg_band.WriteArray(damage_block, xoff=window_depth[0], yoff=window_depth[1])
 
+                if instrumentation is not None:
+                    instrumentation.read(key="depth", seconds=t1 - t0, nbytes=depth_block.nbytes)
+                    instrumentation.compute(seconds=t2 - t1)
+                    instrumentation.write(seconds=time.perf_counter() - t2, nbytes=damage_block.nbytes)
+            elif instrumentation is not None:
+                instrumentation.skip()
+
             print(f"{idx} / {len_total}", end="\r")
             # break
 
         dmg_band.FlushCache()  # close file after writing
         dmg_band = None
         target_ds = None
+        if profile == "cog":
+            output_raster.to_cog()
+        if instrumentation is not None:
+            instrumentation.log_report()
 
     def __repr__(self):
         """List available objects, distinction between functions and variables"""
@@ -10,8 +10,10 @@ import hhnk_research_tools.logger as logging
 from hhnk_research_tools.sql_functions import (
     _remove_blob_columns,
     database_to_gdf,
+    database_to_gdf_tiled,
     execute_sql_selection,
     sql_builder_select_by_location,
+    sql_builder_select_by_location_tiled,
 )
 from tests_hrt.config import TEMP_DIR, TEST_DIRECTORY
 
@@ -94,3 +96,22 @@ def test_remove_blob_cols():
 
     display(gdf)
     # %%
+
+
+def test_database_to_gdf_tiled():
+    # %%
+    gpkg_path = TEST_DIRECTORY / r"area_test_sql_helsdeur.gpkg"
+    db_dict = DATABASES.get("aquaprd_lezen", None)
+
+    test_gdf = gpd.read_file(gpkg_path, engine="pyogrio")
+    polygon_wkt = test_gdf.iloc[0]["geometry"]
+
+    tiles_gdf = sql_builder_select_by_location_tiled(
+        schema="DAMO_W", table_name="GEMAAL", polygon_wkt=polygon_wkt, tile_size=500, simplify=True
+    )
+    gdf, tiles_gdf = database_to_gdf_tiled(db_dict=db_dict, tiles_gdf=tiles_gdf, id_col="objectid", max_workers=2)
+
+    assert gdf["objectid"].is_unique
+    assert "KGM-Q-29234" in gdf["code"].values
+    assert tiles_gdf["features"].sum() >= len(gdf)
+    # %%
@@ -0,0 +1,128 @@
+# %%
+import json
+import sys
+import types
+
+import numpy as np
+import pytest
+
+import hhnk_research_tools as hrt
+from hhnk_research_tools.threedi.cell_id_raster import (
+    CELL_ID_NODATA,
+    CellIdRaster,
+    _rasterize_cells,
+    gridadmin_hash,
+    load_cell_id_raster,
+)
+from tests_hrt.config import TEMP_DIR
+
+
+def test_cell_id_raster():
+    # Quadtree of 80x80m; one 40m cell in the top left and 20m cells elsewhere.
+    cell_ids = [1]
+    cell_coords = [[0, 40, 40, 80]]
+    for x in range(0, 80, 20):
+        for y in range(0, 80, 20):
+            if x < 40 and y >= 40:
+                continue
+            cell_ids.append(len(cell_ids) + 1)
+            cell_coords.append([x, y, x + 20, y + 20])
+
+    id_grid, (x0, y1, dx) = _rasterize_cells(np.array(cell_ids), np.array(cell_coords, dtype=float).T)
+    assert (x0, y1, dx) == (0, 80, 20)
+    assert id_grid.shape == (4, 4)
+    assert (id_grid[:2, :2] == 1).all()
+    assert id_grid[3, 0] == 2  # left bottom
+
+    npy_path = TEMP_DIR / "cell_ids_test.npy"
+    np.save(npy_path, id_grid)
+    npy_path.with_suffix(".json").write_text(
+        json.dumps({"x_min": x0, "y_max": y1, "resolution": dx, "gridadmin_hash": "test"})
+    )
+    cell_id_raster = CellIdRaster(npy_path)
+    assert cell_id_raster.bounds == [0, 80, 0, 80]
+
+    # Read on a 5m grid that is larger than the cells.
+    block = cell_id_raster.read(x_min=-10, y_max=90, pixel_width=5, xsize=20, ysize=20)
+    assert block.shape == (20, 20)
+    assert (block[:2] == CELL_ID_NODATA).all()
+    assert (block[2:10, 2:10] == 1).all()
+    assert block[17, 2] == 2
+
+
+class FakeGridH5Admin:
+    """Gridadmin of which the .h5 is a json with the cell ids and coords."""
+
+    opened = 0
+
+    def __init__(self, admin_path):
+        FakeGridH5Admin.opened += 1
+        data = json.loads(open(admin_path).read())
+        cells = {"id": np.array(data["id"]), "cell_coords": np.array(data["cell_coords"], dtype=float).T}
+        only = types.SimpleNamespace(data=cells)
+        self.cells = types.SimpleNamespace(subset=lambda name: types.SimpleNamespace(only=lambda *args: only))
+        self.h5py_file = types.SimpleNamespace(close=lambda: None)
+
+
+def _write_gridadmin(admin_path, cell_size):
+    """Gridadmin with 2x2 cells of cell_size."""
+    cell_coords = [[x, y, x + cell_size, y + cell_size] for x in [0, cell_size] for y in [0, cell_size]]
+    admin_path.write_text(json.dumps({"id": [1, 2, 3, 4], "cell_coords": cell_coords}))
+
+
+def test_load_cell_id_raster(monkeypatch):
+    """Test reuse and rebuild of cell id rasters of two gridadmins in a shared folder"""
+    gridadmin_module = types.SimpleNamespace(GridH5Admin=FakeGridH5Admin)
+    monkeypatch.setitem(sys.modules, "threedigrid", types.ModuleType("threedigrid"))
+    monkeypatch.setitem(sys.modules, "threedigrid.admin", types.ModuleType("threedigrid.admin"))
+    monkeypatch.setitem(sys.modules, "threedigrid.admin.gridadmin", gridadmin_module)
+
+    test_dir = TEMP_DIR / f"cell_ids_{hrt.get_uuid()}"
+    shared_dir = test_dir / "cell_ids"
+    shared_dir.mkdir(parents=True)
+    admin_paths = {}
+    for name, cell_size in [("a", 10), ("b", 5), ("c", 5)]:
+        (test_dir / name).mkdir()
+        admin_paths[name] = test_dir / name / "gridadmin.h5"
+        _write_gridadmin(admin_paths[name], cell_size=cell_size)
+
+    # Same gridadmin has the same hash, the hash is cached next to the gridadmin
+    hash_b = gridadmin_hash(admin_paths["b"])
+    assert hash_b == gridadmin_hash(admin_paths["c"])
+    assert hash_b != gridadmin_hash(admin_paths["a"])
+    assert admin_paths["b"].with_name("gridadmin.h5.sha256.json").exists()
+
+    FakeGridH5Admin.opened = 0
+    raster_a = load_cell_id_raster(admin_paths["a"], folder=shared_dir)
+    raster_b = load_cell_id_raster(admin_paths["b"], folder=shared_dir)
+    assert FakeGridH5Admin.opened == 2
+    assert raster_b.gridadmin_hash == hash_b
+    assert raster_a.gridadmin == str(admin_paths["a"].resolve())
+    assert (raster_a.shape, raster_a.resolution) == ((2, 2), 10)
+    assert (raster_b.shape, raster_b.resolution) == ((2, 2), 5)
+
+    # Reused without opening the gridadmin, also by another gridadmin with the same hash
+    assert load_cell_id_raster(admin_paths["a"], folder=shared_dir).npy_path == raster_a.npy_path
+    assert load_cell_id_raster(admin_paths["c"], folder=shared_dir).npy_path == raster_b.npy_path
+    assert FakeGridH5Admin.opened == 2
+
+    # Other resolution is another artifact
+    raster_a_5m = load_cell_id_raster(admin_paths["a"], folder=shared_dir, resolution=5)
+    assert raster_a_5m.shape == (4, 4)
+    assert FakeGridH5Admin.opened == 3
+
+    # Changed gridadmin is rebuilt, only its own old artifact is removed
+    _write_gridadmin(admin_paths["a"], cell_size=20)
+    raster_a_new = load_cell_id_raster(admin_paths["a"], folder=shared_dir)
+    assert FakeGridH5Admin.opened == 4
+    assert raster_a_new.npy_path != raster_a.npy_path
+    assert raster_a_new.resolution == 20
+    assert not raster_a.npy_path.exists()
+    assert raster_a_5m.npy_path.exists()
+    assert raster_b.npy_path.exists()
+
+
+# %%
+if __name__ == "__main__":
+    test_cell_id_raster()
+    test_load_cell_id_raster(pytest.MonkeyPatch())
@@ -0,0 +1,59 @@
+# %%
+import geopandas as gpd
+import pandas as pd
+
+import hhnk_research_tools as hrt
+from hhnk_research_tools.variables import DEF_DELIMITER
+from tests_hrt.config import TEMP_DIR, TEST_DIRECTORY
+
+LABELS_GPKG = TEST_DIRECTORY / r"area_test_labels.gpkg"
+
+
+def test_gdf_write_to_geopackage_fast():
+    """Test the fast gpkg writer, with and without arrow"""
+    gdf = gpd.read_file(LABELS_GPKG)
+
+    for use_arrow in [None, False]:
+        filename = f"labels_fast_{hrt.get_uuid()}"
+        filepath = hrt.gdf_write_to_geopackage(gdf, path=TEMP_DIR, filename=filename, fast=True, use_arrow=use_arrow)
+
+        gdf_out = gpd.read_file(filepath, layer=filename)
+        assert len(gdf_out) == len(gdf)
+        assert gdf_out["id"].tolist() == gdf["id"].tolist()
+        assert gdf_out.geometry.geom_equals(gdf.geometry).all()
+
+
+def test_gdf_write_to_geopackage_concurrent():
+    """Test writing multiple gpkgs at once"""
+    gdf = gpd.read_file(LABELS_GPKG)
+    gdf_dict = {
+        f"labels_a_{hrt.get_uuid()}": gdf,
+        f"labels_b_{hrt.get_uuid()}": gdf.iloc[:2],
+        f"labels_c_{hrt.get_uuid()}": gdf.iloc[:0],
+    }
+
+    filepaths = hrt.gdf_write_to_geopackage_concurrent(gdf_dict, path=TEMP_DIR, max_workers=2)
+
+    assert filepaths[2] is None  # Empty gdf is not written
+    for filepath, (filename, gdf_in) in list(zip(filepaths, gdf_dict.items()))[:2]:
+        assert len(gpd.read_file(filepath, layer=filename)) == len(gdf_in)
+
+
+def test_gdf_write_to_csv_chunks():
+    """Test that writing in chunks gives the same csv as writing at once"""
+    gdf = gpd.read_file(LABELS_GPKG)
+
+    filepath_chunks = hrt.gdf_write_to_csv(gdf, path=TEMP_DIR, filename=f"labels_{hrt.get_uuid()}", chunksize=3)
+    filepath_once = hrt.gdf_write_to_csv(gdf, path=TEMP_DIR, filename=f"labels_{hrt.get_uuid()}", chunksize=None)
+
+    df = pd.read_csv(filepath_chunks, sep=DEF_DELIMITER)
+    assert len(df) == len(gdf)
+    assert df["id"].tolist() == gdf["id"].tolist()
+    assert open(filepath_chunks).read() == open(filepath_once).read()
+
+
+# %%
+if __name__ == "__main__":
+    test_gdf_write_to_geopackage_fast()
+    test_gdf_write_to_geopackage_concurrent()
+    test_gdf_write_to_csv_chunks()
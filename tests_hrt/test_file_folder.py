@@ -4,10 +4,13 @@
 
 import importlib
 
+import geopandas as gpd
+from shapely.geometry import Point
+
 import hhnk_research_tools as hrt
 import hhnk_research_tools.folder_file_classes.file_class as fcl
 import hhnk_research_tools.folder_file_classes.folder_file_classes as ffcl
-from tests_hrt.config import TEMP_DIR
+from tests_hrt.config import TEMP_DIR, TEST_DIRECTORY
 
 importlib.reload(fcl)
 importlib.reload(ffcl)
@@ -31,7 +34,53 @@ def test_folder():
     assert folder.exists() is True
 
 
+def test_database_cache():
+    cache = hrt.DatabaseCache(TEMP_DIR / f"database_cache_{hrt.get_uuid()}", ttl=3600, max_size_mb=10)
+    gdf = gpd.GeoDataFrame({"code": ["a", "b"]}, geometry=[Point(0, 0), Point(1, 1)], crs="EPSG:28992")
+
+    # Layout of the sql should not matter for the key.
+    key = cache.key(db_dict={"service_name": "ODSPRD"}, sql="SELECT *\n  FROM DAMO_W.GEMAAL;", columns=None)
+    assert key == cache.key(db_dict={"service_name": "ODSPRD"}, sql="SELECT * FROM DAMO_W.GEMAAL", columns=None)
+    assert key != cache.key(db_dict={"service_name": "AQUAPRD"}, sql="SELECT * FROM DAMO_W.GEMAAL", columns=None)
+
+    assert cache.get(key) is None
+    cache.put(key, df=gdf, sql="SELECT * FROM DAMO_W.GEMAAL")
+    gdf_cached, sql = cache.get(key)
+    assert gdf_cached["code"].tolist() == ["a", "b"]
+    assert gdf_cached.crs == gdf.crs
+    assert sql == "SELECT * FROM DAMO_W.GEMAAL"
+
+    # Evict everything
+    cache.max_size_mb = 0
+    cache.evict()
+    assert cache.get(key) is None
+
+
+def test_convert_gdb_to_gpkg():
+    """Test conversion in batches, one layer at a time and concurrent"""
+    # Multi layer source, VectorTranslate reads gpkg the same way as filegdb.
+    src = hrt.FileGDB(TEMP_DIR / f"convert_src_{hrt.get_uuid()}.gpkg")
+    layer_counts = {}
+    for name in ["area_test", "area_test_labels"]:
+        gdf = gpd.read_file(TEST_DIRECTORY / f"{name}.gpkg")
+        gdf.to_file(src.path, layer=name, engine="pyogrio")
+        layer_counts[name] = len(gdf)
+
+    for max_workers in [1, 2]:
+        gpkg = TEMP_DIR / f"convert_dst_{hrt.get_uuid()}.gpkg"
+        hrt.convert_gdb_to_gpkg(
+            gdb=src, gpkg=gpkg, layers=list(layer_counts), batch_size=2, max_workers=max_workers, verbose=False
+        )
+
+        for layer, count in layer_counts.items():
+            assert len(gpd.read_file(gpkg, layer=layer)) == count
+        # Temporary gpkgs of the concurrent conversion are removed
+        assert list(TEMP_DIR.glob(f"{gpkg.stem}_*")) == []
+
+
 # %%
 if __name__ == "__main__":
     test_file()
     test_folder()
+    test_database_cache()
+    test_convert_gdb_to_gpkg()
@@ -0,0 +1,54 @@
+# %%
+import numpy as np
+
+from hhnk_research_tools.threedi.geometry_functions import (
+    grid_nodes_to_gdf,
+    line_geometries_to_coords,
+    line_geometries_to_geoseries,
+    point_geometries_to_wkt,
+)
+
+
+def test_line_geometries_to_geoseries():
+    # Lines as stored in the gridadmin; [x1..xn, y1..yn]
+    lines = np.empty(3, dtype=object)
+    lines[0] = np.array([0.0, 1.0, 2.0, 10.0, 11.0, 12.0])
+    lines[1] = np.array([5.0, 6.0])  # too short, gets dummy geometry
+    lines[2] = np.array([3.0, 4.0, 13.0, 14.0])
+
+    geoms = line_geometries_to_geoseries(lines)
+    assert geoms.crs == "EPSG:28992"
+    assert list(geoms.iloc[0].coords) == [(0.0, 10.0), (1.0, 11.0), (2.0, 12.0)]
+    assert list(geoms.iloc[1].coords) == [(0.0, 0.0), (25000.0, 25000.0)]
+    assert list(geoms.iloc[2].coords) == [(3.0, 13.0), (4.0, 14.0)]
+
+    # List output is kept for backwards compatibility
+    coords = line_geometries_to_coords(lines)
+    assert len(coords) == 3
+    assert coords[2].equals(geoms.iloc[2])
+
+
+def test_point_geometries():
+    # Coordinates as stored in the gridadmin; [[x1..xn], [y1..yn]]
+    coordinates = np.array([[0.0, 1.0, 2.0], [10.0, 11.0, 12.0]])
+
+    points = point_geometries_to_wkt(coordinates)
+    assert [(p.x, p.y) for p in points] == [(0.0, 10.0), (1.0, 11.0), (2.0, 12.0)]
+
+    class Nodes:
+        pass
+
+    class Results:
+        nodes = Nodes()
+
+    Results.nodes.coordinates = coordinates
+    nodes_gdf = grid_nodes_to_gdf(Results)
+    assert len(nodes_gdf) == 3
+    assert nodes_gdf.crs == "EPSG:28992"
+    assert nodes_gdf.geometry.iloc[2].equals(points[2])
+
+
+# %%
+if __name__ == "__main__":
+    test_line_geometries_to_geoseries()
+    test_point_geometries()
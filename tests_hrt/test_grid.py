@@ -0,0 +1,100 @@
+# %%
+import types
+
+import numpy as np
+import pandas as pd
+
+from hhnk_research_tools.threedi.grid import (
+    _lookup_index,
+    added_calc_val,
+    connection_val,
+    init_wlevel_col,
+    node_id_col,
+    node_type_col,
+    one_d_node_id_col,
+    read_1d2d_lines,
+    storage_area_col,
+)
+
+
+def test_lookup_index():
+    """Test positions in an unsorted lookup and ids that are missing"""
+    lookup_ids = np.array([30, 10, 20, 50])
+    idx, found = _lookup_index([20, 40, 50, 10, 60, 5], lookup_ids)
+
+    np.testing.assert_array_equal(found, [True, False, True, True, False, False])
+    np.testing.assert_array_equal(lookup_ids[idx[found]], [20, 50, 10])
+
+    idx, found = _lookup_index([1, 2], [])
+    assert not found.any()
+
+
+def _fake_results(line_node_ids):
+    """Gridadmin with 1d nodes 1-6 and 1d2d lines to line_node_ids.
+    Nodes 1, 3 and 5 are connection nodes, 2 and 6 added calculation nodes, 4 is neither.
+    """
+    node_ids = np.arange(1, 7)
+    nodes = types.SimpleNamespace(
+        id=node_ids,
+        content_pk=node_ids * 100,
+        coordinates=np.array([node_ids * 10.0, node_ids * 20.0]),
+        connectionnodes=types.SimpleNamespace(
+            id=np.array([5, 1, 3]),
+            initial_waterlevel=np.array([-0.5, -0.1, -0.3]),
+            storage_area=np.array([b"5.5", b"1.1", b"3.3"]),
+        ),
+        added_calculationnodes=types.SimpleNamespace(id=np.array([6, 2])),
+    )
+    lines = types.SimpleNamespace(
+        line_geometries=[np.array([0.0, 1.0, 0.0, float(i)]) for i in line_node_ids],
+        line_nodes=np.array([[100 + i, i] for i in line_node_ids]),
+    )
+    return types.SimpleNamespace(nodes=nodes, lines=types.SimpleNamespace(subset=lambda name: lines))
+
+
+def _read_1d2d_lines_reference(results):
+    """Look up the node values line by line, the reference for read_1d2d_lines."""
+    nodes = results.nodes
+    conn = nodes.connectionnodes
+    rows = []
+    for _, one_d_node_id in results.lines.subset(None).line_nodes:
+        node_pos = list(nodes.id).index(one_d_node_id)
+        row = {one_d_node_id_col: one_d_node_id, node_id_col: nodes.content_pk[node_pos]}
+        row[node_type_col] = None
+        row[init_wlevel_col] = np.nan
+        row[storage_area_col] = np.nan
+        if one_d_node_id in conn.id:
+            conn_pos = list(conn.id).index(one_d_node_id)
+            row[node_type_col] = connection_val
+            row[init_wlevel_col] = conn.initial_waterlevel[conn_pos]
+            row[storage_area_col] = float(conn.storage_area[conn_pos])
+        if one_d_node_id in nodes.added_calculationnodes.id:
+            row[node_type_col] = added_calc_val
+        rows.append(row)
+    return rows
+
+
+def test_read_1d2d_lines():
+    """Test values and order of the lines against a per line lookup"""
+    for line_node_ids in [[1, 2, 3, 4, 5, 6], [5, 2, 4, 1, 6, 3, 3]]:
+        results = _fake_results(line_node_ids)
+        gdf = read_1d2d_lines(results)
+        expected = _read_1d2d_lines_reference(results)
+
+        # Output follows the order of the lines
+        assert gdf[one_d_node_id_col].tolist() == line_node_ids
+        assert gdf.index.tolist() == line_node_ids
+        assert gdf[node_type_col].tolist() == [row[node_type_col] for row in expected]
+        expected = pd.DataFrame(expected)
+        for col in [node_id_col, init_wlevel_col, storage_area_col]:
+            pd.testing.assert_series_equal(
+                gdf[col].reset_index(drop=True), expected[col], check_names=False, check_dtype=False
+            )
+        assert [p.x for p in gdf["node_geometry"]] == [i * 10.0 for i in line_node_ids]
+        assert [g.coords[-1][1] for g in gdf.geometry] == [float(i) for i in line_node_ids]
+
+
+# %%
+if __name__ == "__main__":
+    test_lookup_index()
+    test_read_1d2d_lines()
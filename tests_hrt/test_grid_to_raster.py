@@ -0,0 +1,95 @@
+# %%
+import json
+import types
+
+import numpy as np
+
+import hhnk_research_tools as hrt
+from hhnk_research_tools.threedi.cell_id_raster import CellIdRaster, _rasterize_cells
+from hhnk_research_tools.threedi.grid_to_raster import THREEDI_NODATA, GridToRaster
+from tests_hrt.config import TEMP_DIR, TEST_DIRECTORY
+
+# Waterlevel per cell id, cell 3 is dry. Index 0 is CELL_ID_NODATA.
+CELL_LEVELS = np.array([np.nan, 5.0, -100.0, np.nan, 0.5])
+
+
+def _fake_threedi_result(dem):
+    """Create a result with four 40m cells covering the 80x80m dem:
+    1 left top, 2 right top, 3 left bottom, 4 right bottom.
+    """
+    x_min, y_max = dem.metadata.x_min, dem.metadata.y_max
+    cell_coords = []
+    for y in [y_max - 40, y_max - 80]:
+        for x in [x_min, x_min + 40]:
+            cell_coords.append([x, y, x + 40, y + 40])
+    id_grid, (x0, y1, dx) = _rasterize_cells(np.arange(1, 5), np.array(cell_coords, dtype=float).T)
+
+    npy_path = TEMP_DIR / f"cell_ids_{hrt.get_uuid()}.npy"
+    np.save(npy_path, id_grid)
+    npy_path.with_suffix(".json").write_text(
+        json.dumps({"x_min": x0, "y_max": y1, "resolution": dx, "gridadmin_hash": "test"})
+    )
+    return types.SimpleNamespace(
+        grid_path=types.SimpleNamespace(path=dem.path),
+        cell_id_raster=lambda resolution=None: CellIdRaster(npy_path),
+    )
+
+
+def test_cell_values():
+    """Test max over timesteps in chunks, dry cells are nan"""
+    s1 = np.array(
+        [
+            [1.0, THREEDI_NODATA, THREEDI_NODATA],
+            [3.0, 2.0, THREEDI_NODATA],
+            [2.0, 4.0, THREEDI_NODATA],
+            [0.0, 1.0, THREEDI_NODATA],
+            [5.0, 3.0, THREEDI_NODATA],
+        ]
+    )
+    nodes = types.SimpleNamespace(
+        id=np.array([1, 2, 4]),
+        timestamps=np.arange(len(s1)),
+        timeseries=lambda indexes: types.SimpleNamespace(s1=s1[indexes]),
+    )
+    threedi_result = types.SimpleNamespace(
+        grid=types.SimpleNamespace(nodes=types.SimpleNamespace(subset=lambda name: nodes))
+    )
+    grid_to_raster = GridToRaster(threedi_result=threedi_result, dem=None)
+
+    lookup = grid_to_raster.cell_values(timestep="max", chunk_size=2)
+    np.testing.assert_array_equal(lookup, [np.nan, 5.0, 4.0, np.nan, np.nan])
+
+    lookup = grid_to_raster.cell_values(timestep=1)
+    np.testing.assert_array_equal(lookup, [np.nan, 3.0, 2.0, np.nan, np.nan])
+
+
+def test_grid_to_raster():
+    """Test depth and level raster of a small grid on the test dem"""
+    dem = hrt.Raster(TEST_DIRECTORY / r"depth_test.tif")
+    dem_block_size = dem.min_block_size
+    grid_to_raster = GridToRaster(threedi_result=_fake_threedi_result(dem), dem=dem, min_block_size=40)
+    grid_to_raster.cell_values = lambda variable, timestep: CELL_LEVELS
+
+    # Expected level per pixel, cells are 80x80 pixels of 0.5m
+    level = np.repeat(np.repeat(CELL_LEVELS[1:].reshape(2, 2), 80, axis=0), 80, axis=1)
+    dem_array = dem.get_array()
+    depth = level - dem_array
+    wet = ~np.isnan(depth) & (depth > 0) & (dem_array != dem.nodata)
+    assert wet[:80, :80].any() and not wet[:80, 80:].any()  # Cell 1 is wet, cell 2 is below the dem
+
+    for output in ["depth", "level"]:
+        output_raster = hrt.Raster(TEMP_DIR / f"grid_to_raster_{output}_{hrt.get_uuid()}.tif")
+        grid_to_raster.run(output_raster=output_raster, output=output, output_nodata=-9999)
+
+        array = output_raster.get_array()
+        expected = np.where(wet, depth if output == "depth" else level, -9999)
+        np.testing.assert_allclose(array, expected, rtol=1e-6)
+
+    # Blocks of 40 pixels are used without changing the dem
+    assert dem.min_block_size == dem_block_size
+
+
+# %%
+if __name__ == "__main__":
+    test_cell_values()
+    test_grid_to_raster()
@@ -0,0 +1,54 @@
+# %%
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+import hhnk_research_tools as hrt
+
+# Dependencies that should only be imported when they are used.
+HEAVY_MODULES = ["osgeo", "geopandas", "matplotlib", "scipy", "oracledb", "fiona", "threedigrid", "IPython"]
+PACKAGE_ROOT = Path(__file__).parents[1]
+
+
+def _run_python(code, *args):
+    return subprocess.run(
+        [sys.executable, *args, "-c", code], capture_output=True, text=True, check=True, cwd=PACKAGE_ROOT
+    )
+
+
+def test_import_is_lazy():
+    result = _run_python(f"import sys, hhnk_research_tools; print([m for m in {HEAVY_MODULES} if m in sys.modules])")
+    assert result.stdout.strip() == "[]"
+
+
+def test_import_time():
+    """Report the import time (cumulative time of -X importtime) and check that none of
+    the heavy modules are part of it. The time itself is not asserted, it depends on
+    the machine.
+    """
+    result = _run_python("import hhnk_research_tools", "-X", "importtime")
+    import_lines = [line for line in result.stderr.splitlines() if line.startswith("import time:")]
+    import_line = [line for line in import_lines if line.endswith("| hhnk_research_tools")][-1]
+    import_time_us = int(import_line.split("|")[1])
+    print(f"import hhnk_research_tools: {import_time_us / 1e6:.3f}s")
+
+    imported = {line.split("|")[2].strip().split(".")[0] for line in import_lines[1:]}
+    assert imported.isdisjoint(HEAVY_MODULES)
+
+
+def test_lazy_attributes():
+    assert "Raster" in dir(hrt)
+    assert "threedi" in dir(hrt)
+    assert hrt.time_delta is hrt.general_functions.time_delta
+
+    with pytest.raises(AttributeError):
+        hrt.does_not_exist
+
+
+# %%
+if __name__ == "__main__":
+    test_import_is_lazy()
+    test_import_time()
+    test_lazy_attributes()
@@ -0,0 +1,50 @@
+# %%
+import json
+
+from hhnk_research_tools.logger import Metrics
+
+
+def test_metrics(tmp_path):
+    metrics_path = tmp_path / "metrics.jsonl"
+    metrics = Metrics()
+
+    # Disabled metrics are not recorded
+    metrics.incr("rows", 5)
+    assert metrics.counters == {}
+
+    metrics.enable(metrics_path)
+    metrics.incr("rows", 5, table="a")
+    metrics.incr("rows", 3, table="b")
+    with metrics.timer("calc"):
+        pass
+    for value in [1, 3, 3, 100]:
+        metrics.histogram("size", value)
+    metrics.disable()
+
+    records = [json.loads(line) for line in metrics_path.read_text().splitlines()]
+    assert len(records) == 8
+    assert records[0]["type"] == "counter"
+    assert records[0]["table"] == "a"
+    assert records[2]["type"] == "timer"
+
+    summary = records[-1]
+    assert summary["type"] == "summary"
+    assert summary["counters"] == {"rows": 8}
+    assert summary["timers"]["calc"]["count"] == 1
+    assert summary["histograms"]["size"]["max"] == 100
+    assert summary["histograms"]["size"]["buckets"] == {"1": 1, "4": 2, "128": 1}
+
+
+def test_metrics_instances(tmp_path):
+    """Records of one instance are not written to the file of another."""
+    metrics_a, metrics_b = Metrics(), Metrics()
+    metrics_a.enable(tmp_path / "a.jsonl")
+    metrics_b.enable(tmp_path / "b.jsonl")
+    metrics_a.incr("rows_a")
+    metrics_b.incr("rows_b")
+    metrics_a.disable()
+    metrics_b.disable()
+
+    for name in ["a", "b"]:
+        records = [json.loads(line) for line in (tmp_path / f"{name}.jsonl").read_text().splitlines()]
+        assert [r["metric"] for r in records] == [f"rows_{name}", "summary"]
@@ -0,0 +1,111 @@
+# %%
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from hhnk_research_tools.processes import (
+    BatchedPool,
+    SharedArray,
+    SharedGeoDataFrame,
+    SharedGeometries,
+    multiprocess,
+)
+
+
+def _add_offset(idx, row, offset):
+    return row["value"] + offset
+
+
+def _square(idx, item, offset=0):
+    return idx, item**2 + offset
+
+
+def test_multiprocess():
+    df = pd.DataFrame({"value": np.arange(100)}, index=np.arange(100) + 1000)
+    results = multiprocess(df, _add_offset, processes=2, use_pbar=False, stepsize=30, offset=5)
+    assert results == list(df["value"] + 5)
+
+
+def test_batched_pool():
+    arr = np.arange(50)
+    progress = []
+    with BatchedPool(_square, processes=2, chunksize=7, offset=1) as pool:
+        results = pool.map(arr, callback=lambda done, total: progress.append((done, total)))
+        assert results == [(i, i**2 + 1) for i in arr]
+        assert progress[-1] == (50, 50)
+
+        # The same pool is reused; unordered yields (idx, result).
+        unordered = dict(pool.imap(list(arr), ordered=False))
+        assert unordered == dict(enumerate(results))
+
+
+def _lookup_shared(idx, row, values, geometries):
+    return values[row["value"]] + geometries[idx].x
+
+
+def test_share_memory():
+    df = pd.DataFrame({"value": np.arange(20)[::-1]})
+    values = np.arange(20) * 10.0
+    geometries = gpd.GeoSeries([Point(i, 0) for i in range(20)], crs="EPSG:28992")
+
+    with BatchedPool(_lookup_shared, processes=2, share_memory=True, values=values, geometries=geometries) as pool:
+        assert isinstance(pool.kwargs["values"], SharedArray)
+        assert isinstance(pool.kwargs["geometries"], SharedGeometries)
+        shared_names = [pool.kwargs["values"].name, pool.kwargs["geometries"].blob.name]
+
+        results = pool.map(df)
+    assert results == [values[v] + i for i, v in enumerate(df["value"])]
+
+    # Shared memory is freed when the pool exits.
+    for name in shared_names:
+        with pytest.raises(FileNotFoundError):
+            SharedArray(name=name, shape=(1,), dtype="u1")
+
+
+def test_shared_geometries():
+    geometries = [Point(0, 0), None, Point(2, 2)]
+    shared = SharedGeometries(geometries)
+    assert len(shared) == 3
+    assert shared[1] is None
+    assert shared[2].equals(Point(2, 2))
+    assert all(a is None and b is None or a.equals(b) for a, b in zip(shared.geometries, geometries))
+    shared.unlink()
+
+
+def _lookup_gdf(idx, item, gdf):
+    row = gdf.loc[item]
+    return row["name"], row["value"], row.geometry.x, gdf.crs.to_epsg()
+
+
+def test_share_memory_gdf():
+    gdf = gpd.GeoDataFrame(
+        {"name": [f"n{i}" for i in range(10)], "value": np.arange(10) * 1.5},
+        geometry=[Point(i, 0) for i in range(10)],
+        index=np.arange(10) + 100,
+        crs="EPSG:28992",
+    )
+
+    with BatchedPool(_lookup_gdf, processes=2, share_memory=True, gdf=gdf) as pool:
+        shared_gdf = pool.kwargs["gdf"]
+        assert isinstance(shared_gdf, SharedGeoDataFrame)
+        assert isinstance(shared_gdf.data["value"], SharedArray)
+        assert isinstance(shared_gdf.data["geometry"], SharedGeometries)
+        assert isinstance(shared_gdf.index, SharedArray)
+
+        results = pool.map([105, 101])
+    assert results == [("n5", 7.5, 5.0, 28992), ("n1", 1.5, 1.0, 28992)]
+
+    shared_gdf = SharedGeoDataFrame(gdf)
+    pd.testing.assert_frame_equal(shared_gdf.to_gdf(), gdf)
+    shared_gdf.unlink()
+
+
+# %%
+if __name__ == "__main__":
+    test_multiprocess()
+    test_batched_pool()
+    test_share_memory()
+    test_shared_geometries()
+    test_share_memory_gdf()
@@ -1,4 +1,5 @@
 # %%
+import shutil
 from pathlib import Path
 
 import numpy as np
@@ -6,6 +7,7 @@ import pytest
 
 import hhnk_research_tools as hrt
 from hhnk_research_tools.gis.raster import Raster
+from hhnk_research_tools.raster_functions import COG_MAX_Z_ERROR
 from tests_hrt.config import TEMP_DIR, TEST_DIRECTORY
 
 
@@ -66,6 +68,52 @@ class TestRaster:
         out_raster.create(metadata=self.raster.metadata, nodata=self.raster.nodata)
         assert out_raster.exists()
 
+    def test_overviews(self):
+        out_raster = Raster(TEMP_DIR / f"test_overviews_{hrt.get_uuid()}.tif")
+        shutil.copy(self.raster.path, out_raster.path)
+
+        out_raster.build_overviews(levels=[2, 4], external=True)
+        assert out_raster.overview_count == 2
+        assert out_raster.path.with_suffix(".tif.ovr").exists()
+
+        # Pixelsize is 0.5m
+        assert out_raster._read_array(target_res=2).shape == (40, 40)
+        assert out_raster.get_array(window=[0, 0, 80, 80], target_res=1).shape == (40, 40)
+        assert out_raster._read_array(target_res=0.25).shape == (160, 160)
+
+    def test_warp(self):
+        georef = self.raster.metadata.georef
+        out_raster = self.raster.warp(
+            output_file=TEMP_DIR / f"test_warp_{hrt.get_uuid()}.tif", target_res=1, resampling="average"
+        )
+        assert out_raster.shape == [80, 80]
+        assert out_raster.metadata.bounds == self.raster.metadata.bounds
+        assert self.raster.metadata.georef == georef  # Source is not changed
+
+        out_raster = self.raster.warp(
+            output_file=TEMP_DIR / f"test_warp_{hrt.get_uuid()}.tif", target_res=0.75, target_aligned=True
+        )
+        assert out_raster.metadata.pixel_width == 0.75
+        assert out_raster.metadata.x_min % 0.75 == 0
+
+        # Same grid, the only error is the LERC compression of the cog, applied once.
+        out_raster = self.raster.warp(output_file=TEMP_DIR / f"test_warp_{hrt.get_uuid()}.tif", profile="cog")
+        assert np.abs(out_raster.get_array() - self.raster.get_array()).max() <= COG_MAX_Z_ERROR + 1e-6
+
+    def test_to_cog(self):
+        out_raster = Raster(TEMP_DIR / f"test_cog_{hrt.get_uuid()}.tif")
+        out_raster.create(metadata=self.raster.metadata, nodata=self.raster.nodata, profile="cog")
+        out_raster.write_array(array=self.raster.get_array(), window=[0, 0, 160, 160])
+        # Lossless while writing blocks
+        assert np.array_equal(out_raster.get_array(), self.raster.get_array())
+
+        out_raster.to_cog()
+        gdal_src = out_raster.open_gdal_source_read()
+        assert gdal_src.GetMetadata("IMAGE_STRUCTURE")["LAYOUT"] == "COG"
+        assert gdal_src.GetMetadata("IMAGE_STRUCTURE")["COMPRESSION"] == "LERC_ZSTD"
+        # Lossy LERC is only applied once, in to_cog
+        assert np.abs(out_raster.get_array() - self.raster.get_array()).max() <= COG_MAX_Z_ERROR + 1e-6
+
 
 class TestRasterMetadata:
     def test_init_fail(self):
@@ -1,5 +1,6 @@
 # %%
 import json
+import shutil
 
 import geopandas as gpd
 import numpy as np
@@ -68,6 +69,7 @@ def test_raster_calculator():
         calc.run(overwrite=False)
 
     # Working calculator
+    instrumentation = hrt.RasterInstrumentation(name="test_raster_calculator")
     calc = hrt.RasterCalculatorV2(
         raster_out=raster_out,
         raster_paths_dict={
@@ -83,12 +85,162 @@ def test_raster_calculator():
         min_block_size=4096,
         verbose=True,
         tempdir=hrt.Folder(TEMP_DIR / "temprasters"),
+        instrumentation=instrumentation,
     )
 
     calc.run(overwrite=False)
 
     assert raster_out.sum() == 19834
 
+    report = instrumentation.report()
+    assert instrumentation.blocks_total == 1
+    assert report.loc["compute", "count"] == 1
+    assert report.loc["read:depth", "mb"] > 0
+
+
+def _run_resample(raster_meta, raster_in, resampling, output_nodata):
+    """Write raster_in, read on the grid of raster_meta with resampling, as output."""
+    raster_out = hrt.Raster(TEMP_DIR / f"rastercalc_resample_{hrt.get_uuid()}.tif")
+
+    def run_window(block):
+        return block.blocks["in"]
+
+    calc = hrt.RasterCalculatorV2(
+        raster_out=raster_out,
+        raster_paths_dict={
+            "meta": raster_meta,
+            "in": raster_in,
+        },
+        nodata_keys=[],
+        mask_keys=[],
+        metadata_key="meta",
+        custom_run_window_function=run_window,
+        output_nodata=output_nodata,
+        min_block_size=4096,
+        resample_dict={"in": resampling},
+    )
+    calc.run(overwrite=True)
+    assert raster_out.shape == raster_meta.shape
+    return raster_out.get_array()
+
+
+def test_raster_calculator_resample():
+    """Test inputs with another resolution or extent, resampled per block"""
+    raster_depth = hrt.Raster(TEST_DIRECTORY / r"depth_test.tif")
+    raster_lu = hrt.Raster(TEST_DIRECTORY / r"landuse_test.tif")
+    nodata = raster_depth.nodata
+
+    # Finer input, 2x2 pixels of the nearest upsampled raster have the value of the original pixel.
+    raster_fine = raster_depth.warp(output_file=TEMP_DIR / f"depth_fine_{hrt.get_uuid()}.tif", target_res=0.25)
+    array = _run_resample(raster_depth, raster_fine, resampling="max", output_nodata=nodata)
+    assert np.array_equal(array, raster_depth.get_array())
+
+    # Coarser input, each pixel is repeated on 2x2 pixels of the output
+    raster_coarse = raster_depth.warp(
+        output_file=TEMP_DIR / f"depth_coarse_{hrt.get_uuid()}.tif", target_res=1, resampling="average"
+    )
+    array = _run_resample(raster_depth, raster_coarse, resampling="nearest", output_nodata=nodata)
+    expected = np.repeat(np.repeat(raster_coarse.get_array(), 2, axis=0), 2, axis=1)
+    assert np.array_equal(array, expected)
+
+    # Aggregation of finer inputs on a coarser grid, same as warping the input
+    for raster_in, resampling in [(raster_depth, "average"), (raster_lu, "mode")]:
+        raster_warp = raster_in.warp(
+            output_file=TEMP_DIR / f"{raster_in.stem}_{resampling}_{hrt.get_uuid()}.tif",
+            target_res=1,
+            resampling=resampling,
+        )
+        array = _run_resample(raster_coarse, raster_in, resampling=resampling, output_nodata=raster_in.nodata)
+        assert np.allclose(array, raster_warp.get_array())
+
+    # Input with a smaller extent, pixels outside the input are nodata
+    raster_small = hrt.Raster(TEST_DIRECTORY / r"lu_small.tif")
+    array = _run_resample(raster_depth, raster_small, resampling="nearest", output_nodata=raster_small.nodata)
+    expected = np.full(raster_depth.shape, raster_small.nodata)
+    expected[102:151, 20:132] = raster_small.get_array()
+    assert np.array_equal(array, expected)
+
+
+def test_raster_calculator_incremental():
+    """Test that an incremental run only calculates blocks with changed inputs"""
+    raster_depth = hrt.Raster(TEMP_DIR / f"depth_incremental_{hrt.get_uuid()}.tif")
+    shutil.copy(TEST_DIRECTORY / r"depth_test.tif", raster_depth.path)
+    raster_out = hrt.Raster(TEMP_DIR / f"rastercalc_incremental_{hrt.get_uuid()}.tif")
+    nodata = raster_depth.nodata
+
+    def multiply_window(factor):
+        def run_window(block):
+            block_out = block.blocks["depth"] * factor
+            block_out[block.masks_all] = nodata
+            return block_out
+
+        return run_window
+
+    instrumentation = hrt.RasterInstrumentation(name="test_incremental")
+    calc_kwargs = {
+        "raster_out": raster_out,
+        "raster_paths_dict": {"depth": raster_depth},
+        "nodata_keys": ["depth"],
+        "mask_keys": ["depth"],
+        "metadata_key": "depth",
+        "output_nodata": nodata,
+        "min_block_size": 40,  # 16 blocks
+        "instrumentation": instrumentation,
+    }
+    calc = hrt.RasterCalculatorV2(custom_run_window_function=multiply_window(2), **calc_kwargs)
+    calc.run(incremental=True)
+    assert calc.block_signatures_path.exists()
+    assert instrumentation.blocks_total == 16
+    blocks_data = instrumentation.report().loc["compute", "count"]  # Blocks that are not all nodata
+    assert 1 < blocks_data < 16
+
+    # Nothing changed, no blocks are calculated
+    calc.run(incremental=True)
+    assert "compute" not in instrumentation.report().index
+    assert instrumentation.skipped_blocks == instrumentation.blocks_total
+
+    # Changed input in one block is calculated and written in the existing output
+    array = raster_depth.get_array()
+    rows, cols = np.nonzero(array != nodata)
+    row, col = rows[0], cols[0]
+    array[row, col] += 1
+    raster_depth.write_array(array=array[row : row + 1, col : col + 1], window=[col, row, 1, 1])
+    calc.run(incremental=True)
+    assert instrumentation.report().loc["compute", "count"] == 1
+    assert instrumentation.skipped_blocks == instrumentation.blocks_total - 1
+
+    array_out = raster_out.get_array()
+    assert np.allclose(array_out[array != nodata], array[array != nodata] * 2)
+    assert (array_out[array == nodata] == nodata).all()
+
+    # Another function (only the value in the closure differs) recalculates all blocks
+    calc = hrt.RasterCalculatorV2(custom_run_window_function=multiply_window(3), **calc_kwargs)
+    calc.run(incremental=True)
+    assert instrumentation.report().loc["compute", "count"] == blocks_data
+    assert np.allclose(raster_out.get_array()[array != nodata], array[array != nodata] * 3)
+
+    # Changed array kwarg recalculates all blocks, also when it has more values than numpy prints
+    def run_window_offset(block, offset):
+        block_out = block.blocks["depth"] + offset.max()
+        block_out[block.masks_all] = nodata
+        return block_out
+
+    offset = np.zeros(5000)
+    calc = hrt.RasterCalculatorV2(custom_run_window_function=run_window_offset, **calc_kwargs)
+    calc.run(incremental=True, offset=offset)
+    calc.run(incremental=True, offset=offset.copy())
+    assert "compute" not in instrumentation.report().index
+
+    offset[2500] = 1
+    calc.run(incremental=True, offset=offset)
+    assert instrumentation.report().loc["compute", "count"] == blocks_data
+    assert np.allclose(raster_out.get_array()[array != nodata], array[array != nodata] + 1)
+
+    # Blocks cannot be updated in a cog
+    calc = hrt.RasterCalculatorV2(custom_run_window_function=multiply_window(3), profile="cog", **calc_kwargs)
+    with pytest.raises(ValueError, match="cog"):
+        calc.run(incremental=True)
+
 
 def test_raster_label_stats():
     """Test calculation of statistics per label"""
@@ -149,4 +301,6 @@ def test_raster_label_stats():
 if __name__ == "__main__":
     test_raster_blocks()
     test_raster_calculator()
+    test_raster_calculator_resample()
+    test_raster_calculator_incremental()
     test_raster_label_stats()
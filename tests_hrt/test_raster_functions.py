@@ -2,6 +2,7 @@
 import geopandas as gpd
 import numpy as np
 import pytest
+from osgeo import gdal
 
 import hhnk_research_tools as hrt
 from tests_hrt.config import TEMP_DIR, TEST_DIRECTORY
@@ -63,6 +64,25 @@ class TestRasterFunctions:
 
         assert vrt_path.exists()
 
+    def test_smallest_datatype(self, metadata):
+        assert hrt.raster_functions.get_smallest_datatype(np.array([0.0, 1, 255]), nodata=0) == gdal.GDT_Byte
+        assert hrt.raster_functions.get_smallest_datatype(np.array([1, 2]), nodata=-9999) == gdal.GDT_Int16
+        assert hrt.raster_functions.get_smallest_datatype(np.array([0.5]), nodata=-9999) == gdal.GDT_Float32
+
+        output_raster = hrt.Raster(TEMP_DIR / f"save_raster_array_auto_{hrt.get_uuid()}.tif")
+        hrt.save_raster_array_to_tiff(
+            output_file=output_raster.path,
+            raster_array=np.array([[1.234, 2.5], [-9999, 3]]),
+            nodata=-9999,
+            metadata=metadata,
+            datatype="auto",
+            decimals=2,
+        )
+        band = output_raster.open_gdal_source_read().GetRasterBand(1)
+        assert band.DataType == gdal.GDT_Int16
+        assert band.GetScale() == 0.01
+        assert output_raster.get_array().tolist() == [[123, 250], [-9999, 300]]
+
 
 if __name__ == "__main__":
     import inspect
@@ -0,0 +1,124 @@
+# %%
+import contextlib
+import sqlite3
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+import shapely
+
+from hhnk_research_tools import sql_functions
+from hhnk_research_tools.sql_functions import (
+    database_to_gdf_tiled,
+    sql_builder_select_by_location_tiled,
+    sqlite_bulk_update,
+)
+
+
+def test_sqlite_bulk_update():
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE v2_channel (id INTEGER PRIMARY KEY, code TEXT, zoom_category INTEGER)")
+    conn.executemany("INSERT INTO v2_channel VALUES (?, ?, ?)", [(i, "old", 0) for i in range(10)])
+    conn.commit()
+
+    df = pd.DataFrame(
+        {
+            "channel_id": np.arange(5, 15),
+            "new_code": [f"new_{i}" for i in range(10)],
+            "new_zoom": np.arange(10),
+        }
+    )
+    df.loc[0, "new_code"] = None
+
+    rowcount = sqlite_bulk_update(
+        df=df,
+        table_name="v2_channel",
+        df_id_col="channel_id",
+        db_id_col="id",
+        update_cols={"new_code": "code", "new_zoom": "zoom_category"},
+        excluded_ids=[6],
+        conn=conn,
+    )
+
+    # ids 10-14 are not in the table and 6 is excluded
+    assert rowcount == 4
+    result = dict(conn.execute("SELECT id, code FROM v2_channel").fetchall())
+    assert result[4] == "old"
+    assert result[5] is None
+    assert result[6] == "old"
+    assert result[9] == "new_4"
+
+    # Open transaction of the caller is not committed
+    conn.execute("INSERT INTO v2_channel VALUES (20, 'pending', 0)")
+    sqlite_bulk_update(
+        df=df,
+        table_name="v2_channel",
+        df_id_col="channel_id",
+        db_id_col="id",
+        update_cols={"new_code": "code", "new_zoom": "zoom_category"},
+        conn=conn,
+    )
+    assert conn.in_transaction
+    conn.rollback()
+    result = dict(conn.execute("SELECT id, code FROM v2_channel").fetchall())
+    assert 20 not in result
+    assert result[9] == "new_4"  # From the first, committed, update
+
+    # Duplicate ids, the last row is used
+    df_duplicates = pd.DataFrame({"channel_id": [1, 2, 1], "new_code": ["a", "b", "c"], "new_zoom": [1, 2, 3]})
+    rowcount = sqlite_bulk_update(
+        df=df_duplicates,
+        table_name="v2_channel",
+        df_id_col="channel_id",
+        db_id_col="id",
+        update_cols={"new_code": "code", "new_zoom": "zoom_category"},
+        conn=conn,
+    )
+    assert rowcount == 2
+    result = conn.execute("SELECT id, code, zoom_category FROM v2_channel WHERE id IN (1, 2)").fetchall()
+    assert result == [(1, "c", 3), (2, "b", 2)]
+    conn.close()
+
+
+def test_sql_builder_select_by_location_tiled():
+    """Tiles that only touch the edge of the polygon are dropped"""
+    # L-shape of 4x4 with the right top 2x2 missing, tiles of 2x2
+    polygon = shapely.Polygon([(0, 0), (4, 0), (4, 2), (2, 2), (2, 4), (0, 4)])
+    tiles_gdf = sql_builder_select_by_location_tiled(
+        schema="DAMO_W", table_name="HYDROOBJECT", polygon_wkt=polygon, tile_size=2
+    )
+
+    assert len(tiles_gdf) == 3
+    assert set(tiles_gdf.geom_type) == {"Polygon"}
+    assert tiles_gdf.area.sum() == polygon.area
+    assert tiles_gdf["sql"].str.contains("HYDROOBJECT").all()
+
+
+def test_database_to_gdf_tiled_empty(monkeypatch):
+    """Tiles without features give an empty result with the columns of the query"""
+    pool = types.SimpleNamespace(acquire=lambda: contextlib.nullcontext(), close=lambda force: None)
+    monkeypatch.setattr(sql_functions.oracledb, "create_pool", lambda **kwargs: pool)
+    monkeypatch.setattr(
+        sql_functions,
+        "_database_to_gdf",
+        lambda con, sql, **kwargs: (pd.DataFrame(columns=["objectid", "geometry", "naam"]), sql),
+    )
+
+    polygon = shapely.box(0, 0, 4, 4)
+    tiles_gdf = sql_builder_select_by_location_tiled(
+        schema="DAMO_W", table_name="HYDROOBJECT", polygon_wkt=polygon, tile_size=2
+    )
+    gdf, tiles_gdf = database_to_gdf_tiled(db_dict={}, tiles_gdf=tiles_gdf, crs="EPSG:28992")
+
+    assert gdf.empty
+    assert list(gdf.columns) == ["objectid", "geometry", "naam"]
+    assert gdf.crs == "EPSG:28992"
+    assert (tiles_gdf["features"] == 0).all()
+
+
+# %%
+if __name__ == "__main__":
+    test_sqlite_bulk_update()
+    test_sql_builder_select_by_location_tiled()
+    test_database_to_gdf_tiled_empty(pytest.MonkeyPatch())
@@ -1,6 +1,109 @@
 # %%
+import os
+import sys
+import types
+
+import pytest
+
+import hhnk_research_tools as hrt
+from tests_hrt.config import TEMP_DIR
 
 
 class ThreediResultLoader:
     def __init__(self, grid):
         self.grid = grid
+
+
+class FakeAdmin:
+    """Threedigrid admin that records if it is closed."""
+
+    def __init__(self, *paths):
+        self.paths = paths
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeContextAdmin:
+    """Threedigrid admin that is only closed with the context manager api."""
+
+    def __init__(self, *paths):
+        self.paths = paths
+        self.closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.closed = True
+
+
+def _fake_threedigrid(monkeypatch):
+    """Replace the threedigrid admins with the fakes."""
+    gridadmin = types.SimpleNamespace(GridH5Admin=FakeContextAdmin)
+    gridresultadmin = types.SimpleNamespace(GridH5ResultAdmin=FakeAdmin, GridH5AggregateResultAdmin=FakeAdmin)
+    monkeypatch.setitem(sys.modules, "threedigrid", types.ModuleType("threedigrid"))
+    monkeypatch.setitem(sys.modules, "threedigrid.admin", types.ModuleType("threedigrid.admin"))
+    monkeypatch.setitem(sys.modules, "threedigrid.admin.gridadmin", gridadmin)
+    monkeypatch.setitem(sys.modules, "threedigrid.admin.gridresultadmin", gridresultadmin)
+
+
+def _result_folder():
+    folder = TEMP_DIR / f"threediresult_{hrt.get_uuid()}"
+    folder.mkdir()
+    for name in ["gridadmin.h5", "results_3di.nc", "aggregate_results_3di.nc"]:
+        (folder / name).write_text("")
+    return folder
+
+
+def test_threediresult_admin_cache(monkeypatch):
+    """Test that admins are cached and reopened when a file changed"""
+    _fake_threedigrid(monkeypatch)
+    result = hrt.ThreediResult(_result_folder())
+
+    grid = result.grid
+    admin = result.admin
+    assert isinstance(grid, FakeAdmin) and isinstance(admin, FakeContextAdmin)
+    assert result.grid is grid
+    assert result.admin is admin
+    assert result.aggregate_grid is not grid
+
+    # Changed results reopen the grid, the admin only depends on the gridadmin
+    stat = result.grid_path.path.stat()
+    os.utime(result.grid_path.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert result.grid is not grid
+    assert grid.closed
+    assert result.admin is admin
+
+    # Changed gridadmin reopens all admins that use it
+    grid = result.grid
+    stat = result.admin_path.path.stat()
+    os.utime(result.admin_path.path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert result.admin is not admin
+    assert result.grid is not grid
+    assert admin.closed and grid.closed
+
+
+def test_threediresult_close(monkeypatch):
+    """Test close and the context manager"""
+    _fake_threedigrid(monkeypatch)
+    folder = _result_folder()
+
+    result = hrt.ThreediResult(folder)
+    admins = [result.grid, result.aggregate_grid, result.admin]
+    result.close()
+    assert all(admin.closed for admin in admins)
+    assert result._admins == {}
+    assert not result.grid.closed  # Opened again after close
+
+    with hrt.ThreediResult(folder) as result:
+        admins = [result.grid, result.admin]
+        assert not any(admin.closed for admin in admins)
+    assert all(admin.closed for admin in admins)
+
+
+# %%
+if __name__ == "__main__":
+    test_threediresult_admin_cache(pytest.MonkeyPatch())
+    test_threediresult_close(pytest.MonkeyPatch())
@@ -0,0 +1,93 @@
+# %%
+import pytest
+from osgeo import gdal
+
+import hhnk_research_tools as hrt
+from hhnk_research_tools.gis.tile_index import TileIndex
+from tests_hrt.config import TEMP_DIR, TEST_DIRECTORY
+
+
+def test_tile_index():
+    tiles_dir = TEMP_DIR / f"tiles_{hrt.get_uuid()}"
+    tiles_dir.mkdir()
+    raster = hrt.Raster(TEST_DIRECTORY / r"depth_test.tif")
+
+    # Split raster in a left and right tile
+    tile_paths = []
+    for i, window in enumerate([[0, 0, 80, 160], [80, 0, 80, 160]]):
+        tile_path = tiles_dir / f"tile_{i}.tif"
+        gdal.Translate(str(tile_path), str(raster.path), srcWin=window)
+        tile_paths.append(tile_path)
+
+    vrt_path = tiles_dir / "mosaic.vrt"
+    tile_index = TileIndex.from_vrt(vrt_path)
+    assert tile_index.update(tile_paths)
+    assert len(tile_index) == 2
+    assert tile_index.resolutions == [0.5]
+
+    # Unchanged tiles are not read again
+    assert not TileIndex.from_vrt(vrt_path).update(tile_paths)
+
+    tile_index.write_vrt(vrt_path)
+    mosaic = hrt.Raster(vrt_path)
+    assert mosaic.shape == raster.shape
+    assert mosaic.get_array().sum() == raster.get_array().sum()
+
+    # Windows inside one tile are read from the tile, others through the vrt
+    assert mosaic.tile_index is not None
+    assert tile_index.read_window(metadata=mosaic.metadata, window=[90, 0, 40, 40]) is not None
+    assert tile_index.read_window(metadata=mosaic.metadata, window=[60, 0, 40, 40]) is None
+    for window in [[90, 0, 40, 40], [60, 0, 40, 40]]:
+        block = hrt.RasterBlocks(window=window, raster_paths_dict={"depth": mosaic}, mask_keys=[])
+        assert (block.blocks["depth"] == raster._read_array(window=window)).all()
+
+
+def test_tile_index_mixed_nodata():
+    """Tiles with another nodata are not written by write_vrt, gdal.BuildVRT is used.
+    Windows read from a tile get the nodata of the vrt.
+    """
+    tiles_dir = TEMP_DIR / f"tiles_{hrt.get_uuid()}"
+    tiles_dir.mkdir()
+    raster = hrt.Raster(TEST_DIRECTORY / r"depth_test.tif")
+
+    tile_paths = []
+    for i, window in enumerate([[0, 0, 80, 160], [80, 0, 80, 160]]):
+        tile_path = tiles_dir / f"tile_{i}.tif"
+        gdal.Translate(str(tile_path), str(raster.path), srcWin=window)
+        tile_paths.append(tile_path)
+
+    # Right tile has nodata -1
+    gdal_src = gdal.Open(str(tile_paths[1]), gdal.GA_Update)
+    band = gdal_src.GetRasterBand(1)
+    array = band.ReadAsArray()
+    array[array == raster.nodata] = -1
+    band.WriteArray(array)
+    band.SetNoDataValue(-1)
+    band = gdal_src = None
+
+    vrt = hrt.Raster(tiles_dir / "mosaic.vrt")
+    tile_index = TileIndex.from_vrt(vrt.path)
+    tile_index.update(tile_paths)
+    with pytest.raises(ValueError, match="nodata"):
+        tile_index.write_vrt(vrt.path)
+    with pytest.raises(ValueError, match="nodata"):
+        vrt.build_vrt(overwrite=True, bounds=None, input_files=tile_paths, from_index=True)
+
+    vrt.build_vrt(overwrite=True, bounds=None, input_files=tile_paths)
+    assert vrt.shape == raster.shape
+    assert vrt.nodata == raster.nodata
+
+    window = [90, 0, 40, 40]
+    expected = raster._read_array(window=window)
+    assert (expected == raster.nodata).any()
+    array = vrt.tile_index.read_window(metadata=vrt.metadata, window=window, nodata=vrt.nodata)
+    assert (array == expected).all()
+
+    block = hrt.RasterBlocks(window=window, raster_paths_dict={"depth": vrt}, nodata_keys=["depth"], mask_keys=[])
+    assert (block.masks["depth"] == (expected == raster.nodata)).all()
+
+
+# %%
+if __name__ == "__main__":
+    test_tile_index()
+    test_tile_index_mixed_nodata()
@@ -0,0 +1,90 @@
+# %%
+import types
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+
+import hhnk_research_tools as hrt
+from hhnk_research_tools.threedi.timeseries import export_timeseries
+from tests_hrt.config import TEMP_DIR
+
+
+class FakeNodes:
+    """Nodes of a threedigrid result with the filters used by export_timeseries."""
+
+    def __init__(self, ids, coordinates, s1, timestamps):
+        self.id = ids
+        self.coordinates = coordinates
+        self.s1 = s1
+        self.timestamps = timestamps
+
+    def _select(self, mask):
+        return FakeNodes(self.id[mask], self.coordinates[:, mask], self.s1[:, mask], self.timestamps)
+
+    def subset(self, name):
+        return self._select(self.id > 1)
+
+    def filter(self, id__in=None, coordinates__in_bbox=None):
+        if id__in is not None:
+            return self._select(np.isin(self.id, id__in))
+        xmin, ymin, xmax, ymax = coordinates__in_bbox
+        x, y = self.coordinates
+        return self._select((x >= xmin) & (x <= xmax) & (y >= ymin) & (y <= ymax))
+
+    def timeseries(self, indexes):
+        return types.SimpleNamespace(s1=self.s1[indexes])
+
+
+def _fake_grid(nr_timesteps=5):
+    """Grid with nodes 1-4 on a diagonal and s1 = 10 * timestep + id."""
+    ids = np.arange(1, 5)
+    timestamps = np.arange(nr_timesteps) * 300.0
+    s1 = np.arange(nr_timesteps)[:, None] * 10.0 + ids[None, :]
+    nodes = FakeNodes(ids, np.array([ids * 10.0, ids * 10.0]), s1, timestamps)
+    return types.SimpleNamespace(nodes=nodes)
+
+
+def test_export_timeseries():
+    """Test the long format output, chunking and the ids and bbox filters"""
+    grid = _fake_grid()
+
+    output_file = export_timeseries(grid, TEMP_DIR / f"s1_{hrt.get_uuid()}.parquet", chunk_size=2)
+    df = pd.read_parquet(output_file)
+    assert list(df.columns) == ["time", "id", "s1"]
+    assert len(df) == 5 * 4
+    assert df["time"].tolist()[:5] == [0, 0, 0, 0, 300]
+    assert df["id"].tolist()[:5] == [1, 2, 3, 4, 1]
+    assert np.array_equal(df["s1"], df["time"] / 300 * 10 + df["id"])
+
+    # Chunks of 2 timesteps are row groups
+    assert pq.ParquetFile(output_file).num_row_groups == 3
+
+    df = pd.read_parquet(export_timeseries(grid, TEMP_DIR / f"s1_{hrt.get_uuid()}.parquet", ids=[2, 4]))
+    assert sorted(df["id"].unique()) == [2, 4]
+
+    df = pd.read_parquet(export_timeseries(grid, TEMP_DIR / f"s1_{hrt.get_uuid()}.parquet", bbox=[15, 15, 35, 35]))
+    assert sorted(df["id"].unique()) == [2, 3]
+
+    df = pd.read_parquet(
+        export_timeseries(grid, TEMP_DIR / f"s1_{hrt.get_uuid()}.parquet", subset="2D_ALL", ids=[1, 2])
+    )
+    assert sorted(df["id"].unique()) == [2]
+
+
+def test_export_timeseries_empty():
+    """Test that an empty selection writes an empty table with the same columns"""
+    for grid, kwargs in [(_fake_grid(), {"ids": [99]}), (_fake_grid(nr_timesteps=0), {})]:
+        output_file = export_timeseries(grid, TEMP_DIR / f"s1_{hrt.get_uuid()}.parquet", **kwargs)
+        assert output_file.exists()
+
+        df = pd.read_parquet(output_file)
+        assert list(df.columns) == ["time", "id", "s1"]
+        assert len(df) == 0
+        assert df["s1"].dtype == np.float64
+
+
+# %%
+if __name__ == "__main__":
+    test_export_timeseries()
+    test_export_timeseries_empty()